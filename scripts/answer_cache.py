@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from scripts.embedding_cache import evict_lru, normalize_text
+from scripts.manifest import hash_text
+
+
+def chunk_version(chunk_id: str, text: str) -> str:
+    """A retrieved chunk as "<id>:<hash of its text>", so re-ingested text changes the key even under the same ID."""
+    return f"{chunk_id}:{hash_text(text)[:12]}"
+
+
+class AnswerCache:
+    """
+    Persistent cache of RAG answers in SQLite.
+
+    Entries are keyed by a hash of (model, prompt template, normalized question, sorted
+    retrieved chunk versions, packed conversation history). A chunk version is its ID plus
+    a hash of its text (see chunk_version), so once a chunk is re-ingested with different
+    content, questions that retrieve it miss and are answered afresh; the old entries are
+    never read again and age out. The history is the text that went into the prompt, so a
+    follow-up question only hits after the same conversation. When the stored answers grow
+    past max_disk_bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_disk_bytes: int = 64 << 20):
+        self.path = path
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, answer TEXT NOT NULL, tokens INTEGER NOT NULL, "
+            "nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM answers").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, template: str, question: str, chunk_versions: List[str], history: str = "") -> str:
+        payload = json.dumps([model, template, normalize_text(question).casefold(), sorted(chunk_versions),
+                              hash_text(history) if history else ""])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns {"answer", "tokens"} for a cached answer, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT answer, tokens FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            self.tokens_saved += row[1]
+            return {"answer": row[0], "tokens": row[1]}
+
+    def put(self, key: str, answer: str, tokens: int):
+        nbytes = len(answer.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute("SELECT nbytes FROM answers WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+                               (key, answer, tokens, nbytes, time.time()))
+            self._disk_bytes += nbytes - (previous[0] if previous else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._disk_bytes = evict_lru(self._conn, "answers", self._disk_bytes, self.max_disk_bytes)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,392 @@
+"""
+Offline benchmark of every pipeline stage on a synthetic corpus.
+
+    python -m scripts.benchmark --out output/benchmark.json --baseline output/benchmark_baseline.json
+
+The corpus is generated from a fixed seed with python-docx and fitz. Each stage runs
+in a fresh worker process, so its peak RSS is measured on its own. Without --model,
+embeddings come from HashingEngine, a deterministic feature-hashing embedder that
+needs no model download; pass a local sentence-transformers model path to benchmark
+real embeddings. Results are written as JSON and, given a baseline, compared
+metric by metric.
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+# +1: higher is better, -1: lower is better; metrics not listed are informational
+METRIC_DIRECTIONS = {
+    "pages_per_second": 1,
+    "tokens_per_second": 1,
+    "texts_per_second": 1,
+    "rows_per_second": 1,
+    "queries_per_second": 1,
+    "latency_p50_ms": -1,
+    "latency_p95_ms": -1,
+    "latency_p99_ms": -1,
+    "peak_rss_mb": -1,
+}
+
+_WORDS = (
+    "analysis cost installed method total value sample data pyramid base research model "
+    "measure result table section system energy water design process structure report "
+    "average variance estimate project material survey factor level rate study the of and "
+    "to in is that for with as by on are from this which be an at or"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text.capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(3, 7)))
+
+
+def generate_corpus(output_dir: str, docx_files: int = 2, pdf_files: int = 2, pages: int = 10,
+                    seed: int = 0) -> Dict[str, Any]:
+    """Writes a reproducible corpus of DOCX and PDF files with headings, paragraphs and tables."""
+    import fitz
+    from docx import Document
+
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+
+    for n in range(docx_files):
+        document = Document()
+        for page in range(pages):
+            document.add_heading(f"Section {page + 1}: {_sentence(rng, 4)}", level=1)
+            for _ in range(3):
+                document.add_paragraph(_paragraph(rng))
+            if page % 3 == 0:
+                table = document.add_table(rows=4, cols=3)
+                for row in table.rows:
+                    for cell in row.cells:
+                        cell.text = _sentence(rng, 2)
+            document.add_page_break()
+        document.save(os.path.join(output_dir, f"synthetic_docx_{n}.docx"))
+
+    for n in range(pdf_files):
+        document = fitz.open()
+        for page_number in range(pages):
+            page = document.new_page()
+            page.insert_text((72, 40), f"Synthetic report {n}", fontsize=8)
+            page.insert_text((72, 90), f"Section {page_number + 1}: {_sentence(rng, 4)}", fontsize=16)
+            box = fitz.Rect(72, 110, 540, 560)
+            page.insert_textbox(box, "\n\n".join(_paragraph(rng) for _ in range(3)), fontsize=10)
+            if page_number % 3 == 0:
+                for row in range(4):
+                    y = 580 + row * 20
+                    page.draw_line((72, y), (540, y))
+                    for col in range(3):
+                        page.insert_text((76 + col * 156, y + 14), _sentence(rng, 2), fontsize=9)
+                for x in (72, 228, 384, 540):
+                    page.draw_line((x, 580), (x, 660))
+                page.draw_line((72, 660), (540, 660))
+            page.insert_text((72, 810), f"Page {page_number + 1}", fontsize=8)
+        document.save(os.path.join(output_dir, f"synthetic_pdf_{n}.pdf"))
+        document.close()
+
+    return {"docx_files": docx_files, "pdf_files": pdf_files, "pages_per_file": pages, "seed": seed}
+
+
+class HashingEngine:
+    """
+    Deterministic feature-hashing embedder with the EmbeddingEngine interface.
+
+    Each word is hashed into one of dimension buckets with a sign; vectors are
+    L2-normalized. It stands in for a real model so the suite runs fully offline.
+    """
+
+    model = None
+
+    def __init__(self, dimension: int = 256):
+        self._dimension = dimension
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self._dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+                embeddings[row, digest % self._dimension] += 1.0 if digest >> 63 else -1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return embeddings / norms
+
+    def close(self):
+        pass
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+
+def _percentiles(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    return {f"latency_p{p}_ms": round(float(np.percentile(values, p)), 3) for p in (50, 95, 99)}
+
+
+def _make_engine(model: str = None):
+    if model is None:
+        return HashingEngine()
+    from scripts.embedding_engine import EmbeddingEngine
+
+    return EmbeddingEngine(model)
+
+
+def _make_manager(workdir: str, model: str, backend: str, shard_by: str = None, lexical: bool = False):
+    from scripts.chromaDB_handler import ChromaDataManager
+
+    return ChromaDataManager(
+        model_path=model or "hashing", collection_name="benchmark", data_path=os.path.join(workdir, "db"),
+        cache_embeddings=False, query_cache_size=0, backend=backend,
+        engine_options={"engine": _make_engine(model)}, shard_by=shard_by, lexical_index=lexical,
+    )
+
+
+def _chunk_texts(workdir: str) -> List[str]:
+    from scripts.utils import iter_records
+
+    chunks_dir = os.path.join(workdir, "chunks")
+    return [record["text"] for name in sorted(os.listdir(chunks_dir))
+            for record in iter_records(os.path.join(chunks_dir, name))]
+
+
+def stage_extract(corpus_dir: str, workdir: str, max_workers: int = 1, docx_engine: str = 'lxml',
+                  **_) -> Dict[str, Any]:
+    import fitz
+    from scripts.ingest import extract_data
+    from scripts.utils import iter_records
+
+    output_dir = os.path.join(workdir, "extracted")
+    start = time.perf_counter()
+    summary = extract_data(corpus_dir, output_dir, max_workers=max_workers, docx_engine=docx_engine)
+    seconds = time.perf_counter() - start
+
+    pages = 0
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".pdf"):
+            with fitz.open(os.path.join(corpus_dir, name)) as document:
+                pages += document.page_count
+        else:
+            stem = os.path.splitext(name)[0]
+            records = iter_records(os.path.join(output_dir, stem + ".jsonl"))
+            pages += max(((r.get("position") or {}).get("page_number") or 1 for r in records), default=0)
+    return {"files": len(summary["processed"]), "failed": len(summary["failed"]), "pages": pages,
+            "seconds": round(seconds, 4), "pages_per_second": round(pages / seconds, 2)}
+
+
+def stage_chunk(corpus_dir: str, workdir: str, tokenizer: str = None, max_tokens: int = 500, **_) -> Dict[str, Any]:
+    from scripts.chunkingAlgorithm import HierarchicalChunker
+    from scripts.ingest import process_directory
+
+    model = None
+    if tokenizer:
+        import tiktoken
+
+        model = tiktoken.get_encoding(tokenizer)  # must already be in the local tiktoken cache
+    chunker = HierarchicalChunker(max_tokens=max_tokens, model=model)
+    start = time.perf_counter()
+    process_directory(os.path.join(workdir, "extracted"), os.path.join(workdir, "chunks"), chunker)
+    seconds = time.perf_counter() - start
+
+    texts = _chunk_texts(workdir)
+    tokens = sum(chunker.counter.count_many(texts))
+    return {"chunks": len(texts), "tokens": tokens, "seconds": round(seconds, 4),
+            "tokens_per_second": round(tokens / seconds, 2)}
+
+
+def stage_embed(corpus_dir: str, workdir: str, model: str = None, **_) -> Dict[str, Any]:
+    texts = _chunk_texts(workdir)
+    engine = _make_engine(model)
+    engine.encode(texts[:8])  # warm-up
+    start = time.perf_counter()
+    engine.encode(texts)
+    seconds = time.perf_counter() - start
+    engine.close()
+    return {"texts": len(texts), "seconds": round(seconds, 4), "texts_per_second": round(len(texts) / seconds, 2)}
+
+
+def stage_load(corpus_dir: str, workdir: str, model: str = None, backend: str = 'chroma',
+               batch_size: int = 256, shard_by: str = None, search_mode: str = 'vector', **_) -> Dict[str, Any]:
+    from scripts.bulk_loader import BulkLoader
+    from scripts.utils import iter_records
+
+    manager = _make_manager(workdir, model, backend, shard_by, lexical=search_mode != 'vector')
+    loader = BulkLoader(manager, batch_size=batch_size)
+    chunks_dir = os.path.join(workdir, "chunks")
+    rows = 0
+    start = time.perf_counter()
+    for name in sorted(os.listdir(chunks_dir)):
+        report = loader.load(iter_records(os.path.join(chunks_dir, name)), file_id=os.path.splitext(name)[0])
+        if not report["success"]:
+            raise RuntimeError(report["error"])
+        rows += report["rows"]
+    seconds = time.perf_counter() - start
+    return {"rows": rows, "seconds": round(seconds, 4), "rows_per_second": round(rows / seconds, 2)}
+
+
+def stage_query(corpus_dir: str, workdir: str, model: str = None, backend: str = 'chroma',
+                queries: int = 200, n_results: int = 5, seed: int = 0, shard_by: str = None,
+                search_mode: str = 'vector', **_) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    texts = _chunk_texts(workdir)
+    sample = [" ".join(rng.choice(texts).split()[:12]) for _ in range(queries)]
+
+    start = time.perf_counter()
+    manager = _make_manager(workdir, model, backend, shard_by, lexical=search_mode != 'vector')
+    open_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in sample:
+        start = time.perf_counter()
+        manager.search_many([query], n_results=n_results, mode=search_mode)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    manager.search_many(sample, n_results=n_results, mode=search_mode)
+    batch_seconds = time.perf_counter() - start
+    return {"queries": queries, "open_seconds": round(open_seconds, 4), **_percentiles(latencies),
+            "queries_per_second": round(queries / sum(latencies), 2),
+            "batched_queries_per_second": round(queries / batch_seconds, 2)}
+
+
+STAGES: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "extract": stage_extract,
+    "chunk": stage_chunk,
+    "embed": stage_embed,
+    "load": stage_load,
+    "query": stage_query,
+}
+
+
+def _run_stage(name: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    with contextlib.redirect_stdout(io.StringIO()):  # keep the stages' progress prints out of the report
+        result = STAGES[name](**options)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    return result
+
+
+def run_benchmarks(workdir: str, stages: List[str] = None, corpus_options: Dict[str, Any] = None,
+                   **options) -> Dict[str, Any]:
+    """Generates the corpus in workdir and runs each stage in its own process; returns the results."""
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    corpus_dir = os.path.join(workdir, "corpus")
+    corpus = generate_corpus(corpus_dir, **(corpus_options or {}))
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "corpus": corpus,
+            "options": options,
+        },
+        "stages": {},
+    }
+    for name in stages or list(STAGES):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            results["stages"][name] = pool.submit(
+                _run_stage, name, {"corpus_dir": corpus_dir, "workdir": workdir, **options}
+            ).result()
+        print(f"{name}: {results['stages'][name]}")
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.10) -> List[Dict[str, Any]]:
+    """Lists the metrics that are worse than the baseline by more than tolerance (a fraction)."""
+    regressions = []
+    for stage, metrics in results["stages"].items():
+        for metric, value in metrics.items():
+            direction = METRIC_DIRECTIONS.get(metric)
+            previous = baseline.get("stages", {}).get(stage, {}).get(metric)
+            if direction is None or not previous:
+                continue
+            change = (value - previous) / previous
+            if change * direction < -tolerance:
+                regressions.append({"stage": stage, "metric": metric, "baseline": previous,
+                                    "value": value, "change": round(change, 4)})
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    from scripts.config import OUTPUT_PATH
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on a synthetic corpus.")
+    parser.add_argument("--workdir", default=os.path.join(OUTPUT_PATH, "benchmark"))
+    parser.add_argument("--out", default=os.path.join(OUTPUT_PATH, "benchmark.json"))
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES))
+    parser.add_argument("--docx-files", type=int, default=2)
+    parser.add_argument("--pdf-files", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--model", help="local sentence-transformers model; default is the hashing embedder")
+    parser.add_argument("--tokenizer", help="tiktoken encoding name, e.g. cl100k_base; default counts words")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "mmap"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--shard-by", choices=["file_source", "hash"], help="split the collection into shards")
+    parser.add_argument("--search-mode", default="vector", choices=["vector", "lexical", "prefilter", "hybrid"],
+                        help="search mode of the query stage; the others build a BM25 index while loading")
+    parser.add_argument("--docx-engine", default="lxml", choices=["lxml", "python-docx"])
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.workdir, args.stages,
+        corpus_options={"docx_files": args.docx_files, "pdf_files": args.pdf_files,
+                        "pages": args.pages, "seed": args.seed},
+        model=args.model, tokenizer=args.tokenizer, backend=args.backend, queries=args.queries, seed=args.seed,
+        docx_engine=args.docx_engine, shard_by=args.shard_by, search_mode=args.search_mode,
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.out}")
+
+    if args.baseline and args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['stage']}.{r['metric']}: {r['baseline']} -> {r['value']} ({r['change']:+.1%})")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
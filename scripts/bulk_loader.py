@@ -0,0 +1,223 @@
+import hashlib
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from scripts.manifest import make_chunk_id
+from scripts.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+META_COLS = ('chunk_number', 'file_source')
+# Added by ingest.dedup_directory; stored by default whenever a record has them
+DEDUP_META_COLS = ('duplicate_sources', 'duplicate_count')
+
+
+class LoadJournal:
+    """
+    Append-only JSON Lines record of the batches a bulk load has written.
+
+    Each line holds the load ID, the batch number and a digest of the batch's chunk IDs.
+    Since chunk IDs are derived from content, a batch is only treated as done on resume
+    if it still contains exactly the same chunks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def completed(self, load_id: str) -> Set[tuple]:
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by a crash
+                if entry.get("load_id") == load_id:
+                    done.add((entry["batch"], entry["digest"]))
+        return done
+
+    def record(self, load_id: str, batch: int, digest: str, rows: int):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"load_id": load_id, "batch": batch, "digest": digest, "rows": rows}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def reset(self, load_id: str):
+        """Forgets every batch of a load, so the next run writes all of them again."""
+        if not os.path.exists(self.path):
+            return
+        with self._lock:
+            kept = []
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        if json.loads(line).get("load_id") == load_id:
+                            continue
+                    except ValueError:
+                        continue
+                    kept.append(line)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.writelines(kept)
+
+
+def _batch_digest(ids: List[str]) -> str:
+    return hashlib.sha1("\n".join(ids).encode("utf-8")).hexdigest()
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    """Blocks until there is room in the queue (backpressure) unless the load is stopped."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _rows(source) -> Iterator[tuple]:
+    """Yields (position, record) pairs; DataFrames keep their index as the position."""
+    if hasattr(source, "iterrows") and hasattr(source, "to_dict"):
+        for index, record in zip(source.index, source.to_dict(orient='records')):
+            yield index, record
+    else:
+        yield from enumerate(source)
+
+
+def _metadata(record: Dict[str, Any], meta_cols: List[str] = None) -> Dict[str, Any]:
+    if meta_cols:
+        return {col: record[col] for col in meta_cols}
+    metadata = {col: record[col] for col in META_COLS}
+    metadata.update((col, record[col]) for col in DEDUP_META_COLS if col in record)
+    return metadata
+
+
+def iter_batches(source, file_id: str, batch_size: int = 256, doc_col: str = 'text',
+                 meta_cols: List[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Numbered batches of a DataFrame or iterable of chunk dicts, with the IDs, documents and metadata to store.
+
+    Without meta_cols, the metadata is chunk_number, file_source and the dedup fields
+    of the records that carry them.
+    """
+    rows = _rows(source)
+    for batch_num in itertools.count(1):
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return
+        documents = [record[doc_col] for _, record in batch]
+        # chunk_number (when present) keeps IDs stable when earlier chunks are dropped by dedup
+        ids = [make_chunk_id(file_id, record.get("chunk_number", position), text)
+               for (position, record), text in zip(batch, documents)]
+        yield {
+            "batch": batch_num,
+            "ids": ids,
+            "documents": documents,
+            "metadatas": [_metadata(record, meta_cols) for _, record in batch],
+        }
+
+
+class BulkLoader:
+    """
+    Pipelined, resumable loader into a ChromaDataManager collection.
+
+    A background thread builds and embeds batch N+1 while the calling thread writes
+    batch N; a bounded queue between them applies backpressure, so at most queue_size
+    embedded batches wait in memory. Sources can be pandas DataFrames or any iterable
+    of chunk dicts. With a journal_path, every written batch is journaled and a
+    re-run of the same load skips the batches that are already in the collection.
+    """
+
+    def __init__(self, data_manager, batch_size: int = 256, queue_size: int = 2,
+                 journal_path: str = None, doc_col: str = 'text', meta_cols: List[str] = None):
+        self.data_manager = data_manager
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.journal = LoadJournal(journal_path) if journal_path else None
+        self.doc_col = doc_col
+        self.meta_cols = meta_cols
+
+    def _batches(self, source, file_id: str) -> Iterator[Dict[str, Any]]:
+        return iter_batches(source, file_id, self.batch_size, self.doc_col, self.meta_cols)
+
+    def _produce(self, source, file_id: str, skip: Set[tuple], out: queue.Queue, stop: threading.Event):
+        try:
+            for batch in self._batches(source, file_id):
+                if stop.is_set():
+                    return
+                batch["digest"] = _batch_digest(batch["ids"])
+                if (batch["batch"], batch["digest"]) in skip:
+                    batch["skipped"] = True
+                else:
+                    batch["embeddings"] = list(self.data_manager.embedding_function.embed(batch["documents"]))
+                if not _put(out, batch, stop):
+                    return
+        except Exception as e:
+            _put(out, e, stop)
+        _put(out, _DONE, stop)
+
+    def load(self, source: Iterable[Dict[str, Any]], file_id: str = "", load_id: str = None) -> Dict[str, Any]:
+        """
+        Loads a DataFrame or iterable of chunk dicts and returns a report.
+
+        The report holds the chunk IDs of the load, how many batches were written and
+        skipped, the elapsed time, and on failure the failing batch and its error.
+        Batches are upserted, so loading the same data twice never duplicates it.
+        """
+        load_id = load_id or file_id
+        skip = self.journal.completed(load_id) if self.journal else set()
+        batches: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._produce, args=(source, file_id, skip, batches, stop), daemon=True)
+        report = {"ids": [], "rows": 0, "written": 0, "skipped": 0, "failed_batch": None, "error": None}
+        start_time = time.perf_counter()
+        producer.start()
+
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, Exception):
+                    report["error"] = f"{type(batch).__name__}: {batch}"
+                    break
+                report["ids"].extend(batch["ids"])
+                report["rows"] += len(batch["ids"])
+                if batch.get("skipped"):
+                    report["skipped"] += 1
+                    METRICS.inc("batches_total", status="skipped")
+                    continue
+
+                success = self.data_manager.upsert_documents(
+                    documents=batch["documents"],
+                    metadatas=batch["metadatas"],
+                    ids=batch["ids"],
+                    embeddings=batch["embeddings"],
+                )
+                if not success:
+                    report["failed_batch"] = batch["batch"]
+                    report["error"] = f"Batch {batch['batch']} failed"
+                    break
+                if self.journal:
+                    self.journal.record(load_id, batch["batch"], batch["digest"], len(batch["ids"]))
+                report["written"] += 1
+                METRICS.inc("batches_total", status="written")
+                logger.info(f"Batch {batch['batch']} added successfully.")
+        finally:
+            stop.set()
+            producer.join()
+
+        report["seconds"] = time.perf_counter() - start_time
+        METRICS.add_time("stage_seconds", report["seconds"], stage="load")
+        report["success"] = report["error"] is None
+        return report
@@ -1,107 +1,485 @@
+import hashlib
+import itertools
 import json
+import logging
 import os
+import re
+import shutil
+import time
+import numpy as np
 import pandas as pd
-import torch
-from typing import List, Dict
-from sentence_transformers import SentenceTransformer
 from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
 from typing import List, Dict, Any
 
+from scripts.embedding_cache import EmbeddingCache
+from scripts.embedding_engine import EmbeddingEngine
+from scripts.metrics import METRICS, profiled
+from scripts.query_cache import QueryResultCache
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ('vector', 'lexical', 'prefilter', 'hybrid')
+# Reciprocal rank fusion constant: a match at rank r adds 1 / (RRF_K + r) to its hybrid score
+RRF_K = 60
+
 # Define the custom embedding function
 class CustomEmbeddingFunction(EmbeddingFunction):
-    def __init__(self, model_name: str, device: str = 'cpu'):
-        self.model = SentenceTransformer(model_name, device=device, trust_remote_code=True)
+    def __init__(self, model_name: str, device: str = 'cpu', cache: EmbeddingCache = None,
+                 engine: EmbeddingEngine = None, **engine_options):
+        self.engine = engine or EmbeddingEngine(model_name, device=device, **engine_options)
+        self.model = self.engine.model
+        self.cache = cache
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embeds texts into a float32 matrix, encoding only the texts missing from the cache."""
+        if self.cache is None:
+            return self._encode(texts)
+
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        METRICS.inc("embeddings_total", len(texts) - len(missing), source="cache")
+        if missing:
+            encoded = self._encode(missing)
+            self.cache.put_many(missing, encoded)
+            positions = {text: i for i, text in enumerate(missing)}
+            vectors = [encoded[positions[text]] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return np.vstack(vectors) if vectors else np.zeros((0, self.engine.dimension), dtype=np.float32)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        with METRICS.time("stage_seconds", stage="embed"):
+            encoded = self.engine.encode(texts)
+        METRICS.inc("embeddings_total", len(texts), source="model")
+        return encoded
 
     def __call__(self, texts: Documents) -> Embeddings:
         if not isinstance(texts, list):
             texts = [texts]
-        embeddings = self.model.encode(texts, convert_to_numpy=True)
-        return embeddings.tolist()
+        # Row views of the matrix; avoids converting every float to a Python object
+        return list(self.embed(texts))
+
+class SearchResults:
+    """
+    Columnar results of a batch of queries.
+
+    Matches of all queries are stored back to back in flat arrays; the matches of
+    query i are the slice offsets[i]:offsets[i + 1]. Scores are cosine similarities
+    for vector and prefilter searches, BM25 scores for lexical searches and reciprocal
+    rank fusion scores for hybrid searches.
+    Documents and metadata stay as the lists chroma returned, and a DataFrame is
+    only built when to_df() is called.
+    """
+
+    def __init__(self, queries: List[str], ids: np.ndarray, scores: np.ndarray, offsets: np.ndarray,
+                 documents: List[str] = None, metadatas: List[dict] = None):
+        self.queries = queries
+        self.ids = ids
+        self.scores = scores
+        self.offsets = offsets
+        self.documents = documents
+        self.metadatas = metadatas
+
+    @classmethod
+    def from_chroma(cls, results, queries: List[str] = None) -> "SearchResults":
+        """Flattens a chroma query result (one list per query) into columns."""
+        per_query_ids = results.get("ids") or []
+        counts = [len(ids) for ids in per_query_ids]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        def flatten(key):
+            columns = results.get(key)
+            if columns is None:
+                return None
+            return list(itertools.chain.from_iterable(columns))
+
+        ids = np.array(flatten("ids"), dtype=object)
+        distances = flatten("distances")
+        scores = 1 - np.asarray(distances, dtype=np.float32) if distances is not None \
+            else np.full(len(ids), np.nan, dtype=np.float32)
+        return cls(queries if queries is not None else [None] * len(counts),
+                   ids, scores, offsets, flatten("documents"), flatten("metadatas"))
+
+    @classmethod
+    def of(cls, query: str, ids: List[str], scores, documents: List[str] = None,
+           metadatas: List[dict] = None) -> "SearchResults":
+        """The results of a single query."""
+        return cls([query], np.array(ids, dtype=object), np.asarray(scores, dtype=np.float32),
+                   np.array([0, len(ids)], dtype=np.int64), documents, metadatas)
+
+    @classmethod
+    def from_lexical(cls, results, queries: List[str]) -> "SearchResults":
+        """Flattens a BM25Index.query result (one list per query) into columns."""
+        counts = [len(ids) for ids in results["ids"]]
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        flatten = lambda key: list(itertools.chain.from_iterable(results[key])) if results[key] is not None else None
+        return cls(queries, np.array(flatten("ids"), dtype=object), np.array(flatten("scores"), dtype=np.float32),
+                   offsets, flatten("documents"), flatten("metadatas"))
+
+    @classmethod
+    def concat(cls, parts: List["SearchResults"]) -> "SearchResults":
+        """Joins the results of several query batches, in order."""
+        counts = [part.offsets[1:] - part.offsets[:-1] for part in parts]
+        offsets = np.zeros(sum(len(c) for c in counts) + 1, dtype=np.int64)
+        if len(offsets) > 1:
+            np.cumsum(np.concatenate(counts), out=offsets[1:])
+
+        def join(attr):
+            columns = [getattr(part, attr) for part in parts]
+            if any(column is None for column in columns):
+                return None
+            return list(itertools.chain.from_iterable(columns))
+
+        return cls(
+            join("queries"),
+            np.concatenate([part.ids for part in parts]) if parts else np.array([], dtype=object),
+            np.concatenate([part.scores for part in parts]) if parts else np.array([], dtype=np.float32),
+            offsets, join("documents"), join("metadatas"),
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def query_index(self) -> np.ndarray:
+        """Position of the query each match belongs to."""
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def __getitem__(self, i: int) -> "SearchResults":
+        """The results of query i alone; arrays are views, not copies."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return SearchResults(
+            [self.queries[i]], self.ids[start:end], self.scores[start:end],
+            np.array([0, end - start], dtype=np.int64),
+            self.documents[start:end] if self.documents is not None else None,
+            self.metadatas[start:end] if self.metadatas is not None else None,
+        )
+
+    def to_df(self, include_query: bool = True) -> pd.DataFrame:
+        """Builds a DataFrame with ID, Score, Text and one column per metadata field."""
+        columns = {}
+        if include_query:
+            columns["Query"] = np.asarray(self.queries, dtype=object)[self.query_index()]
+        columns["ID"] = self.ids
+        columns["Score"] = self.scores
+        if self.documents is not None:
+            columns["Text"] = self.documents
+        df = pd.DataFrame(columns)
+        if self.metadatas:
+            meta = pd.DataFrame.from_records([m or {} for m in self.metadatas])
+            df = pd.concat([df, meta.drop(columns=[c for c in meta.columns if c in df.columns])], axis=1)
+        return df
+
 
 # Define ChromaDataManager to abstract vector store interactions
 class ChromaDataManager:
-    def __init__(self, model_path: str, collection_name: str, data_path: str, device: str = 'cpu'):
+    def __init__(self, model_path: str, collection_name: str, data_path: str, device: str = 'cpu',
+                 cache_embeddings: bool = True, embedding_cache_bytes: int = 1 << 30,
+                 engine_options: dict = None, query_cache_size: int = 1024, query_cache_ttl: float = 300.0,
+                 backend: str = 'chroma', backend_options: dict = None, shard_by=None, num_shards: int = 8,
+                 shard_route=None, shard_workers: int = None, lexical_index: bool = False,
+                 lexical_options: dict = None, lexical_candidates: int = 100):
+        """
+        shard_by splits the collection into independently indexed shards (see
+        ShardedCollection): 'file_source', 'hash' (num_shards shards by ID) or a callable
+        (id, metadata) -> shard key, with shard_route(where) -> the shard keys a filter can
+        match. Searches fan out to the shards on shard_workers threads.
+
+        lexical_index keeps a BM25 index (see BM25Index) next to the collection, updated
+        by every write, and enables the lexical, prefilter and hybrid search modes.
+        lexical_candidates is how many BM25 matches a prefilter search re-ranks, and how
+        deep both rankings go in a hybrid search.
+        """
         self.device = device
-        self.embedding_function = CustomEmbeddingFunction(model_path, device=device)
+        self.model_path = model_path
+        engine_options = engine_options or {}
+        output_options = {name: engine_options[name] for name, default in EmbeddingEngine.OUTPUT_OPTIONS.items()
+                          if engine_options.get(name, default) != default}
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(data_path, "embedding_cache.sqlite"), model_path, max_disk_bytes=embedding_cache_bytes,
+            options=output_options,
+        ) if cache_embeddings else None
+        self.embedding_function = CustomEmbeddingFunction(
+            model_path, device=device, cache=self.embedding_cache, **engine_options
+        )
         self.collection_name = collection_name
         self.data_path = data_path
+        # Bumped by every write; cached query results from an older version are never served
+        self.version = 0
+        self.query_cache = QueryResultCache(query_cache_size, query_cache_ttl) if query_cache_size else None
+        self.lexical_candidates = lexical_candidates
+        self.lexical_index = None
+        if lexical_index:
+            from scripts.lexical_index import BM25Index
+
+            self.lexical_index = BM25Index(os.path.join(data_path, "bm25", f"{backend}-{collection_name}"),
+                                           **(lexical_options or {}))
+
+        if backend == 'mmap':
+            # Memory-mapped exact-search collection; same API as a chroma collection
+            from scripts.vector_backends import MmapCollection
+            self.client = None
 
-        # Initialize ChromaDB client
-        import chromadb  # Avoid global dependency
-        self.client = chromadb.PersistentClient(path=os.path.join(data_path, "chromadb"))
+            def open_collection(name):
+                return MmapCollection(os.path.join(data_path, "mmap", name),
+                                      embedding_function=self.embedding_function, **(backend_options or {}))
 
-        # Create or get the collection with embedding function
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=self.embedding_function,
-            metadata={"hnsw:space": "cosine"}
+            def drop_collection(name):
+                shutil.rmtree(os.path.join(data_path, "mmap", name), ignore_errors=True)
+        elif backend == 'chroma':
+            # Initialize ChromaDB client
+            import chromadb  # Avoid global dependency
+            self.client = chromadb.PersistentClient(path=os.path.join(data_path, "chromadb"))
+
+            # Create or get the collection with embedding function
+            def open_collection(name):
+                return self.client.get_or_create_collection(
+                    name=name,
+                    embedding_function=self.embedding_function,
+                    metadata={"hnsw:space": "cosine"}
+                )
+
+            def drop_collection(name):
+                self.client.delete_collection(name=name)
+        else:
+            raise ValueError(f"Unknown backend {backend!r}; expected 'chroma' or 'mmap'")
+
+        self.shard_by = shard_by
+        if shard_by is None:
+            self.collection = open_collection(collection_name)
+            return
+        from scripts.vector_backends import ShardedCollection
+        self.collection = ShardedCollection(
+            lambda key: open_collection(self._shard_collection_name(key)),
+            registry_path=os.path.join(data_path, "shards", f"{backend}-{collection_name}.json"),
+            shard_by=shard_by, num_shards=num_shards, route=shard_route,
+            drop_shard=lambda key: drop_collection(self._shard_collection_name(key)),
+            embedding_function=self.embedding_function, max_workers=shard_workers,
         )
 
-    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str]):
-        """Adds documents and metadata to the collection."""
+    def _shard_collection_name(self, key: str) -> str:
+        """A valid, stable collection name per shard key: readable prefix plus a hash of the key."""
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "_", key)[:32]
+        return f"{self.collection_name}-{slug}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:8]}"
+
+    def shard_keys(self) -> List[str]:
+        return self.collection.shard_keys() if self.shard_by else []
+
+    def drop_shard(self, key: str) -> bool:
+        """
+        Deletes one shard, leaving the others untouched. To rebuild it, forget its files
+        in the manifest (manifest.remove("embed", file)) and upload them again.
+        """
+        try:
+            if self.lexical_index is not None:
+                shard = self.collection.shard(key)
+                if shard is not None:
+                    self.lexical_index.delete(ids=shard.get(include=[])["ids"])
+            return self.collection.drop_shard(key)
+        finally:
+            self.version += 1
+
+    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str], embeddings=None):
+        """Adds documents and metadata to the collection; precomputed embeddings skip the embedding step."""
         try:
-            self.collection.add(documents=documents, metadatas=metadatas, ids=ids)
+            self.collection.add(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+            if self.lexical_index is not None:
+                self.lexical_index.add(ids, documents, metadatas)
+            METRICS.inc("documents_written_total", len(ids), op="add")
             return True
         except Exception as e:
-            print(f"Error adding documents: {e}")
+            logger.error(f"Error adding documents: {e}")
             return False
+        finally:
+            self.version += 1
+
+    def upsert_documents(self, documents: List[str], metadatas: List[dict], ids: List[str], embeddings=None):
+        """Adds documents, overwriting any existing entries with the same IDs."""
+        try:
+            self.collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+            if self.lexical_index is not None:
+                self.lexical_index.upsert(ids, documents, metadatas)
+            METRICS.inc("documents_written_total", len(ids), op="upsert")
+            return True
+        except Exception as e:
+            logger.error(f"Error upserting documents: {e}")
+            return False
+        finally:
+            self.version += 1
+
+    def delete_documents(self, ids: List[str] = None, where: dict = None):
+        """Deletes documents by ID and/or metadata filter."""
+        if not ids and not where:
+            return True
+        try:
+            self.collection.delete(ids=ids or None, where=where)
+            if self.lexical_index is not None:
+                self.lexical_index.delete(ids=ids or None, where=where)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting documents: {e}")
+            return False
+        finally:
+            self.version += 1
+
+    def _vector_search(self, queries: List[str], n_results: int, where: dict, include_documents: bool,
+                       embeddings: np.ndarray = None) -> SearchResults:
+        include = ["metadatas", "distances"] + (["documents"] if include_documents else [])
+        if embeddings is None:
+            embeddings = self.embedding_function.embed(queries)
+        return SearchResults.from_chroma(self.collection.query(
+            query_embeddings=list(embeddings), n_results=n_results, where=where, include=include
+        ), queries)
+
+    def _lexical_search(self, queries: List[str], n_results: int, where: dict,
+                        include_documents: bool) -> SearchResults:
+        include = ["metadatas"] + (["documents"] if include_documents else [])
+        return SearchResults.from_lexical(
+            self.lexical_index.query(queries, n_results, where=where, include=include), queries
+        )
 
-    def search_vector_store(self, query: str, n_results: int = 10):
+    def _prefilter_search(self, queries: List[str], n_results: int, where: dict,
+                          include_documents: bool) -> SearchResults:
+        """
+        Re-ranks the top lexical_candidates BM25 matches of each query by cosine similarity,
+        using the vectors stored in the collection. Queries that match no term fall back
+        to a full vector search.
+        """
+        candidates = self.lexical_index.query(queries, self.lexical_candidates, where=where, include=[])["ids"]
+        embeddings = self.embedding_function.embed(queries)
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+
+        union = list(dict.fromkeys(_id for ids in candidates for _id in ids))
+        stored = self.collection.get(
+            ids=union, include=["embeddings", "metadatas"] + (["documents"] if include_documents else [])
+        ) if union else {"ids": []}
+        row_of = {_id: row for row, _id in enumerate(stored["ids"])}
+        if row_of:
+            vectors = np.asarray(stored["embeddings"], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        parts = []
+        for i, query in enumerate(queries):
+            rows = np.array([row_of[_id] for _id in candidates[i] if _id in row_of], dtype=np.int64)
+            if not len(rows):
+                parts.append(self._vector_search([query], n_results, where, include_documents, embeddings[i:i + 1]))
+                continue
+            scores = vectors[rows] @ embeddings[i]
+            order = np.argsort(-scores, kind='stable')[:n_results]
+            top = rows[order].tolist()
+            parts.append(SearchResults.of(
+                query, [stored["ids"][row] for row in top], scores[order],
+                [stored["documents"][row] for row in top] if include_documents else None,
+                [stored["metadatas"][row] for row in top],
+            ))
+        return SearchResults.concat(parts)
+
+    def _hybrid_search(self, queries: List[str], n_results: int, where: dict,
+                       include_documents: bool) -> SearchResults:
+        """Fuses the top lexical_candidates BM25 and vector matches with reciprocal rank fusion."""
+        depth = max(n_results, self.lexical_candidates)
+        rankings = (self._lexical_search(queries, depth, where, include_documents),
+                    self._vector_search(queries, depth, where, include_documents))
+        parts = []
+        for i, query in enumerate(queries):
+            fused: Dict[str, list] = {}
+            for ranking in (results[i] for results in rankings):
+                for rank, _id in enumerate(ranking.ids):
+                    entry = fused.setdefault(_id, [0.0, ranking.documents[rank] if include_documents else None,
+                                                   ranking.metadatas[rank]])
+                    entry[0] += 1 / (RRF_K + rank + 1)
+            top = sorted(fused.items(), key=lambda item: -item[1][0])[:n_results]
+            parts.append(SearchResults.of(
+                query, [_id for _id, _ in top], [entry[0] for _, entry in top],
+                [entry[1] for _, entry in top] if include_documents else None, [entry[2] for _, entry in top],
+            ))
+        return SearchResults.concat(parts)
+
+    @profiled()
+    def search_many(self, queries: List[str], n_results: int = 10, where: dict = None,
+                    include_documents: bool = True, mode: str = 'vector') -> SearchResults:
+        """
+        Retrieves the top n matches for every query with a single embedding batch and a
+        single collection query. where filters on metadata, e.g. {"file_source": "a.pdf"}.
+
+        mode needs the lexical index for anything but 'vector':
+        - 'vector': nearest neighbours of the query embedding.
+        - 'lexical': BM25 matches only; the embedding model is not used at all, which
+          suits exact terms such as part numbers, names and table values.
+        - 'prefilter': the best BM25 matches, re-ranked by vector similarity.
+        - 'hybrid': BM25 and vector rankings fused by reciprocal rank.
+
+        Results of repeated queries are served from the query cache until the collection
+        is written to or the entries expire.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}; expected one of {SEARCH_MODES}")
+        if mode != 'vector' and self.lexical_index is None:
+            raise ValueError(f"Search mode {mode!r} needs a lexical index (lexical_index=True)")
+        queries = list(queries)
+        version = self.version
+        call_start = time.perf_counter()
+        keys = [QueryResultCache.key(q, n_results, where, documents=include_documents, mode=mode) for q in queries]
+        cached = [self.query_cache.get(key, version) if self.query_cache else None for key in keys]
+        missing = list(dict.fromkeys(q for q, hit in zip(queries, cached) if hit is None))
+        METRICS.inc("queries_total", len(queries))
+        if not missing:
+            METRICS.observe("search_latency_seconds", time.perf_counter() - call_start, cache="hit", mode=mode)
+            return SearchResults.concat(cached)
+
+        start_time = time.perf_counter()
+        search = {
+            'vector': self._vector_search,
+            'lexical': self._lexical_search,
+            'prefilter': self._prefilter_search,
+            'hybrid': self._hybrid_search,
+        }[mode]
+        results = search(missing, n_results, where, include_documents)
+        end_time = time.perf_counter()
+        METRICS.observe("search_latency_seconds", end_time - call_start, cache="miss", mode=mode)
+        if len(missing) == len(queries) and not self.query_cache:
+            return results
+
+        cost = (end_time - start_time) / len(missing)
+        fresh = {}
+        for i, query in enumerate(missing):
+            fresh[query] = results[i]
+            if self.query_cache:
+                self.query_cache.put(
+                    QueryResultCache.key(query, n_results, where, documents=include_documents, mode=mode),
+                    version, fresh[query], cost
+                )
+        return SearchResults.concat([hit if hit is not None else fresh[q] for q, hit in zip(queries, cached)])
+
+    def search_vector_store(self, query: str, n_results: int = 10, where: dict = None, mode: str = 'vector'):
         """Retrieves the top n matches based on the query description and returns as a DataFrame."""
         try:
-            results = self.collection.query(query_texts=[query], n_results=n_results)
-            return self.format_search_results_as_df(results)
+            return self.search_many([query], n_results=n_results, where=where, mode=mode).to_df(include_query=False)
         except Exception as e:
-            print(f"Error searching vector store: {e}")
+            logger.error(f"Error searching vector store: {e}")
             return None
 
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit rates of the query result cache and the embedding cache."""
+        return {
+            "query": self.query_cache.stats() if self.query_cache else {},
+            "embedding": self.embedding_cache.stats() if self.embedding_cache else {},
+            "lexical": self.lexical_index.stats() if self.lexical_index else {},
+        }
+
     def format_search_results_as_df(self, results):
         """Converts the query results into a pandas DataFrame."""
         if not results or "ids" not in results:
             return pd.DataFrame()
-
-        data = []
-        for idx, _id in enumerate(results["ids"][0]):
-            row = {
-                "ID": _id,
-                "Score": 1 - results["distances"][0][idx],
-                "Text": results["documents"][0][idx]
-            }
-            row.update(results["metadatas"][0][idx])  # Add metadata fields dynamically
-            data.append(row)
-
-        return pd.DataFrame(data)
+        return SearchResults.from_chroma(results)[0].to_df(include_query=False)
     
 
-import uuid
-import time
-import pandas as pd
 # Function to add data in batches
-def add_to_chroma_batched(data_manager, data_df, doc_col, meta_cols, batch_size=1000, file_id=""):
-    total_rows = len(data_df)
-    num_batches = (total_rows + batch_size - 1) // batch_size
-    start_time = time.perf_counter()
-
-    for batch_num, i in enumerate(range(0, total_rows, batch_size)):
-        print(f"Processing batch {batch_num + 1}/{num_batches}")
-        batch_df = data_df.iloc[i:min(i + batch_size, total_rows)]
-        batch_ids = [
-                f"{file_id}_{idx}_{str(uuid.uuid4())[:8]}"
-                for idx in batch_df.index
-            ]
-        try:
-            success = data_manager.add_documents(
-                documents=batch_df[doc_col].tolist(),
-                metadatas=batch_df[meta_cols].to_dict(orient='records'),
-                ids=batch_ids
-            )
-            if success:
-                print(f"Batch {batch_num + 1} added successfully.")
-            else:
-                print(f"Batch {batch_num + 1} failed.")
-            
-        except Exception as e:
-            print(f"Error in batch {batch_num + 1}: {e}")
-            return False
+def add_to_chroma_batched(data_manager, data_df, doc_col, meta_cols, batch_size=1000, file_id="", journal_path=None):
+    from scripts.bulk_loader import BulkLoader
 
-    return True
+    loader = BulkLoader(data_manager, batch_size=batch_size, journal_path=journal_path,
+                        doc_col=doc_col, meta_cols=meta_cols)
+    report = loader.load(data_df, file_id=file_id)
+    if not report["success"]:
+        logger.error(f"Error in batch {report['failed_batch']}: {report['error']}")
+    return report["success"]
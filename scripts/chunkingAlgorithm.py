@@ -1,120 +1,262 @@
 
 
+import itertools
 import uuid
-from typing import List, Dict, Any
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Iterator
+
+from scripts.document import AnyItem, Item, TableItem, as_items
+from scripts.metrics import METRICS, profiled
+
+
+class TokenCounter:
+    """
+    Counts tokens for the chunker, encoding each distinct text at most once.
+
+    Texts are encoded in bulk with the tokenizer's batch encoder when it has one
+    (tiktoken's encode_ordinary_batch/encode_batch) and the counts are kept in an LRU
+    cache. Without a tokenizer, whitespace-separated words are counted instead.
+    """
+
+    def __init__(self, model=None, cache_size: int = 100_000):
+        self.model = model
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def _encode(self, text: str) -> List[Any]:
+        if self.model is not None:
+            try:
+                if hasattr(self.model, "encode_ordinary"):
+                    return self.model.encode_ordinary(text)
+                return self.model.encode(text)
+            except Exception:
+                pass
+        return text.split()
+
+    def _encode_batch(self, texts: List[str]) -> List[List[Any]]:
+        if self.model is not None:
+            batch_encode = getattr(self.model, "encode_ordinary_batch", None) or getattr(self.model, "encode_batch", None)
+            if batch_encode is not None:
+                try:
+                    return batch_encode(texts)
+                except Exception:
+                    pass
+        return [self._encode(text) for text in texts]
+
+    def _remember(self, text: str, count: int):
+        self._cache[text] = count
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        count = self._cache.get(text)
+        if count is None:
+            count = len(self._encode(text))
+            self._remember(text, count)
+        else:
+            self._cache.move_to_end(text)
+        return count
+
+    def count_many(self, texts: List[str]) -> List[int]:
+        """Counts a batch of texts, encoding all uncached ones in a single batch call."""
+        missing = list(dict.fromkeys(t for t in texts if t and t not in self._cache))
+        if missing:
+            for text, tokens in zip(missing, self._encode_batch(missing)):
+                self._remember(text, len(tokens))
+        return [self.count(text) for text in texts]
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """
+        Splits text into consecutive pieces of at most max_tokens tokens each.
+
+        Cuts fall on exact token boundaries of the original text; every piece is
+        re-counted and the cut moved back if needed, so the budget always holds.
+        """
+        tokens = self._encode(text)
+        if len(tokens) <= max_tokens:
+            return [text]
+
+        if self.model is not None and hasattr(self.model, "decode_with_offsets") and tokens and not isinstance(tokens[0], str):
+            _, offsets = self.model.decode_with_offsets(tokens)
+            bounds = list(offsets) + [len(text)]
+            piece_at = lambda start, end: text[bounds[start]:bounds[end]]
+        elif self.model is not None and hasattr(self.model, "decode") and tokens and not isinstance(tokens[0], str):
+            piece_at = lambda start, end: self.model.decode(tokens[start:end])
+        else:
+            words = text.split()
+            return [" ".join(words[i:i + max_tokens]) for i in range(0, len(words), max_tokens)]
+
+        pieces = []
+        start = 0
+        while start < len(tokens):
+            end = min(start + max_tokens, len(tokens))
+            piece = piece_at(start, end)
+            while end - start > 1 and self.count(piece) > max_tokens:
+                end -= 1
+                piece = piece_at(start, end)
+            if piece.strip():
+                pieces.append(piece)
+            start = end
+        return pieces
+
+
+def row_text(row) -> str:
+    return " | ".join(cell.text for cell in row)
+
+
+def item_text(item: AnyItem) -> str:
+    """Plain text of an extracted item; structured tables are flattened row by row."""
+    if isinstance(item, TableItem):
+        return "\n".join(row_text(row) for row in item.content)
+    if isinstance(item, dict):
+        if item["type"] == "Table" and "content" in item:
+            return "\n".join(" | ".join(cell.get("text", "") for cell in row) for row in item["content"])
+        return item.get("text", "")
+    return item.text
+
 
 class HierarchicalChunker:
-    def __init__(self, max_tokens=500, model=None):
+    def __init__(self, max_tokens=500, model=None, batch_size: int = 256):
         self.max_tokens = max_tokens
         self.model = model
+        self.batch_size = batch_size
+        self.counter = TokenCounter(model)
+
+    @profiled()
+    def chunk(self, structured_data: Iterable[AnyItem]) -> List[Dict[str, Any]]:
+        return list(self.iter_chunks(structured_data))
 
-    def chunk(self, structured_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        chunks = []
+    def iter_chunks(self, structured_data: Iterable[AnyItem]) -> Iterator[Dict[str, Any]]:
+        """
+        Yields chunks as soon as they are complete, consuming items lazily from any iterable.
+
+        Items are token-counted batch_size at a time with a single batch encode. The
+        extractors' Item/TableItem objects are placed in the chunks' content as they are;
+        record dicts read from files are converted with from_dict first.
+        """
         current_chunk = []
         current_tokens = 0
+        items = as_items(structured_data)
+
+        while True:
+            batch = list(itertools.islice(items, self.batch_size))
+            if not batch:
+                break
+            with METRICS.time("stage_seconds", stage="chunk"):
+                counts = self.counter.count_many([self._item_text(item) for item in batch])
 
-        def add_chunk():
-            nonlocal current_chunk, current_tokens
-            if current_chunk:
-                chunks.append(self._create_chunk(current_chunk))
-                current_chunk = []
-                current_tokens = 0
+            for item, tokens in zip(batch, counts):
+                if tokens > self.max_tokens:
+                    # Fallback: Break large item into pieces that each fit the budget,
+                    # after the pending chunk so chunks stay in document order
+                    if current_chunk:
+                        yield self._create_chunk(current_chunk, current_tokens)
+                        current_chunk = []
+                        current_tokens = 0
+                    if isinstance(item, Item):
+                        for piece in self._split_text(item.text):
+                            yield self._create_chunk([Item(item.type, piece, item.section_index, item.page_number)])
+                    else:
+                        for part in self._split_table(item):
+                            yield self._create_chunk([part])
+                elif current_tokens + tokens > self.max_tokens:
+                    if current_chunk:
+                        yield self._create_chunk(current_chunk, current_tokens)
+                    current_chunk = [item]
+                    current_tokens = tokens
+                else:
+                    current_chunk.append(item)
+                    current_tokens += tokens
 
-        for item in structured_data:
-            item_text = self._item_text(item)
-            tokens = self._count_tokens(item_text)
+        if current_chunk:
+            yield self._create_chunk(current_chunk, current_tokens)
 
+    def _split_text(self, text: str) -> List[str]:
+        """Groups ". "-separated sentences up to the budget, cutting oversized sentences at token offsets."""
+        sentences = []
+        for sentence, tokens in zip(text.split(". "), self.counter.count_many(text.split(". "))):
             if tokens > self.max_tokens:
-                # Fallback: Break large item into smaller parts line-by-line
-                if item["type"] == "Paragraph" and "text" in item:
-                    lines = item["text"].split(". ")
-                    sub_chunk = []
-                    sub_tokens = 0
-                    for line in lines:
-                        line_tokens = self._count_tokens(line)
-                        if sub_tokens + line_tokens > self.max_tokens:
-                            if sub_chunk:
-                                chunks.append(self._create_chunk([{
-                                    "type": "Paragraph",
-                                    "text": ". ".join(sub_chunk),
-                                    "position": item.get("position", {})
-                                }]))
-                                sub_chunk = []
-                                sub_tokens = 0
-                        sub_chunk.append(line)
-                        sub_tokens += line_tokens
-                    if sub_chunk:
-                        chunks.append(self._create_chunk([{
-                            "type": "Paragraph",
-                            "text": ". ".join(sub_chunk),
-                            "position": item.get("position", {})
-                        }]))
-                else:
-                    add_chunk()
-                    chunks.append(self._create_chunk([item]))
-            elif current_tokens + tokens > self.max_tokens:
-                add_chunk()
-                current_chunk.append(item)
-                current_tokens = tokens
+                sentences.extend(self.counter.split(sentence, self.max_tokens))
             else:
-                current_chunk.append(item)
-                current_tokens += tokens
+                sentences.append(sentence)
 
-        if current_chunk:
-            chunks.append(self._create_chunk(current_chunk))
+        pieces = []
+        group = []
+        group_tokens = 0
+        separator_tokens = self.counter.count(". ")
+        for sentence, tokens in zip(sentences, self.counter.count_many(sentences)):
+            if group and group_tokens + separator_tokens + tokens > self.max_tokens:
+                pieces.append(". ".join(group))
+                group = []
+                group_tokens = 0
+            group.append(sentence)
+            group_tokens += tokens + (separator_tokens if len(group) > 1 else 0)
+        if group:
+            pieces.append(". ".join(group))
 
-        return chunks
+        # Token counts are not strictly additive across a join; re-check each piece.
+        checked = []
+        for piece, tokens in zip(pieces, self.counter.count_many(pieces)):
+            checked.extend(self.counter.split(piece, self.max_tokens) if tokens > self.max_tokens else [piece])
+        return checked
+
+    def _split_table(self, item: TableItem) -> List[AnyItem]:
+        """Splits a structured table into row groups that fit the budget, counting the line breaks between rows."""
+        parts = []
+        rows = []
+        rows_tokens = 0
+        separator_tokens = self.counter.count("\n")
+        row_texts = [row_text(row) for row in item.content]
+        for row, text, tokens in zip(item.content, row_texts, self.counter.count_many(row_texts)):
+            if tokens > self.max_tokens:
+                # A single row over budget is kept as plain text pieces
+                parts.extend(Item("Table", piece, item.section_index, item.page_number)
+                             for piece in self.counter.split(text, self.max_tokens))
+                continue
+            if rows and rows_tokens + separator_tokens + tokens > self.max_tokens:
+                parts.append(TableItem(rows, item.section_index, item.page_number))
+                rows = []
+                rows_tokens = 0
+            rows_tokens += tokens + (separator_tokens if rows else 0)
+            rows.append(row)
+        if rows:
+            parts.append(TableItem(rows, item.section_index, item.page_number))
+
+        # Token counts are not strictly additive across a join; re-check each group.
+        checked = []
+        while parts:
+            part = parts.pop(0)
+            if isinstance(part, TableItem) and len(part.content) > 1 \
+                    and self.counter.count(item_text(part)) > self.max_tokens:
+                half = len(part.content) // 2
+                parts[:0] = [TableItem(part.content[:half], item.section_index, item.page_number),
+                             TableItem(part.content[half:], item.section_index, item.page_number)]
+            else:
+                checked.append(part)
+        return checked
 
     def _count_tokens(self, text: str) -> int:
-        if not text:
-            return 0
-        if self.model:
-            try:
-                return len(self.model.encode(text))
-            except Exception:
-                pass
-        return len(text.split())
-
-    def _create_chunk(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
-        # Flatten and extract page numbers from nested 'position'
-        page_numbers = sorted(set(
-            item.get("position", {}).get("page_number")
-            for item in items
-            if "position" in item and item["position"].get("page_number") is not None
-        ))
-
-        # Add page_number to each item as a top-level field
-        enriched_items = []
-        for item in items:
-            item_copy = dict(item)  # Avoid modifying the original
-            item_copy["page_number"] = item.get("position", {}).get("page_number")
-            enriched_items.append(item_copy)
+        return self.counter.count(text)
 
+    def _create_chunk(self, items: List[AnyItem], tokens: int = None) -> Dict[str, Any]:
+        # Items are referenced, not copied; each carries its own page_number
+        page_numbers = sorted({item.page_number for item in items if item.page_number is not None})
+        if tokens is None:
+            tokens = sum(self._count_tokens(self._item_text(item)) for item in items)
+        METRICS.inc("chunks_total")
+        METRICS.inc("tokens_total", tokens, stage="chunk")
         return {
             "id": str(uuid.uuid4()),
-            "content": enriched_items,
-            "tokens": sum(self._count_tokens(self._item_text(item)) for item in enriched_items),
+            "content": items,
+            "tokens": tokens,
             "page_numbers": page_numbers
         }
 
-    def _item_text(self, item: Dict[str, Any]) -> str:
-        if item["type"] == "Table":
-            rows = []
-            for row in item["content"]:
-                row_text = " | ".join(cell.get("text", "") for cell in row)
-                rows.append(row_text)
-            return "\n".join(rows)
-        return item.get("text", "")
+    def _item_text(self, item: AnyItem) -> str:
+        return item_text(item)
 
-def merge_text(content: List[Dict[str, Any]]) -> str:
-    merged = []
-    for item in content:
-        if item["type"] == "Table":
-            rows = []
-            for row in item["content"]:
-                row_text = " | ".join(cell.get("text", "") for cell in row)
-                rows.append(row_text)
-            merged.append("\n".join(rows))
-        else:
-            merged.append(item.get("text", ""))
+def merge_text(content: List[AnyItem]) -> str:
+    merged = [item_text(item) for item in content]
     return "\n\n".join([m for m in merged if m.strip()])
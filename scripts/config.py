@@ -1,10 +1,17 @@
 import os
-import sys
-os.chdir('..')
 
-DATA_PATH = os.path.join(os.getcwd(), "data")
-OUTPUT_PATH = os.path.join(os.getcwd(), "output")
+# Paths are resolved from this file, so importing the config works from any working directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATA_PATH = os.path.join(PROJECT_ROOT, "data")
+OUTPUT_PATH = os.path.join(PROJECT_ROOT, "output")
 EXTRACTED_DATA_PATH = os.path.join(OUTPUT_PATH, "extracted")
 CHUNKS_PATH = os.path.join(OUTPUT_PATH, "chunks")
+DEDUP_PATH = os.path.join(OUTPUT_PATH, "deduped")
 TRANSLATED_PATH = os.path.join(OUTPUT_PATH, "translated")
-
+MANIFEST_PATH = os.path.join(OUTPUT_PATH, "manifest.json")
+LOAD_JOURNAL_PATH = os.path.join(OUTPUT_PATH, "load_journal.jsonl")
+SEARCH_DAEMON_ADDRESS = os.environ.get("SEARCH_DAEMON_ADDRESS", "127.0.0.1:8765")
+TRANSLATION_CACHE_PATH = os.path.join(OUTPUT_PATH, "translation_cache.sqlite")
+ANSWER_CACHE_PATH = os.path.join(OUTPUT_PATH, "answer_cache.sqlite")
+METRICS_PATH = os.path.join(OUTPUT_PATH, "metrics.json")
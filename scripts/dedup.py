@@ -0,0 +1,107 @@
+import hashlib
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional
+
+import numpy as np
+
+from scripts.embedding_cache import normalize_text
+
+_SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_SHIFT = np.uint64(32)
+
+
+class MinHasher:
+    """
+    MinHash signatures of word shingles.
+
+    Each text is lowercased and whitespace-normalized and every word is hashed once
+    with CRC32; the hashes of each run of shingle_size words are combined into a 64-bit
+    shingle hash with numpy, so no shingle strings are built. Each of the num_perm
+    permutations is a multiply-shift hash (a*h + b) >> 32 with a random odd a, and the
+    signature keeps its minimum over the shingles. The fraction of equal positions in
+    two signatures estimates the Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 1 << 63, size=(num_perm, 1), dtype=np.uint64)
+
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        words = normalize_text(text).lower().split()
+        hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+        width = max(len(words) - self.shingle_size + 1, 1)  # short texts are one shingle
+        shingles = np.zeros(width, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for offset in range(min(self.shingle_size, len(words))):
+                shingles = shingles * _SHINGLE_MULTIPLIER + hashes[offset:offset + width]
+        return np.unique(shingles)
+
+    def signature(self, text: str) -> np.ndarray:
+        with np.errstate(over="ignore"):
+            permuted = (self._a * self.shingle_hashes(text) + self._b) >> _SHIFT
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class ChunkDeduplicator:
+    """
+    Finds exact and near-duplicate chunks, keeping the first one seen as canonical.
+
+    Exact duplicates are found by a SHA-1 of the normalized text. Near duplicates are
+    found through MinHash/LSH: signatures are cut into bands of rows_per_band values,
+    chunks sharing any band are candidates, and a candidate counts as a duplicate when
+    the estimated Jaccard similarity of their word shingles is at least threshold.
+    With the default 16 bands of 8 rows, pairs at 0.8 similarity become candidates
+    95% of the time and pairs below 0.5 almost never.
+
+    Only canonical chunks are indexed, so memory grows with the number of distinct
+    chunks (num_perm * 4 bytes for each signature), not with the corpus size.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, rows_per_band: int = 8,
+                 shingle_size: int = 3, seed: int = 1):
+        if num_perm % rows_per_band:
+            raise ValueError("num_perm must be a multiple of rows_per_band")
+        self.threshold = threshold
+        self.rows_per_band = rows_per_band
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self._exact: Dict[str, Hashable] = {}
+        self._signatures: Dict[Hashable, np.ndarray] = {}
+        self._bands = [defaultdict(list) for _ in range(num_perm // rows_per_band)]
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i:i + self.rows_per_band].tobytes()
+                for i in range(0, len(signature), self.rows_per_band)]
+
+    def add(self, key: Hashable, text: str) -> Optional[Dict[str, Hashable]]:
+        """
+        Checks a chunk against the chunks added so far.
+
+        Returns None when it is new (it becomes canonical and is indexed), otherwise
+        {"canonical": key of the matching chunk, "kind": "exact" or "near"}.
+        """
+        digest = hashlib.sha1(normalize_text(text).lower().encode("utf-8")).hexdigest()
+        canonical = self._exact.get(digest)
+        if canonical is not None:
+            return {"canonical": canonical, "kind": "exact"}
+
+        signature = self.hasher.signature(text)
+        band_keys = self._band_keys(signature)
+        seen = set()
+        for band, band_key in zip(self._bands, band_keys):
+            for candidate in band.get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if np.count_nonzero(self._signatures[candidate] == signature) >= self.threshold * len(signature):
+                    self._exact[digest] = candidate
+                    return {"canonical": candidate, "kind": "near"}
+
+        self._exact[digest] = key
+        self._signatures[key] = signature
+        for band, band_key in zip(self._bands, band_keys):
+            band[band_key].append(key)
+        return None
@@ -0,0 +1,138 @@
+"""
+Compact in-memory model of extracted items.
+
+Extractors yield Item and TableItem objects rather than one dict per item. Both
+classes use __slots__. Formatting is stored as a bit mask, styles are interned,
+and the position is held as two plain fields. The uuid is only generated when an
+item is serialized. The chunker keeps these objects in its chunks as they are,
+without copying them.
+
+to_dict() and from_dict() convert to and from the JSON schema of the record files,
+at the edges of the pipeline: writing and reading extracted records.
+"""
+import sys
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+BOLD, ITALIC, UNDERLINE = 1, 2, 4
+_FORMAT_FLAGS = (("bold", BOLD), ("italic", ITALIC), ("underline", UNDERLINE))
+
+
+def pack_formatting(formatting: Optional[Dict[str, bool]]) -> Optional[int]:
+    """{"bold": True, ...} -> bit mask; None (no formatting recorded) stays None."""
+    if not formatting:
+        return None
+    return sum(flag for name, flag in _FORMAT_FLAGS if formatting.get(name))
+
+
+def unpack_formatting(flags: Optional[int]) -> Dict[str, bool]:
+    if flags is None:
+        return {}
+    return {name: bool(flags & flag) for name, flag in _FORMAT_FLAGS}
+
+
+class Cell(NamedTuple):
+    text: str
+    row: int
+    col: int
+
+
+@dataclass(slots=True, eq=False)
+class Item:
+    """A paragraph, heading, list entry, header/footer line or text-only table."""
+    type: str
+    text: str
+    section_index: int
+    page_number: int
+    style: Optional[str] = None
+    heading_level: Optional[int] = None
+    formatting: Optional[int] = None
+    list_level: Optional[float] = None
+    id: Optional[str] = None
+
+    @property
+    def position(self) -> Dict[str, int]:
+        return {"section_index": self.section_index, "page_number": self.page_number}
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.id is None:
+            self.id = str(uuid.uuid4())
+        return {
+            "id": self.id,
+            "type": self.type,
+            "text": self.text,
+            "style": self.style,
+            "heading_level": self.heading_level,
+            "formatting": unpack_formatting(self.formatting),
+            "list_level": self.list_level,
+            "position": self.position,
+            "children": []
+        }
+
+
+@dataclass(slots=True, eq=False)
+class TableItem:
+    """A structured table: rows of Cells. Rows may be shared between tables (e.g. repeated headers)."""
+    content: List[List[Cell]]
+    section_index: int
+    page_number: int
+    id: Optional[str] = None
+
+    type = "Table"
+
+    @property
+    def position(self) -> Dict[str, int]:
+        return {"section_index": self.section_index, "page_number": self.page_number}
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.id is None:
+            self.id = str(uuid.uuid4())
+        return {
+            "id": self.id,
+            "type": "Table",
+            "position": self.position,
+            "content": [[cell._asdict() for cell in row] for row in self.content],
+            "children": []
+        }
+
+
+AnyItem = Union[Item, TableItem]
+
+
+def from_dict(record: Dict[str, Any]) -> AnyItem:
+    """Builds an Item or TableItem from a record in the JSON schema; missing fields get defaults."""
+    position = record.get("position") or {}
+    if record.get("type") == "Table" and "content" in record:
+        return TableItem(
+            content=[[Cell(cell.get("text", ""), cell.get("row"), cell.get("col")) for cell in row]
+                     for row in record["content"]],
+            section_index=position.get("section_index"),
+            page_number=position.get("page_number"),
+            id=record.get("id"),
+        )
+    style = record.get("style")
+    return Item(
+        type=sys.intern(record.get("type", "Paragraph")),
+        text=record.get("text", ""),
+        section_index=position.get("section_index"),
+        page_number=position.get("page_number"),
+        style=sys.intern(style) if style else style,
+        heading_level=record.get("heading_level"),
+        formatting=pack_formatting(record.get("formatting")),
+        list_level=record.get("list_level"),
+        id=record.get("id"),
+    )
+
+
+def as_item(item: Union[AnyItem, Dict[str, Any]]) -> AnyItem:
+    return from_dict(item) if isinstance(item, dict) else item
+
+
+def as_items(items: Iterable[Union[AnyItem, Dict[str, Any]]]) -> Iterator[AnyItem]:
+    return map(as_item, items)
+
+
+def to_dicts(items: Iterable[Union[AnyItem, Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """Records for JSON output; dicts pass through unchanged."""
+    return (item if isinstance(item, dict) else item.to_dict() for item in items)
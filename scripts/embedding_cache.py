@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text for cache lookups: Unicode NFC and collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def evict_lru(conn: sqlite3.Connection, table: str, disk_bytes: int, max_disk_bytes: int) -> int:
+    """
+    Deletes the least recently used rows of a cache table with key, nbytes and last_used
+    columns until the stored bytes are at 90% of max_disk_bytes; returns the bytes left.
+    The caller holds its lock and commits.
+    """
+    target = int(max_disk_bytes * 0.9)
+    while disk_bytes > target:
+        rows = conn.execute(f"SELECT key, nbytes FROM {table} ORDER BY last_used LIMIT 1000").fetchall()
+        if not rows:
+            return 0
+        evicted = []
+        for key, nbytes in rows:
+            if disk_bytes <= target:
+                break
+            evicted.append((key,))
+            disk_bytes -= nbytes
+        conn.executemany(f"DELETE FROM {table} WHERE key = ?", evicted)
+    return disk_bytes
+
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed cache of embedding vectors.
+
+    Vectors are keyed by a hash of (model name, options, normalized text), where options
+    are the engine settings that change the vectors it returns (see
+    EmbeddingEngine.OUTPUT_OPTIONS), left out when at their defaults. Hot entries live in
+    an in-memory LRU; every entry is also persisted as float32 bytes in a SQLite file,
+    so embeddings survive process restarts and collection rebuilds. When the on-disk
+    store grows past max_disk_bytes the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, model_name: str, memory_items: int = 10_000,
+                 max_disk_bytes: int = 1 << 30, options: dict = None):
+        self.path = path
+        self.model_name = model_name
+        self.options = options or {}
+        self._prefix = model_name + ("\0" + json.dumps(self.options, sort_keys=True) if self.options else "")
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self._prefix}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Returns the cached vector for each text, or None where there is none."""
+        keys = [self.key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    found[key] = self._memory[key]
+                    self._memory.move_to_end(key)
+
+            missing = list(dict.fromkeys(k for k in keys if k not in found))
+            from_disk = {}
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    from_disk[key] = np.frombuffer(blob, dtype=np.float32)
+            if from_disk:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in from_disk])
+                self._conn.commit()
+                for key, vector in from_disk.items():
+                    self._remember(key, vector)
+                found.update(from_disk)
+
+            results = []
+            for key in keys:
+                vector = found.get(key)
+                if vector is None:
+                    self.misses += 1
+                elif key in from_disk:
+                    self.hits_disk += 1
+                else:
+                    self.hits_memory += 1
+                results.append(vector)
+        return results
+
+    def put_many(self, texts: List[str], vectors) -> None:
+        """Stores vectors for texts in both tiers, evicting old disk entries if over budget."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.key(text)
+                vector = np.asarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                blob = vector.tobytes()
+                rows.append((key, blob, len(blob), now))
+            previous = 0
+            for i in range(0, len(rows), 500):
+                batch = [row[0] for row in rows[i:i + 500]]
+                previous += self._conn.execute(
+                    f"SELECT COALESCE(SUM(nbytes), 0) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._disk_bytes += sum(row[2] for row in {row[0]: row for row in rows}.values()) - previous
+            if self._disk_bytes > self.max_disk_bytes:
+                self._disk_bytes = evict_lru(self._conn, "embeddings", self._disk_bytes, self.max_disk_bytes)
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
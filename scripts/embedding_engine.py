@@ -0,0 +1,103 @@
+import os
+from typing import List
+
+import numpy as np
+
+
+class EmbeddingEngine:
+    """
+    CPU-oriented wrapper around SentenceTransformer.encode.
+
+    - Texts are sorted by length once for the whole input and cut into batches of at
+      most batch_size texts and max_batch_chars characters, so short and long chunks
+      are not padded together and long texts get smaller batches.
+    - With num_workers > 1 the batches are spread over a pool of worker processes,
+      each holding its own copy of the model and its own share of the CPU threads.
+    - num_threads caps torch's intra-op threads in this process.
+    - Results come back as one float32 NumPy matrix in input order.
+    """
+
+    # Options that change the vectors rather than how fast they are computed, with their
+    # defaults; EmbeddingCache keys on the ones that are set to something else
+    OUTPUT_OPTIONS = {"normalize_embeddings": False}
+
+    def __init__(self, model_name: str, device: str = 'cpu', batch_size: int = 32,
+                 max_batch_chars: int = 32_000, num_workers: int = 0, num_threads: int = None,
+                 normalize_embeddings: bool = False):
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.normalize_embeddings = normalize_embeddings
+        from sentence_transformers import SentenceTransformer  # Heavy; only load when a model is needed
+
+        self.model = SentenceTransformer(model_name, device=device, trust_remote_code=True)
+        self.pool = None
+        if num_workers and num_workers > 1:
+            self.pool = self._start_pool(num_workers, num_threads)
+
+    def _start_pool(self, num_workers: int, num_threads: int = None):
+        # Workers are spawned and read OMP_NUM_THREADS at torch import; split the cores
+        # between them instead of letting every worker use all of them.
+        threads = num_threads or max(1, (os.cpu_count() or 1) // num_workers)
+        previous = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+        try:
+            return self.model.start_multi_process_pool(target_devices=['cpu'] * num_workers)
+        finally:
+            if previous is None:
+                os.environ.pop("OMP_NUM_THREADS", None)
+            else:
+                os.environ["OMP_NUM_THREADS"] = previous
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _batches(self, order: np.ndarray, lengths: List[int]) -> List[np.ndarray]:
+        """Cuts length-sorted indices into batches bounded by count and padded character volume."""
+        batches = []
+        start = 0
+        for end in range(1, len(order) + 1):
+            # Sorted ascending, so the last text is the longest and sets the padded width
+            padded_chars = (end - start) * lengths[order[end - 1]]
+            if end - start > self.batch_size or (padded_chars > self.max_batch_chars and end - start > 1):
+                batches.append(order[start:end - 1])
+                start = end - 1
+        if start < len(order):
+            batches.append(order[start:])
+        return batches
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes texts into a (len(texts), dimension) float32 matrix."""
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        lengths = [len(text) for text in texts]
+        order = np.argsort(lengths, kind='stable')
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+
+        if self.pool is not None:
+            sorted_texts = [texts[i] for i in order]
+            encoded = self.model.encode_multi_process(
+                sorted_texts, self.pool, batch_size=self.batch_size,
+                chunk_size=max(self.batch_size, len(texts) // (4 * len(self.pool["processes"])) or 1),
+                normalize_embeddings=self.normalize_embeddings,
+            )
+            embeddings[order] = encoded
+            return embeddings
+
+        for batch in self._batches(order, lengths):
+            embeddings[batch] = self.model.encode(
+                [texts[i] for i in batch], batch_size=len(batch), convert_to_numpy=True,
+                normalize_embeddings=self.normalize_embeddings, show_progress_bar=False,
+            )
+        return embeddings
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
@@ -2,23 +2,61 @@ from docx import Document
 from docx.table import Table
 from docx.text.paragraph import Paragraph
 import fitz
+from lxml import etree
 from collections import defaultdict
 from pathlib import Path
-from typing import List, Dict, Any
-import uuid
+from typing import List, Dict, Any, Iterator, Optional
+import contextlib
+import datetime
+import itertools
+import posixpath
+import sys
+import warnings
+import zipfile
+
+from scripts.chunkingAlgorithm import TokenCounter, row_text
+from scripts.document import BOLD, AnyItem, Cell, Item, TableItem, pack_formatting
+from scripts.metrics import METRICS, profiled
+
+SUPPORTED_EXTENSIONS = {'.docx', '.pdf', '.xlsx'}
+DOCX_ENGINES = ('lxml', 'python-docx')
 
 
-def detect_file_type_and_extract_text(file_path):
+def detect_file_type_and_extract_text(file_path, docx_engine: str = 'lxml', xlsx_max_tokens: int = 500):
     ext = Path(file_path).suffix.lower()
     if ext == '.docx':
-        return extract_docx_structure(file_path)
+        return extract_docx_structure(file_path, docx_engine)
     elif ext == '.pdf':
         return extract_pdf_structured_json(file_path)
+    elif ext == '.xlsx':
+        return extract_xlsx_structure(file_path, xlsx_max_tokens)
     # elif ext in ['.png', '.jpg', '.jpeg']:
     #     return extract_from_image(file_path)
     else:
         raise ValueError(f"Unsupported file format: {ext}")
 
+
+def iter_file_structure(file_path, docx_engine: str = 'lxml', xlsx_max_tokens: int = 500, xlsx_model=None,
+                        **pdf_options) -> Iterator[AnyItem]:
+    """
+    Streaming counterpart of detect_file_type_and_extract_text: yields items one at a time,
+    as Item/TableItem objects (see scripts.document; to_dicts converts them to records).
+
+    Spreadsheet rows are grouped into tables of at most xlsx_max_tokens tokens, counted
+    with the xlsx_model tokenizer (words when None).
+    """
+    ext = Path(file_path).suffix.lower()
+    if ext == '.docx':
+        items = iter_docx_structure(file_path, docx_engine)
+    elif ext == '.pdf':
+        items = iter_pdf_structured_json(file_path, **pdf_options)
+    elif ext == '.xlsx':
+        items = iter_xlsx_structure(file_path, xlsx_max_tokens, xlsx_model)
+    else:
+        raise ValueError(f"Unsupported file format: {ext}")
+    METRICS.inc("extracted_files_total", type=ext[1:])
+    return METRICS.timed_iter(items, "stage_seconds", count="items_total", stage="extract", type=ext[1:])
+
 # def iter_block_items(parent):
 #     """Yield paragraphs and tables in document order."""
 #     for child in parent.element.body.iterchildren():
@@ -33,24 +71,66 @@ from docx import Document
 from docx.table import Table
 from docx.text.paragraph import Paragraph
 from typing import List, Dict, Any
-import uuid
 
-def extract_docx_structure(filepath: str) -> List[Dict[str, Any]]:
+def detect_heading_level(style_name: str) -> int:
+    if style_name.startswith("Heading"):
+        try:
+            return int(style_name.split(" ")[1])
+        except:
+            return 0
+    return 0
+
+
+def is_list_style(style_name: str) -> bool:
+    return any(kw in style_name.lower() for kw in ['list', 'bullet', 'number'])
+
+
+def build_structured_obj(
+    obj_type: str,
+    text: str,
+    section_index: int,
+    page_number: int,
+    style: str = None,
+    heading_level: int = None,
+    formatting: Dict[str, bool] = None,
+    list_level: int = None
+) -> Item:
+    return Item(
+        type=obj_type,
+        text=text,
+        section_index=section_index,
+        page_number=page_number,
+        style=sys.intern(style) if style else style,
+        heading_level=heading_level,
+        formatting=pack_formatting(formatting),
+        list_level=list_level
+    )
+
+
+@profiled()
+def extract_docx_structure(filepath: str, engine: str = 'lxml') -> List[AnyItem]:
+    return list(iter_docx_structure(filepath, engine))
+
+
+def iter_docx_structure(filepath: str, engine: str = 'lxml') -> Iterator[AnyItem]:
+    """
+    Yields the structured items of a DOCX file.
+
+    engine 'lxml' streams word/document.xml with iterparse and takes page numbers from
+    the page breaks Word stored (see iter_docx_structure_xml); 'python-docx' walks the
+    python-docx object model and estimates pages at 20 paragraphs per page.
+    """
+    if engine == 'lxml':
+        return iter_docx_structure_xml(filepath)
+    elif engine == 'python-docx':
+        return iter_docx_structure_docx(filepath)
+    raise ValueError(f"Unknown DOCX engine: {engine}")
+
+
+def iter_docx_structure_docx(filepath: str) -> Iterator[AnyItem]:
     document = Document(filepath)
-    hierarchy = []
     paragraphs_per_page = 20  # heuristic
 
-    def detect_heading_level(style_name: str) -> int:
-        if style_name.startswith("Heading"):
-            try:
-                return int(style_name.split(" ")[1])
-            except:
-                return 0
-        return 0
-
-    def is_list_style(style_name: str) -> bool:
-        return any(kw in style_name.lower() for kw in ['list', 'bullet', 'number'])
-
     def get_list_indent_level(para) -> int:
         try:
             return para.paragraph_format.left_indent.pt if para.paragraph_format.left_indent else 0
@@ -65,31 +145,6 @@ def extract_docx_structure(filepath: str) -> List[Dict[str, Any]]:
             formatting["underline"] |= run.underline or False
         return formatting
 
-    def build_structured_obj(
-        obj_type: str,
-        text: str,
-        section_index: int,
-        page_number: int,
-        style: str = None,
-        heading_level: int = None,
-        formatting: Dict[str, bool] = None,
-        list_level: int = None
-    ) -> Dict[str, Any]:
-        return {
-            "id": str(uuid.uuid4()),
-            "type": obj_type,
-            "text": text,
-            "style": style,
-            "heading_level": heading_level,
-            "formatting": formatting or {},
-            "list_level": list_level,
-            "position": {
-                "section_index": section_index,
-                "page_number": page_number
-            },
-            "children": []
-        }
-
     def iter_block_items(parent):
         for child in parent.element.body.iterchildren():
             if child.tag.endswith('tbl'):
@@ -102,23 +157,10 @@ def extract_docx_structure(filepath: str) -> List[Dict[str, Any]]:
         for i, row in enumerate(table.rows):
             row_data = []
             for j, cell in enumerate(row.cells):
-                row_data.append({
-                    'text': cell.text.strip(),
-                    'row': i,
-                    'col': j
-                })
+                row_data.append(Cell(cell.text.strip(), i, j))
             table_data.append(row_data)
 
-        return {
-            'id': str(uuid.uuid4()),
-            'type': 'Table',
-            'position': {
-                'section_index': section_index,
-                'page_number': page_number
-            },
-            'content': table_data,
-            'children': []
-        }
+        return TableItem(table_data, section_index, page_number)
 
     def parse_paragraph(para, section_index, page_number):
         text = para.text.strip()
@@ -152,25 +194,25 @@ def extract_docx_structure(filepath: str) -> List[Dict[str, Any]]:
                 for para in section.header.paragraphs:
                     text = para.text.strip()
                     if text:
-                        hierarchy.append(build_structured_obj(
+                        yield build_structured_obj(
                             obj_type="Header",
                             text=text,
                             section_index=i,
                             page_number=1
-                        ))
+                        )
             if section.footer:
                 for para in section.footer.paragraphs:
                     text = para.text.strip()
                     if text:
-                        hierarchy.append(build_structured_obj(
+                        yield build_structured_obj(
                             obj_type="Footer",
                             text=text,
                             section_index=i,
                             page_number=-1
-                        ))
+                        )
 
     # --- main execution ---
-    extract_headers_and_footers()
+    yield from extract_headers_and_footers()
     section_index = 0
     paragraph_counter = 0
 
@@ -180,150 +222,662 @@ def extract_docx_structure(filepath: str) -> List[Dict[str, Any]]:
         if block['type'] == 'paragraph':
             parsed = parse_paragraph(block['item'], section_index, estimated_page)
             if parsed:
-                hierarchy.append(parsed)
+                yield parsed
                 paragraph_counter += 1
 
         elif block['type'] == 'table':
-            hierarchy.append(parse_table(block['item'], section_index, estimated_page))
+            yield parse_table(block['item'], section_index, estimated_page)
 
         section_index += 1
 
-    return hierarchy
+    METRICS.inc("pages_total", max(paragraph_counter - 1, 0) // paragraphs_per_page + 1, type="docx")
+
+
+# --- DOCX: streaming lxml engine ---
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_R_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_PKG_RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_OFF_VALUES = ('0', 'false', 'off')
+# styles.xml names that python-docx reports under a different UI name
+_UI_STYLE_NAMES = {"caption": "Caption", "footer": "Footer", "header": "Header",
+                   **{f"heading {level}": f"Heading {level}" for level in range(1, 10)}}
+_EMU_PER_UNIT = {"mm": 36000, "cm": 360000, "in": 914400, "pt": 12700, "pc": 152400, "pi": 152400}
+
+
+def _docx_rels(archive: zipfile.ZipFile, part: str) -> List[Dict[str, str]]:
+    """Relationships of a package part, with internal targets resolved to archive paths."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", name + ".rels")
+    try:
+        root = etree.fromstring(archive.read(rels_path))
+    except KeyError:
+        return []
+    rels = []
+    for rel in root.iterchildren(_PKG_RELS + "Relationship"):
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") != "External":
+            target = target[1:] if target.startswith("/") else posixpath.normpath(posixpath.join(folder, target))
+        rels.append({"id": rel.get("Id"), "type": rel.get("Type", ""), "target": target})
+    return rels
+
+
+def _docx_paragraph_styles(archive: zipfile.ZipFile, styles_part: str):
+    """Maps paragraph style IDs to their UI names (as python-docx reports them); also returns the default style name."""
+    names, default = {}, ''
+    if styles_part is None:
+        return names, default
+    root = etree.fromstring(archive.read(styles_part))
+    for style in root.iterchildren(_W + "style"):
+        if style.get(_W + "type") != "paragraph":
+            continue
+        name = style.find(_W + "name")
+        ui_name = name.get(_W + "val") if name is not None else ''
+        ui_name = _UI_STYLE_NAMES.get(ui_name, ui_name)
+        names[style.get(_W + "styleId")] = ui_name
+        if style.get(_W + "default") in ('1', 'true', 'on'):
+            default = ui_name
+    return names, default
+
+
+def _is_on(element) -> bool:
+    return element is not None and element.get(_W + "val", "true").lower() not in _OFF_VALUES
+
+
+_RUN_TEXT = {_W + "tab": "\t", _W + "ptab": "\t", _W + "cr": "\n", _W + "noBreakHyphen": "-"}
+
+
+def _append_run_text(run, parts: List[str]):
+    for child in run:
+        tag = child.tag
+        if tag == _W + "t":
+            parts.append(child.text or "")
+        elif tag in _RUN_TEXT:
+            parts.append(_RUN_TEXT[tag])
+        elif tag == _W + "br" and child.get(_W + "type", "textWrapping") == "textWrapping":
+            parts.append("\n")
+
+
+def _paragraph_text(p) -> str:
+    """Text of a paragraph as python-docx reads it: direct runs and hyperlink runs."""
+    parts = []
+    for child in p:
+        if child.tag == _W + "r":
+            _append_run_text(child, parts)
+        elif child.tag == _W + "hyperlink":
+            for run in child.iterchildren(_W + "r"):
+                _append_run_text(run, parts)
+    return "".join(parts)
+
+
+def _paragraph_formatting(p) -> Dict[str, bool]:
+    formatting = {"bold": False, "italic": False, "underline": False}
+    for run in p.iterchildren(_W + "r"):
+        rpr = run.find(_W + "rPr")
+        if rpr is None:
+            continue
+        formatting["bold"] |= _is_on(rpr.find(_W + "b"))
+        formatting["italic"] |= _is_on(rpr.find(_W + "i"))
+        underline = rpr.find(_W + "u")
+        formatting["underline"] |= underline is not None and underline.get(_W + "val", "none") != "none"
+    return formatting
+
+
+def _measure_pt(value: str) -> float:
+    """A signed twips measure in points: a twips count, or a number with a unit such as "1.5cm"."""
+    units = value[-2:]
+    if units in _EMU_PER_UNIT:
+        emu = int(round(float(value[:-2]) * _EMU_PER_UNIT[units]))
+    else:
+        emu = int(round(float(value))) * 635
+    return emu / 12700
 
 
-def extract_pdf_structured_json(pdf_path):
-    doc = fitz.open(pdf_path)
-    results = []
-    section_index = 0
+def _paragraph_indent(ppr) -> float:
+    ind = ppr.find(_W + "ind") if ppr is not None else None
+    left = ind.get(_W + "left") if ind is not None else None
+    try:
+        return _measure_pt(left) if left else 0
+    except ValueError:
+        return 0
 
-    top_texts = defaultdict(int)
-    bottom_texts = defaultdict(int)
 
-    # Pass 1: detect common headers/footers
-    for page in doc:
-        height = page.rect.height
-        blocks = page.get_text("dict")["blocks"]
-        for block in blocks:
-            if block["type"] != 0:
+class _PageTracker:
+    """
+    Follows the page breaks Word stored in document.xml.
+
+    w:lastRenderedPageBreak marks where Word's layout broke pages when the file was
+    last saved; w:br w:type="page", w:pageBreakBefore and section breaks are explicit breaks. Word
+    usually also writes a rendered break right after an explicit one, so a rendered
+    break with no text since the last explicit break is not counted again.
+    """
+    _TAGS = (_W + "t", _W + "br", _W + "lastRenderedPageBreak", _W + "pageBreakBefore")
+
+    def __init__(self):
+        self.page = 1
+        self._seen_text = False
+        self._after_break = False
+
+    def advance(self, element) -> int:
+        """Moves past the breaks in element and returns the page its first text is on."""
+        if element.tag != _W + "tbl":
+            page = self._scan(element) or self.page
+            sect_pr = element.find(f"{_W}pPr/{_W}sectPr")
+            if sect_pr is not None:
+                # A paragraph carrying section properties ends its section; every section
+                # type except 'continuous' starts the next one on a new page.
+                sect_type = sect_pr.find(_W + "type")
+                if sect_type is None or sect_type.get(_W + "val") != "continuous":
+                    self._explicit_break()
+            return page
+        # A row split across pages repeats the break in each of its cells: scan every
+        # cell from the row's starting page and continue from the furthest one.
+        first_page = None
+        for tr in element.iterchildren(_W + "tr"):
+            start = (self.page, self._seen_text, self._after_break)
+            ends = []
+            for tc in tr.iterchildren(_W + "tc"):
+                self.page, self._seen_text, self._after_break = start
+                cell_page = self._scan(tc)
+                first_page = first_page or cell_page
+                ends.append((self.page, self._seen_text, self._after_break))
+            self.page, self._seen_text, self._after_break = max(ends, default=start)
+        return first_page or self.page
+
+    def _scan(self, element) -> Optional[int]:
+        first_page = None
+        for node in element.iter(*self._TAGS):
+            tag = node.tag
+            if tag == _W + "t":
+                if node.text:
+                    first_page = first_page or self.page
+                    self._seen_text = True
+                    self._after_break = False
+            elif tag == _W + "lastRenderedPageBreak":
+                if self._seen_text and not self._after_break:
+                    self.page += 1
+                self._after_break = False
+            elif (tag == _W + "br" and node.get(_W + "type") == "page") or \
+                    (tag == _W + "pageBreakBefore" and _is_on(node)):
+                self._explicit_break()
+        return first_page
+
+    def _explicit_break(self):
+        if self._seen_text and not self._after_break:
+            self.page += 1
+            self._after_break = True
+
+
+def _iter_body_blocks(archive: zipfile.ZipFile, part: str, tags) -> Iterator[Any]:
+    """
+    Streams the top-level elements of the document body with the given tags.
+
+    Every block is cleared and dropped once the caller moves on, so memory use stays
+    flat however long the document is.
+    """
+    with archive.open(part) as f:
+        for _, element in etree.iterparse(f, events=("end",), tag=tags, huge_tree=True):
+            parent = element.getparent()
+            if parent is None or parent.tag != _W + "body":
                 continue
-            for line in block["lines"]:
-                y = line["bbox"][1]
-                text = "".join(span["text"] for span in line["spans"]).strip()
-                if not text:
+            yield element
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _docx_sections(archive: zipfile.ZipFile, part: str) -> List[Dict[str, str]]:
+    """Default header and footer relationship IDs of every section, in document order."""
+    sections = []
+    for block in _iter_body_blocks(archive, part, (_W + "p", _W + "tbl", _W + "sectPr")):
+        sect_pr = block if block.tag == _W + "sectPr" else block.find(f"{_W}pPr/{_W}sectPr")
+        if sect_pr is None:
+            continue
+        section = {"header": None, "footer": None}
+        for kind in ("header", "footer"):
+            for ref in sect_pr.iterchildren(f"{_W}{kind}Reference"):
+                if ref.get(_W + "type", "default") == "default":
+                    section[kind] = ref.get(_R_ID)
+        sections.append(section)
+    return sections or [{"header": None, "footer": None}]
+
+
+def iter_docx_structure_xml(filepath: str) -> Iterator[AnyItem]:
+    """
+    Streaming DOCX extractor that reads the package XML with lxml iterparse.
+
+    Emits the same items as iter_docx_structure_docx without building python-docx
+    objects. page_number comes from the page breaks Word stored in the file (see
+    _PageTracker); a document that was never laid out by Word only has its explicit
+    breaks. Table cells are read once per w:tc: a horizontally merged cell appears
+    once at its first grid column and continuation cells of vertical merges are left
+    out, where python-docx repeats the merged text in every grid position.
+    """
+    with zipfile.ZipFile(filepath) as archive:
+        main_part = next((rel["target"] for rel in _docx_rels(archive, "")
+                          if rel["type"].endswith("/officeDocument")), "word/document.xml")
+        document_rels = _docx_rels(archive, main_part)
+        targets = {rel["id"]: rel["target"] for rel in document_rels}
+        styles_part = next((rel["target"] for rel in document_rels if rel["type"].endswith("/styles")), None)
+        style_names, default_style = _docx_paragraph_styles(archive, styles_part)
+
+        # Pass 1: headers and footers come first, as in the python-docx engine, but
+        # section properties are stored after each section's content. Documents
+        # without header or footer parts skip this pass.
+        has_headers = any(rel["type"].endswith(("/header", "/footer")) for rel in document_rels)
+        sections = _docx_sections(archive, main_part) if has_headers else []
+        last_footer = None
+        for i, section in enumerate(sections):
+            footer = section["footer"] or last_footer
+            last_footer = footer
+            if section["header"] is None and i > 0:
+                continue  # linked to the previous section
+            for kind, rel_id, page_number in (("Header", section["header"], 1), ("Footer", footer, -1)):
+                if rel_id not in targets:
                     continue
-                if y < height * 0.1:
-                    top_texts[text] += 1
-                elif y > height * 0.9:
-                    bottom_texts[text] += 1
-
-    common_top = {k for k, v in top_texts.items() if v >= len(doc) * 0.8}
-    common_bottom = {k for k, v in bottom_texts.items() if v >= len(doc) * 0.8}
-
-    for page_number, page in enumerate(doc, start=1):
-        blocks = page.get_text("dict")["blocks"]
-        lines_info = []
-
-        # Table detection
-        for table in page.find_tables():
-            matrix = table.extract()
-            if not matrix:
-                continue
-            table_text = "\n".join(["\t".join(cell if cell is not None else "" for cell in row) for row in matrix])
-            results.append({
-                "id": str(uuid.uuid4()),
-                "type": "Table",
-                "text": table_text,
-                "style": "Table Grid",
-                "heading_level": 0,
-                "formatting": {"bold": False, "italic": False, "underline": False},
-                "list_level": 0,
-                "position": {"section_index": section_index, "page_number": page_number},
-                "children": []
-            })
-
-        # Process non-table text
-        for block in blocks:
-            if block["type"] != 0:
-                continue
-            for line in block["lines"]:
-                y = line["bbox"][1]
-                text = "".join(span["text"] for span in line["spans"]).strip()
-                if not text or text in common_top or text in common_bottom:
-                    continue
-                fonts = [span["font"] for span in line["spans"]]
-                lines_info.append({"text": text, "y": y, "fonts": fonts})
-
-        lines_info.sort(key=lambda x: x["y"])
-        prev_y = None
-        paragraph_buffer = []
-
-        for line in lines_info:
-            text = line["text"]
-            fonts = line["fonts"]
-            y = line["y"]
-
-            bold_count = sum("bold" in f.lower() or "bd" in f.lower() for f in fonts)
-            is_header = bold_count / len(fonts) > 0.5 if fonts else False
-
-            if is_header:
-                results.append({
-                    "id": str(uuid.uuid4()),
-                    "type": "Heading",
-                    "text": text,
-                    "style": "Heading 1",
-                    "heading_level": 1,
-                    "formatting": {"bold": True, "italic": False, "underline": False},
-                    "list_level": 0,
-                    "position": {"section_index": section_index, "page_number": page_number},
-                    "children": []
-                })
-                section_index += 1
+                root = etree.fromstring(archive.read(targets[rel_id]))
+                for p in root.iterchildren(_W + "p"):
+                    text = _paragraph_text(p).strip()
+                    if text:
+                        yield build_structured_obj(obj_type=kind, text=text, section_index=i,
+                                                   page_number=page_number)
+
+        # Pass 2: body blocks
+        pages = _PageTracker()
+        section_index = 0
+        for block in _iter_body_blocks(archive, main_part, (_W + "p", _W + "tbl")):
+            page_number = pages.advance(block)
+            if block.tag == _W + "p":
+                text = _paragraph_text(block).strip()
+                if text:
+                    ppr = block.find(_W + "pPr")
+                    style_id = ppr.find(_W + "pStyle") if ppr is not None else None
+                    style = style_names.get(style_id.get(_W + "val"), default_style) \
+                        if style_id is not None else default_style
+                    heading_level = detect_heading_level(style)
+                    para_type = 'Paragraph'
+                    if heading_level:
+                        para_type = 'Heading'
+                    elif is_list_style(style):
+                        para_type = 'List'
+                    yield build_structured_obj(
+                        obj_type=para_type,
+                        text=text,
+                        style=style,
+                        heading_level=heading_level,
+                        formatting=_paragraph_formatting(block),
+                        section_index=section_index,
+                        page_number=page_number,
+                        list_level=_paragraph_indent(ppr)
+                    )
+            else:
+                yield TableItem(_table_rows(block), section_index, page_number)
+            section_index += 1
+
+        METRICS.inc("pages_total", pages.page, type="docx")
+
+
+def _table_rows(tbl) -> List[List[Cell]]:
+    rows = []
+    for i, tr in enumerate(tbl.iterchildren(_W + "tr")):
+        grid_before = tr.find(f"{_W}trPr/{_W}gridBefore")
+        col = int(grid_before.get(_W + "val", 0)) if grid_before is not None else 0
+        row_data = []
+        for tc in tr.iterchildren(_W + "tc"):
+            span, continued, texts = 1, False, []
+            for child in tc:
+                if child.tag == _W + "p":
+                    texts.append(_paragraph_text(child))
+                elif child.tag == _W + "tcPr":
+                    for prop in child:
+                        if prop.tag == _W + "gridSpan":
+                            span = int(prop.get(_W + "val", 1))
+                        elif prop.tag == _W + "vMerge":
+                            continued = prop.get(_W + "val") != "restart"
+            if not continued:
+                row_data.append(Cell("\n".join(texts).strip(), i, col))
+            col += span
+        rows.append(row_data)
+    return rows
+
+
+TABLE_MODES = ('auto', 'always', 'never')
+
+
+def parse_pdf_page_layout(page):
+    """
+    Parses a page's text layout once.
+
+    Returns the page height and its non-empty text lines as (text, y, fonts) tuples,
+    which is all the header/footer detection and content passes need.
+    """
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] != 0:
+            continue
+        for line in block["lines"]:
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append((text, line["bbox"][1], [span["font"] for span in line["spans"]]))
+    return page.rect.height, lines
+
+
+def sample_page_indices(start: int, stop: int, sample_size: int = None) -> List[int]:
+    """Returns up to sample_size page indices spread evenly over [start, stop); all of them if sample_size is None."""
+    page_count = stop - start
+    if sample_size is None or sample_size >= page_count:
+        return list(range(start, stop))
+    if sample_size <= 1:
+        return [start] if page_count else []
+    step = (page_count - 1) / (sample_size - 1)
+    return sorted({start + round(i * step) for i in range(sample_size)})
+
+
+def count_pdf_header_footer_lines(doc, page_indices, layouts: Dict[int, Any] = None):
+    """
+    Counts how often each line of text appears in the top and bottom 10% of the given pages.
+
+    Parsed layouts are stored in layouts (keyed by page index) so the content pass can
+    reuse them instead of parsing those pages again.
+    """
+    top_texts = defaultdict(int)
+    bottom_texts = defaultdict(int)
+
+    for page_index in page_indices:
+        height, lines = parse_pdf_page_layout(doc[page_index])
+        if layouts is not None:
+            layouts[page_index] = (height, lines)
+        _count_edge_lines(height, lines, top_texts, bottom_texts)
+
+    return top_texts, bottom_texts
+
+
+def _count_edge_lines(height, lines, top_texts, bottom_texts):
+    for text, y, _ in lines:
+        if y < height * 0.1:
+            top_texts[text] += 1
+        elif y > height * 0.9:
+            bottom_texts[text] += 1
+
+
+def common_header_footer_lines(top_texts, bottom_texts, page_count: int):
+    """Keeps the lines repeated on at least 80% of the counted pages as running headers/footers."""
+    common_top = {k for k, v in top_texts.items() if v >= page_count * 0.8}
+    common_bottom = {k for k, v in bottom_texts.items() if v >= page_count * 0.8}
+    return common_top, common_bottom
+
+
+def page_has_ruling_lines(page, min_length: float = 3) -> bool:
+    """
+    Cheap pre-check for table detection.
+
+    find_tables() builds cells from horizontal and vertical vector edges, so a page
+    without at least one of each (ignoring invisible white background fills and
+    edges shorter than min_length) cannot yield a table.
+    """
+    has_horizontal = has_vertical = False
+    for path in page.get_cdrawings():
+        if path.get("fill") == (1.0, 1.0, 1.0) and not path.get("color"):
+            continue
+        for item in path["items"]:
+            if item[0] == "l":
+                width, height = abs(item[2][0] - item[1][0]), abs(item[2][1] - item[1][1])
+            elif item[0] == "re":
+                rect = fitz.Rect(item[1])
+                width, height = rect.width, rect.height
+            elif item[0] == "qu":
+                rect = fitz.Quad(item[1]).rect
+                width, height = rect.width, rect.height
+            else:
                 continue
+            has_horizontal |= width >= min_length
+            has_vertical |= height >= min_length
+            if has_horizontal and has_vertical:
+                return True
+    return False
+
+
+def iter_pdf_page_range(doc, start: int, stop: int, common_top, common_bottom, section_index: int = 0,
+                        layouts: Dict[int, Any] = None, table_mode: str = 'auto') -> Iterator[AnyItem]:
+    """
+    Yields structured items from pages [start, stop) of an open PDF, one page at a time.
+
+    Pages already parsed into layouts are taken from it (and released); other pages are
+    parsed here. table_mode is 'auto' (detect tables only on pages with ruling lines),
+    'always' or 'never'. The generator's return value is the section index reached
+    after the last page.
+    """
+    if table_mode not in TABLE_MODES:
+        raise ValueError(f"Unknown table_mode: {table_mode}")
+    layouts = layouts if layouts is not None else {}
+
+    for page_number in range(start + 1, stop + 1):
+        METRICS.inc("pages_total", type="pdf")
+        page = doc[page_number - 1]
+        layout = layouts.pop(page_number - 1, None)
+        _, lines = layout if layout is not None else parse_pdf_page_layout(page)
+        section_index = yield from iter_pdf_page_items(page_number, lines, pdf_page_tables(page, table_mode),
+                                                       common_top, common_bottom, section_index)
+
+    return section_index
+
+
+def pdf_page_tables(page, table_mode: str = 'auto') -> List[str]:
+    """Returns the text of each table detected on a page, rows on lines and cells tab-separated."""
+    tables = []
+    detect_tables = table_mode == 'always' or (table_mode == 'auto' and page_has_ruling_lines(page))
+    for table in (page.find_tables() if detect_tables else []):
+        matrix = table.extract()
+        if not matrix:
+            continue
+        tables.append("\n".join(["\t".join(cell if cell is not None else "" for cell in row) for row in matrix]))
+    return tables
+
+
+def parse_pdf_page_range(doc, start: int, stop: int, sampled, table_mode: str = 'auto'):
+    """
+    Parses pages [start, stop) of an open PDF once each, without building items yet.
+
+    Returns the header/footer candidate counts over the pages of the range that are in
+    sampled, and a (page_number, lines, tables) tuple per page. Once the counts of every
+    range are merged into document-wide header/footer sets, iter_parsed_pdf_pages turns
+    the pages into items, so a PDF split over several workers is parsed a single time.
+    """
+    if table_mode not in TABLE_MODES:
+        raise ValueError(f"Unknown table_mode: {table_mode}")
+    sampled = set(sampled)
+    top_texts = defaultdict(int)
+    bottom_texts = defaultdict(int)
+    pages = []
 
-            if prev_y is not None and abs(y - prev_y) > 10 and paragraph_buffer:
-                results.append({
-                    "id": str(uuid.uuid4()),
-                    "type": "Paragraph",
-                    "text": " ".join(paragraph_buffer),
-                    "style": "Normal",
-                    "heading_level": 0,
-                    "formatting": {"bold": False, "italic": False, "underline": False},
-                    "list_level": 0,
-                    "position": {"section_index": section_index, "page_number": page_number},
-                    "children": []
-                })
-                paragraph_buffer = []
-
-            paragraph_buffer.append(text)
-            prev_y = y
-
-            if text[-1] in ".?!":
-                results.append({
-                    "id": str(uuid.uuid4()),
-                    "type": "Paragraph",
-                    "text": " ".join(paragraph_buffer),
-                    "style": "Normal",
-                    "heading_level": 0,
-                    "formatting": {"bold": False, "italic": False, "underline": False},
-                    "list_level": 0,
-                    "position": {"section_index": section_index, "page_number": page_number},
-                    "children": []
-                })
-                paragraph_buffer = []
-
-        if paragraph_buffer:
-            results.append({
-                "id": str(uuid.uuid4()),
-                "type": "Paragraph",
-                "text": " ".join(paragraph_buffer),
-                "style": "Normal",
-                "heading_level": 0,
-                "formatting": {"bold": False, "italic": False, "underline": False},
-                "list_level": 0,
-                "position": {"section_index": section_index, "page_number": page_number},
-                "children": []
-            })
-
-    return results
+    for page_index in range(start, stop):
+        METRICS.inc("pages_total", type="pdf")
+        page = doc[page_index]
+        height, lines = parse_pdf_page_layout(page)
+        if page_index in sampled:
+            _count_edge_lines(height, lines, top_texts, bottom_texts)
+        pages.append((page_index + 1, lines, pdf_page_tables(page, table_mode)))
 
+    return dict(top_texts), dict(bottom_texts), pages
+
+
+def iter_parsed_pdf_pages(pages, common_top, common_bottom, section_index: int = 0) -> Iterator[AnyItem]:
+    """Yields the items of pages returned by parse_pdf_page_range, in the order given."""
+    for page_number, lines, tables in pages:
+        section_index = yield from iter_pdf_page_items(page_number, lines, tables, common_top, common_bottom,
+                                                       section_index)
+    return section_index
 
+
+def iter_pdf_page_items(page_number: int, lines, tables: List[str], common_top, common_bottom,
+                        section_index: int = 0) -> Iterator[AnyItem]:
+    """
+    Yields the items of one parsed page: its tables, then headings and paragraphs built
+    from its text lines minus the running headers/footers. Returns the section index reached.
+    """
+    for table_text in tables:
+        yield Item("Table", table_text, section_index, page_number, "Table Grid", 0, 0, 0)
+
+    # Process non-table text
+    lines_info = []
+    for text, y, fonts in lines:
+        if text in common_top or text in common_bottom:
+            continue
+        lines_info.append({"text": text, "y": y, "fonts": fonts})
+
+    lines_info.sort(key=lambda x: x["y"])
+    prev_y = None
+    paragraph_buffer = []
+
+    for line in lines_info:
+        text = line["text"]
+        fonts = line["fonts"]
+        y = line["y"]
+
+        bold_count = sum("bold" in f.lower() or "bd" in f.lower() for f in fonts)
+        is_header = bold_count / len(fonts) > 0.5 if fonts else False
+
+        if is_header:
+            yield Item("Heading", text, section_index, page_number, "Heading 1", 1, BOLD, 0)
+            section_index += 1
+            continue
+
+        if prev_y is not None and abs(y - prev_y) > 10 and paragraph_buffer:
+            yield Item("Paragraph", " ".join(paragraph_buffer), section_index, page_number, "Normal", 0, 0, 0)
+            paragraph_buffer = []
+
+        paragraph_buffer.append(text)
+        prev_y = y
+
+        if text[-1] in ".?!":
+            yield Item("Paragraph", " ".join(paragraph_buffer), section_index, page_number, "Normal", 0, 0, 0)
+            paragraph_buffer = []
+
+    if paragraph_buffer:
+        yield Item("Paragraph", " ".join(paragraph_buffer), section_index, page_number, "Normal", 0, 0, 0)
+
+    return section_index
+
+
+@profiled()
+def extract_pdf_structured_json(pdf_path, header_footer_sample: int = None, table_mode: str = 'auto'):
+    """
+    Extracts structured items from a PDF, parsing each page's layout only once.
+
+    header_footer_sample limits running header/footer detection to that many evenly
+    spaced pages (all pages by default). table_mode: see iter_pdf_page_range.
+    """
+    return list(iter_pdf_structured_json(pdf_path, header_footer_sample, table_mode))
+
+
+def iter_pdf_structured_json(pdf_path, header_footer_sample: int = None,
+                             table_mode: str = 'auto') -> Iterator[AnyItem]:
+    """
+    Streaming counterpart of extract_pdf_structured_json.
+
+    Only the layouts of the pages sampled for header/footer detection are held in memory,
+    so with a header_footer_sample the memory use does not grow with the page count.
+    """
+    with fitz.open(pdf_path) as doc:
+        layouts = {}
+
+        # Pass 1: detect common headers/footers
+        sampled = sample_page_indices(0, len(doc), header_footer_sample)
+        top_texts, bottom_texts = count_pdf_header_footer_lines(doc, sampled, layouts)
+        common_top, common_bottom = common_header_footer_lines(top_texts, bottom_texts, len(sampled))
+
+        yield from iter_pdf_page_range(doc, 0, len(doc), common_top, common_bottom,
+                                       layouts=layouts, table_mode=table_mode)
+
+
+# --- XLSX ---
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return format(value, '.15g')  # drops binary noise such as 0.30000000000000004
+    if isinstance(value, datetime.datetime) and value.time() == datetime.time():
+        return value.date().isoformat()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value).strip()
+
+
+@profiled()
+def extract_xlsx_structure(filepath: str, max_tokens: int = 500, model=None) -> List[AnyItem]:
+    return list(iter_xlsx_structure(filepath, max_tokens, model))
+
+
+@contextlib.contextmanager
+def _quiet_openpyxl():
+    """Silences openpyxl's warnings about sheet features it cannot read (extensions, header formats)."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
+        yield
+
+
+def iter_xlsx_structure(filepath: str, max_tokens: int = 500, model=None, batch_size: int = 256,
+                        repeat_header: bool = True) -> Iterator[AnyItem]:
+    """
+    Streams the sheets of a workbook as Table items of at most max_tokens tokens each.
+
+    The workbook is opened in openpyxl's read-only mode and rows are read one at a time,
+    so memory use is bounded by one window of rows whatever the sheet size. Every
+    non-empty sheet starts with a Heading item holding its name; page_number is the
+    sheet's position in the workbook. Empty rows and cells are left out, and with
+    repeat_header the sheet's first non-empty row is repeated at the top of every
+    window so each chunk keeps its column names. Tokens are counted as the chunker
+    counts them; pass the chunker's max_tokens and model so windows fill chunks exactly.
+    Formulas are read as the values Excel last calculated.
+    """
+    from openpyxl import load_workbook
+
+    counter = TokenCounter(model)
+    with _quiet_openpyxl():
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        section_index = 0
+        for sheet_number, sheet in enumerate(workbook.worksheets, start=1):
+            header, header_tokens = None, 0
+            window: List[List[Cell]] = []
+            window_tokens = 0
+            rows = (
+                (row_index, [Cell(text, row_index, col)
+                             for col, text in enumerate(map(_cell_text, values)) if text])
+                for row_index, values in enumerate(sheet.iter_rows(values_only=True))
+            )
+            rows = ((row_index, cells) for row_index, cells in rows if cells)
+
+            while True:
+                # Read-only sheets are parsed lazily, as their rows are pulled
+                with _quiet_openpyxl():
+                    batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                counts = counter.count_many([row_text(cells) for _, cells in batch])
+                for (row_index, cells), tokens in zip(batch, counts):
+                    tokens += 1  # row separator
+                    if header is None:
+                        yield build_structured_obj(obj_type="Heading", text=sheet.title, style="Sheet",
+                                                   heading_level=1, section_index=section_index,
+                                                   page_number=sheet_number)
+                        section_index += 1
+                        if repeat_header:
+                            header, header_tokens = cells, tokens
+                        else:
+                            header = []
+                    if window and window_tokens + tokens > max_tokens:
+                        yield TableItem(window, section_index, sheet_number)
+                        section_index += 1
+                        window, window_tokens = [], 0
+                    if not window and header and cells is not header and header_tokens + tokens <= max_tokens:
+                        window, window_tokens = [header], header_tokens
+                    window.append(cells)
+                    window_tokens += tokens
+            if window:
+                yield TableItem(window, section_index, sheet_number)
+                section_index += 1
+        METRICS.inc("pages_total", len(workbook.worksheets), type="xlsx")
+    finally:
+        workbook.close()
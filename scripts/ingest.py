@@ -0,0 +1,429 @@
+import itertools
+import json
+import logging
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+from scripts.bulk_loader import BulkLoader, LoadJournal, iter_batches
+from scripts.chunkingAlgorithm import HierarchicalChunker, merge_text
+from scripts.dedup import ChunkDeduplicator
+from scripts.document import to_dicts
+from scripts.filehandler import SUPPORTED_EXTENSIONS, iter_file_structure
+from scripts.manifest import IngestManifest, hash_file
+from scripts.metrics import METRICS, profiled
+from scripts.utils import iter_records, write_jsonl
+
+logger = logging.getLogger(__name__)
+
+RECORD_FORMATS = ('jsonl', 'json')
+
+
+def _new_summary() -> Dict[str, List[str]]:
+    return {"processed": [], "skipped": [], "removed": [], "failed": []}
+
+
+def _count_summary(stage: str, summary: Dict[str, List[str]]):
+    for status, files in summary.items():
+        METRICS.inc("files_total", len(files), stage=stage, status=status)
+
+
+def _record_files(input_dir: str) -> List[Path]:
+    return sorted(p for p in Path(input_dir).iterdir() if p.suffix in ('.json', '.jsonl'))
+
+
+def write_records(output_stem: str, records: Iterable[Dict[str, Any]], output_format: str = 'jsonl') -> str:
+    """
+    Writes records to f"{output_stem}.{output_format}" and returns that path.
+
+    'jsonl' streams one compact record per line; 'json' is the original pretty-printed
+    array and has to hold every record in memory.
+    """
+    if output_format not in RECORD_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    path = f"{output_stem}.{output_format}"
+    if output_format == 'jsonl':
+        write_jsonl(path, records)
+    else:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(records), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    METRICS.inc("bytes_written_total", os.path.getsize(path), format=output_format)
+    return path
+
+
+def _record_output(manifest: IngestManifest, stage: str, key: str, content_hash: str,
+                   output: str, params: Dict[str, Any] = None):
+    """Records a stage output, deleting the previous output if it was written under another name."""
+    previous = manifest.get(stage, key)
+    if previous and previous.get("output") not in (None, output) and os.path.exists(previous["output"]):
+        os.remove(previous["output"])
+    manifest.record(stage, key, content_hash, params, output=output)
+
+
+def _remove_stale_outputs(manifest: IngestManifest, stage: str, seen: set, summary: Dict[str, List[str]]):
+    """Deletes the outputs of source files that no longer exist and drops their manifest entries."""
+    for key in manifest.keys(stage):
+        if key in seen:
+            continue
+        entry = manifest.remove(stage, key)
+        output = entry.get("output")
+        if output and os.path.exists(output):
+            os.remove(output)
+        summary["removed"].append(key)
+
+
+def chunk_records(structured_items: Iterable[Dict[str, Any]], chunker: HierarchicalChunker,
+                  file_source: str) -> Iterator[Dict[str, Any]]:
+    """Lazily turns extracted items into the chunk records stored under CHUNKS_PATH."""
+    for i, chunk in enumerate(chunker.iter_chunks(structured_items)):
+        yield {
+            "file_source": file_source,
+            "page_numbers": chunk.get("page_numbers", []),
+            "chunk_number": i,
+            "text": merge_text(chunk["content"])
+        }
+
+
+def stream_file_chunks(file_path: str, chunker: HierarchicalChunker, file_source: str = None,
+                       header_footer_sample: int = 100, table_mode: str = 'auto',
+                       docx_engine: str = 'lxml') -> Iterator[Dict[str, Any]]:
+    """
+    Streams a source file straight from the extractor through the chunker.
+
+    Nothing is materialized per document, so together with upload_records a file can be
+    ingested end to end in memory bounded by the batch size rather than the file size.
+    Spreadsheet rows are windowed to the chunker's token budget.
+    """
+    items = iter_file_structure(file_path, docx_engine, chunker.max_tokens, chunker.model,
+                                header_footer_sample=header_footer_sample, table_mode=table_mode)
+    return chunk_records(items, chunker, file_source or Path(file_path).name)
+
+
+def upload_records(data_manager, records: Iterable[Dict[str, Any]], file_id: str, batch_size: int = 1000,
+                   doc_col: str = 'text', meta_cols: List[str] = None, journal_path: str = None) -> List[str]:
+    """
+    Upserts chunk records into the collection in batches, consuming them lazily.
+
+    Batches are embedded on a background thread while the previous batch is written
+    (see BulkLoader). With a journal_path, a re-run after a crash skips the batches
+    that were already written.
+
+    Returns the deterministic IDs of the uploaded chunks; raises RuntimeError if a batch fails.
+    """
+    loader = BulkLoader(data_manager, batch_size=batch_size, journal_path=journal_path,
+                        doc_col=doc_col, meta_cols=meta_cols)
+    report = loader.load(records, file_id=file_id)
+    if not report["success"]:
+        raise RuntimeError(f"Upload of {file_id} failed: {report['error']}")
+    return report["ids"]
+
+
+@profiled()
+def extract_data(input_dir: str, output_dir: str, manifest: IngestManifest = None,
+                 max_workers: int = 1, output_format: str = 'jsonl', docx_engine: str = 'lxml',
+                 xlsx_max_tokens: int = 500) -> Dict[str, List[str]]:
+    """
+    Extracts structured content from every supported file in input_dir into a record file in output_dir.
+
+    docx_engine selects the DOCX extractor ('lxml' or 'python-docx'); switching engines
+    re-extracts DOCX files on the next run with a manifest. Spreadsheets are split into
+    tables of at most xlsx_max_tokens tokens; keep it at the chunker's max_tokens.
+
+    With a manifest, files whose content and extractor version are unchanged since the
+    last run are skipped, and the outputs of files removed from input_dir are deleted.
+    With max_workers > 1 (or None for one per CPU), files and page ranges of large PDFs
+    are extracted on a process pool and each file is written as soon as it is done;
+    otherwise items are streamed straight to disk.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary = _new_summary()
+    seen = set()
+    pending = []
+
+    for file in sorted(os.listdir(input_dir)):
+        file_path = os.path.join(input_dir, file)
+        if not os.path.isfile(file_path) or Path(file).suffix.lower() not in SUPPORTED_EXTENSIONS:
+            continue
+        seen.add(file)
+        output_stem = os.path.join(output_dir, Path(file).stem)
+        params = {
+            '.docx': {"docx_engine": docx_engine},
+            '.xlsx': {"xlsx_max_tokens": xlsx_max_tokens},
+        }.get(Path(file).suffix.lower())
+
+        try:
+            content_hash = hash_file(file_path)
+        except Exception as e:
+            summary["failed"].append(file)
+            logger.error(f"Failed to process {file}: {e}")
+            continue
+        if (manifest and manifest.is_current("extract", file, content_hash, params)
+                and os.path.exists(f"{output_stem}.{output_format}")):
+            summary["skipped"].append(file)
+            continue
+        pending.append((file, file_path, output_stem, content_hash, params))
+
+    def save(file, file_path, output_stem, content_hash, params, items=None, error=None):
+        try:
+            if error:
+                raise RuntimeError(error)
+            if items is None:
+                items = iter_file_structure(file_path, docx_engine, xlsx_max_tokens)
+            output = write_records(output_stem, to_dicts(items), output_format)
+            if manifest:
+                _record_output(manifest, "extract", file, content_hash, output, params)
+                # Saved per file, so a crash later in the run keeps the files already written
+                manifest.save()
+            summary["processed"].append(file)
+            logger.info(f"Saved: {output}")
+        except Exception as e:
+            summary["failed"].append(file)
+            logger.error(f"Failed to process {file}: {e}")
+
+    if max_workers != 1 and len(pending) > 0:
+        from scripts.parallel_extract import iter_files_parallel
+
+        # Files are written as soon as they are extracted; only those in progress are held
+        by_path = {p[1]: p for p in pending}
+        for path, items, error in iter_files_parallel(list(by_path), max_workers=max_workers,
+                                                      docx_engine=docx_engine, xlsx_max_tokens=xlsx_max_tokens):
+            save(*by_path[path], items=items, error=error)
+    else:
+        for p in pending:
+            save(*p)
+
+    if manifest:
+        _remove_stale_outputs(manifest, "extract", seen, summary)
+        manifest.save()
+    _count_summary("extract", summary)
+    return summary
+
+
+@profiled()
+def process_directory(input_dir: str, output_dir: str, chunker: HierarchicalChunker,
+                      manifest: IngestManifest = None, output_format: str = 'jsonl') -> Dict[str, List[str]]:
+    """
+    Chunks every extracted record file (.json or .jsonl) in input_dir into a chunk file in output_dir.
+
+    Items are read, chunked and written lazily. With a manifest, files are only re-chunked
+    when their extracted content, the chunker version or the chunker settings have changed.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    params = {
+        "max_tokens": chunker.max_tokens,
+        "tokenizer": getattr(chunker.model, "name", None),
+    }
+    summary = _new_summary()
+    seen = set()
+
+    for file in _record_files(input_dir):
+        seen.add(file.name)
+        output_stem = os.path.join(output_dir, file.stem)
+        try:
+            content_hash = hash_file(str(file))
+            if (manifest and manifest.is_current("chunk", file.name, content_hash, params)
+                    and os.path.exists(f"{output_stem}.{output_format}")):
+                summary["skipped"].append(file.name)
+                continue
+
+            records = chunk_records(iter_records(file), chunker, file.name)
+            output = write_records(output_stem, records, output_format)
+
+            if manifest:
+                _record_output(manifest, "chunk", file.name, content_hash, output, params)
+            summary["processed"].append(file.name)
+        except Exception as e:
+            summary["failed"].append(file.name)
+            logger.error(f"Error processing {file.name}: {e}")
+
+    if manifest:
+        _remove_stale_outputs(manifest, "chunk", seen, summary)
+        manifest.save()
+    _count_summary("chunk", summary)
+    return summary
+
+
+@profiled()
+def dedup_directory(input_dir: str, output_dir: str, manifest: IngestManifest = None,
+                    deduplicator: ChunkDeduplicator = None, output_format: str = 'jsonl') -> Dict[str, List[str]]:
+    """
+    Copies the chunk files in input_dir to output_dir without exact and near-duplicate chunks.
+
+    Chunks are compared across all files, in file and chunk order, and the first copy
+    is kept (see ChunkDeduplicator). Each kept chunk gets "duplicate_sources", a "; "
+    joined list of the "file_source#chunk_number" copies that were dropped ("" when
+    none), and "duplicate_count", so both can be stored as vector store metadata.
+
+    Since a duplicate may be found in any file, every file is deduplicated again when
+    one of them changes; outputs that come out unchanged are skipped by the embed stage.
+    With a manifest, nothing is rewritten when no input file changed.
+    """
+    deduplicator = deduplicator or ChunkDeduplicator()
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    params = {
+        "threshold": deduplicator.threshold,
+        "num_perm": deduplicator.hasher.num_perm,
+        "rows_per_band": deduplicator.rows_per_band,
+        "shingle_size": deduplicator.hasher.shingle_size,
+    }
+    summary = _new_summary()
+    files = _record_files(input_dir)
+    seen = {file.name for file in files}
+    hashes = {}
+
+    for file in files:
+        try:
+            hashes[file.name] = hash_file(str(file))
+        except Exception as e:
+            summary["failed"].append(file.name)
+            logger.error(f"Error processing {file.name}: {e}")
+    files = [file for file in files if file.name in hashes]
+
+    if manifest and set(manifest.keys("dedup")) == seen and all(
+            manifest.is_current("dedup", file.name, hashes[file.name], params)
+            and os.path.exists(os.path.join(output_dir, f"{file.stem}.{output_format}")) for file in files):
+        summary["skipped"].extend(file.name for file in files)
+        _count_summary("dedup", summary)
+        return summary
+
+    # Pass 1: find the duplicates, holding only signatures of the canonical chunks
+    dropped = set()
+    duplicates = defaultdict(list)
+    with METRICS.time("stage_seconds", stage="dedup"):
+        for file in list(files):
+            try:
+                # Read the whole file first so a broken file adds nothing to the index
+                chunks = [(f"{r['file_source']}#{r['chunk_number']}", r["text"]) for r in iter_records(file)]
+            except Exception as e:
+                files.remove(file)
+                summary["failed"].append(file.name)
+                logger.error(f"Error processing {file.name}: {e}")
+                continue
+            for i, (source, text) in enumerate(chunks):
+                match = deduplicator.add((file.name, i), text)
+                if match is not None:
+                    dropped.add((file.name, i))
+                    duplicates[match["canonical"]].append(source)
+                    METRICS.inc("duplicates_total", kind=match["kind"])
+
+    # Pass 2: write the kept chunks with their duplicates' sources
+    def kept_records(file):
+        for i, record in enumerate(iter_records(file)):
+            if (file.name, i) in dropped:
+                continue
+            sources = duplicates.get((file.name, i), [])
+            yield {**record, "duplicate_sources": "; ".join(sources), "duplicate_count": len(sources)}
+
+    for file in files:
+        try:
+            output = write_records(os.path.join(output_dir, file.stem), kept_records(file), output_format)
+            if manifest:
+                _record_output(manifest, "dedup", file.name, hashes[file.name], output, params)
+            summary["processed"].append(file.name)
+        except Exception as e:
+            summary["failed"].append(file.name)
+            logger.error(f"Error processing {file.name}: {e}")
+
+    logger.info(f"Dropped {len(dropped)} duplicate chunks")
+    if manifest:
+        _remove_stale_outputs(manifest, "dedup", seen, summary)
+        manifest.save()
+    _count_summary("dedup", summary)
+    return summary
+
+
+@profiled()
+def process_and_upload_all_jsons(data_manager, input_dir: str, manifest: IngestManifest = None,
+                                 batch_size: int = 1000, doc_col: str = 'text',
+                                 meta_cols: List[str] = None, journal_path: str = None) -> Dict[str, List[str]]:
+    """
+    Embeds every chunk file (.json or .jsonl) in input_dir into the data manager's collection.
+
+    Chunks get deterministic IDs and are upserted batch by batch as they are read, so
+    re-uploading a file never duplicates vectors. With a manifest, unchanged files are
+    skipped, vectors of chunks that disappeared from a changed file are deleted, and so
+    are all vectors of files removed from input_dir. With a journal_path, an upload
+    interrupted part-way through a file resumes after its last written batch.
+    """
+    params = {
+        "collection": data_manager.collection_name,
+        "model": getattr(data_manager, "model_path", None),
+    }
+    if getattr(data_manager, "shard_by", None):
+        params["shard_by"] = data_manager.shard_by if isinstance(data_manager.shard_by, str) else "custom"
+    summary = _new_summary()
+    seen = set()
+
+    for file in _record_files(input_dir):
+        file_name = file.name
+        seen.add(file_name)
+        try:
+            content_hash = hash_file(str(file))
+            if manifest and manifest.is_current("embed", file_name, content_hash, params):
+                summary["skipped"].append(file_name)
+                continue
+
+            records = iter_records(file)
+            first = next(records, None)
+            records = itertools.chain([first], records) if first is not None else iter(())
+
+            previous = manifest.get("embed", file_name) if manifest else None
+            resuming = journal_path is not None and bool(LoadJournal(journal_path).completed(file.stem))
+            if previous is None and first is not None and not resuming:
+                # No record of what was uploaded before: clear anything left by earlier runs.
+                # An interrupted first upload already did this before its first batch, and
+                # the batches it journaled must stay, since the resumed load skips them.
+                data_manager.delete_documents(where={"file_source": first["file_source"]})
+
+            ids = upload_records(data_manager, records, file.stem, batch_size=batch_size,
+                                 doc_col=doc_col, meta_cols=meta_cols, journal_path=journal_path)
+            if journal_path:
+                # The manifest covers the finished file from here on
+                LoadJournal(journal_path).reset(file.stem)
+
+            if previous:
+                stale_ids = sorted(set(previous.get("ids", [])) - set(ids))
+                data_manager.delete_documents(ids=stale_ids)
+
+            if manifest:
+                manifest.record("embed", file_name, content_hash, params, ids=ids)
+            summary["processed"].append(file_name)
+        except Exception as e:
+            summary["failed"].append(file_name)
+            logger.error(f"Error processing file {file_name}: {e}")
+
+    if manifest:
+        for key in manifest.keys("embed"):
+            if key not in seen:
+                if data_manager.delete_documents(ids=manifest.get("embed", key).get("ids", [])):
+                    manifest.remove("embed", key)
+                    summary["removed"].append(key)
+        manifest.save()
+    _count_summary("embed", summary)
+    return summary
+
+
+@profiled()
+def build_lexical_index(index, input_dir: str, batch_size: int = 1000, doc_col: str = 'text',
+                        meta_cols: List[str] = None) -> Dict[str, List[str]]:
+    """
+    Adds the chunks of every chunk file (.json or .jsonl) in input_dir to a BM25Index,
+    with the IDs and metadata process_and_upload_all_jsons gives their vectors.
+
+    For collections uploaded before the data manager had a lexical index; from then on
+    its writes keep the index current. Chunks already in the index are skipped.
+    """
+    summary = _new_summary()
+    for file in _record_files(input_dir):
+        try:
+            for batch in iter_batches(iter_records(file), file.stem, batch_size, doc_col, meta_cols):
+                index.add(batch["ids"], batch["documents"], batch["metadatas"])
+            summary["processed"].append(file.name)
+        except Exception as e:
+            summary["failed"].append(file.name)
+            logger.error(f"Error indexing file {file.name}: {e}")
+    _count_summary("lexical", summary)
+    return summary
@@ -0,0 +1,405 @@
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from scripts.embedding_cache import normalize_text
+from scripts.vector_backends import matches_where
+
+_TOKEN = re.compile(r"\w+(?:[-./]\w+)*")
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Casefolded word tokens. Tokens joined by - . or / (part numbers, dates, versions)
+    are kept whole and their parts are added as well, so "AB-1234" matches both
+    "ab-1234" and "1234".
+    """
+    tokens = _TOKEN.findall(normalize_text(text).casefold())
+    # isalnum() is a cheap first pass; it is also False for words with underscores
+    compound = [token for token in tokens if not token.isalnum() and not _WORD.fullmatch(token)]
+    return tokens + _WORD.findall(" ".join(compound)) if compound else tokens
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class _Segment:
+    """An immutable block of postings: term hashes in sorted order, each with a run of (doc, tf) pairs."""
+
+    FILES = ("terms", "offsets", "docs", "freqs")
+
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        # Plain ndarray views of the maps: slicing an np.memmap is several times slower
+        self.terms, self.offsets, self.docs, self.freqs = (
+            np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r').view(np.ndarray) for name in self.FILES
+        )
+
+    @classmethod
+    def write(cls, path: str, terms: np.ndarray, docs: np.ndarray, freqs: np.ndarray) -> "_Segment":
+        """Writes postings given as parallel (term, doc, tf) arrays in any order."""
+        order = np.lexsort((docs, terms))
+        terms, docs, freqs = terms[order], docs[order], freqs[order]
+        unique, starts = np.unique(terms, return_index=True)
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        arrays = (unique, np.append(starts, len(terms)).astype(np.int64),
+                  docs.astype(np.uint32), np.minimum(freqs, np.iinfo(np.uint16).max).astype(np.uint16))
+        for name, array in zip(cls.FILES, arrays):
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def postings(self, keys: np.ndarray) -> List[Tuple[int, np.ndarray, np.ndarray]]:
+        """(position in keys, docs, freqs) for each of the term hashes in keys that occurs here."""
+        i = np.minimum(np.searchsorted(self.terms, keys), len(self.terms) - 1)
+        found = np.flatnonzero(self.terms[i] == keys)
+        starts, ends = self.offsets[i[found]].tolist(), self.offsets[i[found] + 1].tolist()
+        return [(int(k), self.docs[start:end], self.freqs[start:end])
+                for k, start, end in zip(found, starts, ends)]
+
+
+class BM25Index:
+    """
+    On-disk BM25 inverted index with memory-mapped postings.
+
+    - Postings live in immutable segments (seg-*/ with terms, offsets, docs and freqs
+      as .npy files), opened with mmap_mode='r': opening an index maps them without
+      reading them, and processes share their pages through the OS page cache. Terms
+      are stored as 64-bit hashes, so there is no vocabulary to load.
+    - meta.sqlite is the sidecar with each document's ID, length, text and metadata.
+      IDs, lengths and metadata are held in memory for scoring and filtering; texts are
+      only read for results.
+    - Every write adds one segment; replaced or deleted documents are dropped from the
+      live set at once and from the postings when their segment is next merged. Once
+      merge_factor segments of similar size exist they are merged into one, so a
+      collection built in many small batches keeps O(log n) segments.
+
+    A query looks up each term in every segment with a binary search and sums the
+    BM25 contributions of the live postings with numpy; it never touches an embedding
+    model. Use a single writer process; readers pick up its commits on their next call.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, merge_factor: int = 8):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.merge_factor = merge_factor
+        self._lock = threading.RLock()
+
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "doc INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, length INTEGER NOT NULL, document TEXT, metadata TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS segments (name TEXT PRIMARY KEY)")
+        self._conn.commit()
+        self._data_version = None
+        self._segments: List[_Segment] = []
+        self._orphans_removed = False
+        self._reload()
+
+    # ----------------------------------------------------------------- storage
+
+    def _setting(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _next_counter(self, key: str) -> int:
+        value = int(self._setting(key) or 0)
+        self._conn.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, str(value + 1)))
+        return value
+
+    def _reload(self):
+        """Re-reads the sidecar and maps new segments if another connection wrote to them."""
+        # data_version only changes on commits made by other connections
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        mapped = {segment.name: segment for segment in self._segments}
+        self._segments = [mapped.get(name) or _Segment(os.path.join(self.path, name))
+                          for name, in self._conn.execute("SELECT name FROM segments ORDER BY name")]
+
+        capacity = int(self._setting("next_doc") or 0)
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._metadatas: List[Optional[dict]] = [None] * capacity
+        self._lengths = np.zeros(capacity, dtype=np.float32)
+        self._live = np.zeros(capacity, dtype=bool)
+        self._doc_of: Dict[str, int] = {}
+        for doc, _id, length, metadata in self._conn.execute("SELECT doc, id, length, metadata FROM docs"):
+            self._ids[doc] = _id
+            self._metadatas[doc] = json.loads(metadata) if metadata else None
+            self._lengths[doc] = length
+            self._live[doc] = True
+            self._doc_of[_id] = doc
+        self._total_length = float(self._lengths[self._live].sum())
+
+    def _remove_orphans(self):
+        """
+        Deletes segment directories left by interrupted writes or merges. Only done by
+        the writer, before its first write: a reader could see a segment that is written
+        but not yet committed.
+        """
+        if self._orphans_removed:
+            return
+        self._orphans_removed = True
+        live = {segment.name for segment in self._segments}
+        for name in os.listdir(self.path):
+            if name.startswith("seg-") and name not in live:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _grow(self, capacity: int):
+        grow = capacity - len(self._live)
+        if grow > 0:
+            self._ids.extend([None] * grow)
+            self._metadatas.extend([None] * grow)
+            self._lengths = np.concatenate([self._lengths, np.zeros(grow, dtype=np.float32)])
+            self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+
+    def _forget(self, docs: List[int]):
+        for doc in docs:
+            del self._doc_of[self._ids[doc]]
+            self._ids[doc] = None
+            self._metadatas[doc] = None
+            self._live[doc] = False
+            self._total_length -= float(self._lengths[doc])
+
+    # ------------------------------------------------------------------ writes
+
+    def _write(self, ids: List[str], documents: List[str], metadatas: List[dict], overwrite: bool):
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+        with self._lock:
+            self._reload()
+            self._remove_orphans()
+            latest = {}
+            for i, _id in enumerate(ids):
+                if overwrite or _id not in self._doc_of:
+                    latest[_id] = i  # the last of repeated IDs wins, as in the collections
+            if not latest:
+                return
+            replaced = [self._doc_of[_id] for _id in latest if _id in self._doc_of]
+
+            hashes: Dict[str, int] = {}
+            terms, docs, freqs, rows = [], [], [], []
+            first_doc = int(self._setting("next_doc") or 0)
+            for doc, (_id, i) in enumerate(latest.items(), start=first_doc):
+                counts = Counter(tokenize(documents[i] or ""))
+                for term in counts.keys() - hashes.keys():
+                    hashes[term] = term_hash(term)
+                terms.extend(hashes[term] for term in counts)
+                docs.extend(itertools.repeat(doc, len(counts)))
+                freqs.extend(counts.values())
+                metadata = metadatas[i]
+                rows.append((doc, _id, sum(counts.values()), documents[i],
+                             json.dumps(metadata) if metadata is not None else None))
+            segment = None
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO settings VALUES ('next_doc', ?)",
+                                   (str(first_doc + len(rows)),))
+                self._conn.executemany("DELETE FROM docs WHERE doc = ?", [(doc,) for doc in replaced])
+                self._conn.executemany("INSERT INTO docs VALUES (?, ?, ?, ?, ?)", rows)
+                if terms:
+                    name = f"seg-{self._next_counter('next_segment'):08d}"
+                    segment = _Segment.write(os.path.join(self.path, name), np.array(terms, dtype=np.uint64),
+                                             np.array(docs, dtype=np.uint32), np.array(freqs, dtype=np.int64))
+                    self._conn.execute("INSERT INTO segments VALUES (?)", (name,))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                self._data_version = None  # re-read everything on the next call
+                if segment is not None:
+                    shutil.rmtree(os.path.join(self.path, segment.name), ignore_errors=True)
+                raise
+
+            self._forget(replaced)
+            self._grow(first_doc + len(rows))
+            for doc, _id, length, _, _ in rows:
+                self._ids[doc] = _id
+                self._metadatas[doc] = metadatas[latest[_id]]
+                self._lengths[doc] = length
+                self._live[doc] = True
+                self._doc_of[_id] = doc
+                self._total_length += length
+            if segment is not None:
+                self._segments.append(segment)
+            self._maybe_merge()
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[dict] = None):
+        """Adds new documents; IDs that already exist are left unchanged, as the collections do."""
+        self._write(ids, documents, metadatas, overwrite=False)
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[dict] = None):
+        self._write(ids, documents, metadatas, overwrite=True)
+
+    def delete(self, ids: List[str] = None, where: dict = None):
+        with self._lock:
+            self._reload()
+            docs = self._select_docs(ids, where)
+            self._conn.executemany("DELETE FROM docs WHERE doc = ?", [(doc,) for doc in docs])
+            self._conn.commit()
+            self._forget(docs)
+
+    def _merge(self, segments: List[_Segment]):
+        """Rewrites segments as one, without the postings of deleted documents."""
+        terms, docs, freqs = [], [], []
+        for segment in segments:
+            live = self._live[segment.docs]
+            terms.append(np.repeat(segment.terms, np.diff(segment.offsets))[live])
+            docs.append(np.asarray(segment.docs)[live])
+            freqs.append(np.asarray(segment.freqs)[live])
+        merged = None
+        try:
+            if sum(len(d) for d in docs):
+                name = f"seg-{self._next_counter('next_segment'):08d}"
+                merged = _Segment.write(os.path.join(self.path, name), np.concatenate(terms),
+                                        np.concatenate(docs), np.concatenate(freqs))
+                self._conn.execute("INSERT INTO segments VALUES (?)", (name,))
+            self._conn.executemany("DELETE FROM segments WHERE name = ?", [(s.name,) for s in segments])
+            self._conn.commit()
+        except Exception:
+            self._conn.rollback()
+            if merged is not None:
+                shutil.rmtree(os.path.join(self.path, merged.name), ignore_errors=True)
+            raise
+        names = {segment.name for segment in segments}
+        self._segments = [s for s in self._segments if s.name not in names] + ([merged] if merged else [])
+        for name in names:
+            # Fails where readers still map the files; _remove_orphans retries in the next writer
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def _maybe_merge(self):
+        while True:
+            tiers = defaultdict(list)
+            for segment in self._segments:
+                tiers[int(math.log(max(len(segment), 1), self.merge_factor))].append(segment)
+            group = next((tiers[tier] for tier in sorted(tiers) if len(tiers[tier]) >= self.merge_factor), None)
+            if group is None:
+                return
+            self._merge(group)
+
+    def compact(self):
+        """Merges all segments into one, dropping every posting of deleted documents."""
+        with self._lock:
+            self._reload()
+            self._remove_orphans()
+            if len(self._segments) > 1 or (self._segments and not self._live[self._segments[0].docs].all()):
+                self._merge(self._segments)
+
+    # ------------------------------------------------------------------- reads
+
+    def _select_docs(self, ids: List[str] = None, where: dict = None) -> List[int]:
+        if ids is not None:
+            docs = [self._doc_of[_id] for _id in ids if _id in self._doc_of]
+        else:
+            docs = np.flatnonzero(self._live).tolist()
+        if where:
+            docs = [doc for doc in docs if matches_where(self._metadatas[doc] or {}, where)]
+        return docs
+
+    def _documents(self, docs: List[int]) -> List[Optional[str]]:
+        documents = {}
+        for i in range(0, len(docs), 500):
+            batch = [int(doc) for doc in docs[i:i + 500]]
+            documents.update(self._conn.execute(
+                f"SELECT doc, document FROM docs WHERE doc IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return [documents.get(int(doc)) for doc in docs]
+
+    def count(self) -> int:
+        with self._lock:
+            self._reload()
+            return len(self._doc_of)
+
+    def _score(self, query: str, where: dict = None, ids: List[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Documents matching any query term, with their BM25 scores."""
+        live_docs = len(self._doc_of)
+        if not live_docs:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        keys = np.array([term_hash(term) for term in dict.fromkeys(tokenize(query))], dtype=np.uint64)
+        hits = [hit for segment in self._segments for hit in segment.postings(keys)]
+        if not hits:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+
+        # All postings of all query terms in flat arrays, each entry tagged with its term
+        term_of = np.repeat([k for k, docs, _ in hits], [len(docs) for _, docs, _ in hits])
+        docs = np.concatenate([docs for _, docs, _ in hits]).astype(np.int64)
+        tf = np.concatenate([freqs for _, _, freqs in hits]).astype(np.float32)
+        live = self._live[docs]
+        term_of, docs, tf = term_of[live], docs[live], tf[live]
+
+        df = np.bincount(term_of, minlength=len(keys))
+        idf = np.log1p((live_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        average_length = self._total_length / live_docs or 1.0
+        norm = self.k1 * (1 - self.b + self.b * self._lengths[docs] / average_length)
+        docs, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=idf[term_of] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+        if ids is not None:
+            allowed = np.array([self._doc_of[_id] for _id in ids if _id in self._doc_of], dtype=np.int64)
+            keep = np.isin(docs, allowed)
+            docs, scores = docs[keep], scores[keep]
+        if where:
+            keep = np.array([matches_where(self._metadatas[doc] or {}, where) for doc in docs], dtype=bool)
+            docs, scores = docs[keep], scores[keep]
+        return docs, scores
+
+    def query(self, queries: List[str], n_results: int = 10, where: dict = None, ids: List[str] = None,
+              include: List[str] = None) -> Dict[str, list]:
+        """
+        Top n_results documents per query by BM25 score, highest first, as one list per
+        query under "ids", "scores", "documents" and "metadatas". Documents without any
+        query term are not returned. where filters on metadata like the collections do;
+        ids restricts the search to the given documents.
+        """
+        include = include if include is not None else ["documents", "metadatas"]
+        result = {"ids": [], "scores": [], "documents": [], "metadatas": []}
+        with self._lock:
+            self._reload()
+            for query in queries:
+                docs, scores = self._score(query, where, ids)
+                k = min(n_results, len(docs))
+                top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+                top = top[np.lexsort((docs[top], -scores[top]))]
+                hit_docs = docs[top].tolist()
+                result["ids"].append([self._ids[doc] for doc in hit_docs])
+                result["scores"].append(scores[top].tolist())
+                result["metadatas"].append([self._metadatas[doc] for doc in hit_docs])
+                result["documents"].append(self._documents(hit_docs) if "documents" in include else None)
+        for key in ("documents", "metadatas"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            self._reload()
+            return {
+                "documents": len(self._doc_of),
+                "segments": len(self._segments),
+                "postings": sum(len(segment) for segment in self._segments),
+                "average_length": self._total_length / len(self._doc_of) if self._doc_of else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._segments = []
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+# Bump a stage's version whenever its output format or logic changes, so every
+# file is reprocessed by that stage on the next run.
+STAGE_VERSIONS = {
+    "extract": 2,
+    "chunk": 2,
+    "dedup": 1,
+    "embed": 1,
+}
+
+
+def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str) -> str:
+    """Returns the SHA-1 hex digest of a text string."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def make_chunk_id(file_id: str, chunk_number: Any, text: str) -> str:
+    """
+    Builds a deterministic chunk ID from its source, position and content.
+
+    The same chunk always maps to the same ID, so re-running an upload upserts
+    in place instead of duplicating vectors.
+    """
+    return f"{file_id}_{chunk_number}_{hash_text(text)[:8]}"
+
+
+class IngestManifest:
+    """
+    Tracks which source files each pipeline stage has already processed.
+
+    Entries are stored per stage and keyed by file name. An entry is current when
+    the file's content hash, the stage version and the stage parameters all match
+    what was recorded the last time the stage ran on that file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data: Dict[str, Any] = {"stages": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def _stage(self, stage: str) -> Dict[str, Dict[str, Any]]:
+        return self.data["stages"].setdefault(stage, {})
+
+    def get(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        return self._stage(stage).get(key)
+
+    def keys(self, stage: str) -> List[str]:
+        return list(self._stage(stage).keys())
+
+    def is_current(self, stage: str, key: str, content_hash: str, params: Dict[str, Any] = None) -> bool:
+        entry = self.get(stage, key)
+        return (
+            entry is not None
+            and entry.get("hash") == content_hash
+            and entry.get("version") == STAGE_VERSIONS[stage]
+            and entry.get("params") == (params or {})
+        )
+
+    def record(self, stage: str, key: str, content_hash: str, params: Dict[str, Any] = None, **extra):
+        self._stage(stage)[key] = {
+            "hash": content_hash,
+            "version": STAGE_VERSIONS[stage],
+            "params": params or {},
+            **extra,
+        }
+
+    def remove(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        return self._stage(stage).pop(key, None)
+
+    def save(self):
+        """Writes the manifest atomically so an interrupted run never leaves it half-written."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,275 @@
+"""
+Per-stage pipeline metrics and profiling hooks.
+
+The pipeline modules record into the process-wide METRICS registry; export it with
+METRICS.write_json(path) or serve METRICS.to_prometheus(). Functions marked @profiled
+are run under cProfile or pyinstrument once enable_profiling() has been called.
+"""
+import bisect
+import cProfile
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+# Upper bounds in seconds; suited to search and embedding latencies
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the last bound for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, cumulative in zip(self.buckets, itertools.accumulate(self.counts)):
+            if cumulative >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, timers and histograms, each optionally labelled.
+
+    - inc("items_total", 3, stage="extract") adds to a counter.
+    - with time("stage_seconds", stage="chunk"): ... accumulates wall time and calls.
+    - observe("search_latency_seconds", 0.012) records into a histogram.
+    - timed_iter wraps an iterator, timing only the time spent producing its items.
+
+    Metrics are per process; worker processes keep their own registries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters: Dict[_Key, float] = {}
+            self._timers: Dict[_Key, list] = {}
+            self._histograms: Dict[_Key, _Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_time(self, name: str, seconds: float, calls: int = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            timer = self._timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += calls
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    def observe(self, name: str, value: float, buckets=DEFAULT_BUCKETS, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels) -> Callable:
+        """Decorator form of time()."""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, iterable: Iterable, name: str, count: str = None, **labels) -> Iterator:
+        """
+        Yields from iterable, adding the time spent inside it to timer name and, if count
+        is given, the number of items to that counter. Time the consumer spends between
+        items is not included, so streamed stages are measured separately.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        items = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    return
+                elapsed += time.perf_counter() - start
+                items += 1
+                yield item
+        finally:
+            self.add_time(name, elapsed, **labels)
+            if count:
+                self.inc(count, items, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """All metrics as plain data, for JSON export."""
+        def labelled(key):
+            return {"name": key[0], "labels": dict(key[1])}
+
+        with self._lock:
+            return {
+                "counters": [{**labelled(k), "value": v} for k, v in sorted(self._counters.items())],
+                "timers": [{**labelled(k), "calls": t[0], "seconds": round(t[1], 6), "max_seconds": round(t[2], 6)}
+                           for k, t in sorted(self._timers.items())],
+                "histograms": [{**labelled(k), "count": h.count, "sum": round(h.sum, 6),
+                                "buckets": dict(zip([*map(str, h.buckets), "+Inf"],
+                                                    itertools.accumulate(h.counts))),
+                                "p50": h.quantile(0.5), "p95": h.quantile(0.95), "p99": h.quantile(0.99)}
+                               for k, h in sorted(self._histograms.items())],
+            }
+
+    def to_json(self, indent: int = 2) -> str:
+        return json.dumps(self.snapshot(), indent=indent)
+
+    def write_json(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    def to_prometheus(self, prefix: str = "rag_") -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                declare(prefix + name, "counter")
+                lines.append(f"{prefix}{name}{labels_text(labels)} {value}")
+            # Timers become two counter families, each kept contiguous
+            for suffix, field in (("_total", 1), ("_calls_total", 0)):
+                for (name, labels), timer in sorted(self._timers.items()):
+                    declare(f"{prefix}{name}{suffix}", "counter")
+                    lines.append(f"{prefix}{name}{suffix}{labels_text(labels)} {timer[field]}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                declare(prefix + name, "histogram")
+                for bound, cumulative in zip([*map(str, h.buckets), "+Inf"], itertools.accumulate(h.counts)):
+                    lines.append(f"{prefix}{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{prefix}{name}_sum{labels_text(labels)} {h.sum}")
+                lines.append(f"{prefix}{name}_count{labels_text(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def serve_prometheus(port: int = 9108, host: str = "127.0.0.1", registry: Metrics = METRICS):
+    """Serves registry.to_prometheus() at http://host:port/metrics on a daemon thread; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ------------------------------------------------------------------ profiling
+
+_profiling = {"dir": os.environ.get("PIPELINE_PROFILE_DIR"), "engine": os.environ.get("PIPELINE_PROFILER", "cprofile")}
+_profile_runs = itertools.count(1)
+
+
+def enable_profiling(output_dir: str, engine: str = "cprofile"):
+    """Profiles every call to a @profiled function into output_dir ('cprofile' or 'pyinstrument')."""
+    if engine not in ("cprofile", "pyinstrument"):
+        raise ValueError(f"Unknown profiler: {engine}")
+    os.makedirs(output_dir, exist_ok=True)
+    _profiling.update(dir=output_dir, engine=engine)
+
+
+def disable_profiling():
+    _profiling["dir"] = None
+
+
+def profiled(name: str = None) -> Callable:
+    """
+    Marks a hot function for profiling. Without enable_profiling (or the
+    PIPELINE_PROFILE_DIR environment variable) it only costs a dict lookup per call;
+    with it, each call writes <name>-<n>.prof (cProfile) or .html (pyinstrument).
+    """
+    def decorator(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            output_dir = _profiling["dir"]
+            if not output_dir:
+                return fn(*args, **kwargs)
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f"{label}-{next(_profile_runs)}")
+            if _profiling["engine"] == "pyinstrument":
+                from pyinstrument import Profiler
+
+                profiler = Profiler()
+                profiler.start()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    profiler.stop()
+                    with open(path + ".html", "w", encoding="utf-8") as f:
+                        f.write(profiler.output_html())
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(fn, *args, **kwargs)
+            finally:
+                profiler.dump_stats(path + ".prof")
+        return wrapper
+    return decorator
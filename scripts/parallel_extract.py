@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import fitz
+
+from scripts.document import AnyItem
+from scripts.filehandler import (
+    common_header_footer_lines,
+    detect_file_type_and_extract_text,
+    extract_pdf_structured_json,
+    iter_parsed_pdf_pages,
+    parse_pdf_page_range,
+    sample_page_indices,
+)
+
+
+# --- worker tasks (module level so they can be pickled) ---
+
+def _extract_file_task(file_path: str, pdf_options: Dict[str, Any], docx_engine: str, xlsx_max_tokens: int):
+    if Path(file_path).suffix.lower() == '.pdf':
+        return extract_pdf_structured_json(file_path, **pdf_options)
+    return detect_file_type_and_extract_text(file_path, docx_engine, xlsx_max_tokens)
+
+
+def _parse_page_range_task(pdf_path: str, start: int, stop: int, page_indices: List[int], table_mode: str):
+    with fitz.open(pdf_path) as doc:
+        return parse_pdf_page_range(doc, start, stop, page_indices, table_mode)
+
+
+def _make_pool(max_workers: int, max_tasks_per_child: int) -> ProcessPoolExecutor:
+    # Workers are recycled after max_tasks_per_child tasks so fitz/python-docx
+    # allocations cannot pile up in long-lived processes.
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        max_tasks_per_child=max_tasks_per_child,
+    )
+
+
+def _iter_tasks(tasks: List[Tuple[Any, Callable, tuple]], max_workers: int,
+                max_tasks_per_child: int) -> Iterator[Tuple[Any, bool, Any]]:
+    """
+    Runs (key, fn, args) tasks on a process pool, yielding (key, ok, result_or_error) as each one finishes.
+
+    At most 2 * max_workers tasks are in flight at a time. If a worker dies (e.g. killed
+    for running out of memory) the pool breaks: the tasks that were in flight are retried
+    one at a time in a single-worker pool, so only the task that actually crashes is
+    reported as failed, and the remaining tasks continue on a fresh pool.
+    """
+    queue = list(reversed(tasks))
+
+    while queue:
+        in_flight = {}
+        with _make_pool(max_workers, max_tasks_per_child) as pool:
+            try:
+                while queue or in_flight:
+                    while queue and len(in_flight) < max_workers * 2:
+                        task = queue[-1]
+                        in_flight[pool.submit(task[1], *task[2])] = task
+                        queue.pop()
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = in_flight.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            in_flight[future] = task
+                            raise
+                        except Exception as e:
+                            yield task[0], False, f"{type(e).__name__}: {e}"
+                        else:
+                            yield task[0], True, result
+            except BrokenProcessPool:
+                pass
+
+        for key, fn, args in in_flight.values():
+            with _make_pool(1, 1) as isolated_pool:
+                try:
+                    result = isolated_pool.submit(fn, *args).result()
+                except Exception as e:
+                    yield key, False, f"{type(e).__name__}: {e}"
+                else:
+                    yield key, True, result
+
+
+def _page_ranges(page_count: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+
+def _assemble_pdf(parsed_ranges: List[tuple], sampled_count: int) -> List[AnyItem]:
+    """Builds a split PDF's items from its parsed page ranges, in page order."""
+    top_texts, bottom_texts, pages = {}, {}, []
+    for range_top, range_bottom, range_pages in parsed_ranges:
+        for counts, merged in zip((range_top, range_bottom), (top_texts, bottom_texts)):
+            for text, n in counts.items():
+                merged[text] = merged.get(text, 0) + n
+        pages.extend(range_pages)
+    parsed_ranges.clear()
+    common_top, common_bottom = common_header_footer_lines(top_texts, bottom_texts, sampled_count)
+    return list(iter_parsed_pdf_pages(pages, common_top, common_bottom))
+
+
+def extract_files_parallel(file_paths: List[str], max_workers: int = None, pages_per_task: int = 50,
+                           max_tasks_per_child: int = 20, header_footer_sample: int = None,
+                           table_mode: str = 'auto', docx_engine: str = 'lxml',
+                           xlsx_max_tokens: int = 500):
+    """
+    Collects iter_files_parallel into (results, errors): results maps each successfully
+    extracted path to its items, in input order; errors maps each failed path to its
+    error message. Every file's items are held at once; prefer iter_files_parallel.
+    """
+    results, errors = {}, {}
+    for path, items, error in iter_files_parallel(file_paths, max_workers, pages_per_task, max_tasks_per_child,
+                                                  header_footer_sample, table_mode, docx_engine, xlsx_max_tokens):
+        if error is None:
+            results[path] = items
+        else:
+            errors[path] = error
+    return {path: results[path] for path in file_paths if path in results}, errors
+
+
+def iter_files_parallel(file_paths: List[str], max_workers: int = None, pages_per_task: int = 50,
+                        max_tasks_per_child: int = 20, header_footer_sample: int = None,
+                        table_mode: str = 'auto', docx_engine: str = 'lxml',
+                        xlsx_max_tokens: int = 500) -> Iterator[Tuple[str, List[AnyItem], str]]:
+    """
+    Extracts structured content from many files on a process pool.
+
+    Small files are extracted whole by one worker. PDFs with more than pages_per_task
+    pages are split into page ranges, each parsed once by a worker that also counts the
+    header/footer candidates on its sampled pages. The counts are then merged into
+    document-wide header/footer sets and the parsed pages are turned into items in page
+    order, so the output matches extract_pdf_structured_json.
+    header_footer_sample and table_mode are passed through to the PDF extractor,
+    docx_engine to the DOCX extractor and xlsx_max_tokens to the XLSX extractor.
+
+    Yields (path, items, error) as soon as each file is done, in completion order: items
+    is None when the file failed and error holds the message. Only the files still in
+    progress are held in memory, so the caller can write each one out and drop it.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    page_counts = {}
+
+    for path in file_paths:
+        if Path(path).suffix.lower() != '.pdf':
+            continue
+        try:
+            with fitz.open(path) as doc:
+                page_counts[path] = len(doc)
+        except Exception as e:
+            page_counts[path] = None
+            yield path, None, f"{type(e).__name__}: {e}"
+
+    split_pdfs = {
+        path: _page_ranges(count, pages_per_task)
+        for path, count in page_counts.items() if count and count > pages_per_task
+    }
+    pdf_options = {"header_footer_sample": header_footer_sample, "table_mode": table_mode}
+
+    tasks = []
+    sampled_pages = {}
+    for path in file_paths:
+        if path in page_counts and page_counts[path] is None:
+            continue
+        if path in split_pdfs:
+            sampled_pages[path] = sample_page_indices(0, page_counts[path], header_footer_sample)
+            for r in split_pdfs[path]:
+                page_indices = [i for i in sampled_pages[path] if r[0] <= i < r[1]]
+                tasks.append(((path, r), _parse_page_range_task, (path, *r, page_indices, table_mode)))
+        else:
+            tasks.append(((path, None), _extract_file_task, (path, pdf_options, docx_engine, xlsx_max_tokens)))
+
+    # Parsed page ranges of split PDFs whose other ranges are still running
+    ranges_done: Dict[str, Dict[Tuple[int, int], Tuple[bool, Any]]] = {}
+    for (path, r), ok, value in _iter_tasks(tasks, max_workers, max_tasks_per_child):
+        if r is None:
+            yield (path, value, None) if ok else (path, None, value)
+            continue
+
+        ranges_done.setdefault(path, {})[r] = (ok, value)
+        if len(ranges_done[path]) < len(split_pdfs[path]):
+            continue
+        outcomes = ranges_done.pop(path)
+        error = next((value for ok, value in outcomes.values() if not ok), None)
+        if error is not None:
+            yield path, None, error
+        else:
+            yield path, _assemble_pdf([outcomes.pop(r)[1] for r in split_pdfs[path]], len(sampled_pages[path])), None
@@ -0,0 +1,77 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from scripts.embedding_cache import normalize_text
+
+
+class QueryResultCache:
+    """
+    In-memory LRU cache of search results with a time-to-live.
+
+    Every entry remembers the collection version it was computed against; a lookup
+    with a different version is a miss and drops the entry, so results are never
+    served from before a write. Versions are tracked per process: writes made to the
+    same collection by another process are only picked up once entries expire.
+    """
+
+    def __init__(self, max_items: int = 1024, ttl: float = 300.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.seconds_saved = 0.0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str, n_results: int, where: dict = None, **options) -> Hashable:
+        """Cache key from the normalized query, the result count, the filter and any other options."""
+        return (
+            normalize_text(query),
+            n_results,
+            json.dumps(where, sort_keys=True, default=str) if where else None,
+            tuple(sorted(options.items())),
+        )
+
+    def get(self, key: Hashable, version: int) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_version, created, cost = entry
+                if entry_version == version and now - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self.seconds_saved += cost
+                    return value
+                del self._entries[key]
+                self.stale += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, version: int, value: Any, cost: float = 0.0):
+        """Stores a result; cost is how long it took to compute, counted as saved on every hit."""
+        with self._lock:
+            self._entries[key] = (value, version, time.monotonic(), cost)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "seconds_saved": self.seconds_saved,
+            "items": len(self._entries),
+        }
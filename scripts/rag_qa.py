@@ -0,0 +1,223 @@
+import time
+from typing import Any, Callable, Dict, List, Tuple, TypedDict
+
+from scripts.answer_cache import AnswerCache, chunk_version
+from scripts.chunkingAlgorithm import TokenCounter
+from scripts.metrics import METRICS
+
+
+class QAState(TypedDict, total=False):
+    question: str
+    context: str
+    answer: str
+    tokens: int
+    tokens_per_second: float
+    time_to_first_token: float
+    output_tokens_per_second: float
+    context_tokens: int
+    chunk_versions: List[str]
+    packed_history: str
+    cache_hit: bool
+    tokens_saved: int
+    history: List[dict]
+
+
+def format_turn(turn: Dict[str, str]) -> str:
+    return f"User: {turn['question']}\nBot: {turn['answer']}"
+
+
+class ContextPacker:
+    """
+    Fills a fixed token budget with conversation history and ranked chunks.
+
+    Tokens are counted with the chunker's TokenCounter, so pass the same tokenizer
+    as HierarchicalChunker. History gets at most history_tokens: the newest
+    recent_turns turns are kept whole if they fit, older turns keep their question
+    and the first older_turn_tokens of their answer, and turns that no longer fit
+    are dropped. Chunks then fill the rest of max_tokens in rank order; a chunk that does
+    not fit is skipped, except the top-ranked one, which is truncated instead.
+
+    Only as many turns as fit are looked at, newest first, so packing cost stays
+    flat as a conversation grows.
+    """
+
+    def __init__(self, max_tokens: int = 2000, model=None, counter: TokenCounter = None,
+                 history_tokens: int = 600, recent_turns: int = 2, older_turn_tokens: int = 60):
+        self.max_tokens = max_tokens
+        self.counter = counter or TokenCounter(model)
+        self.history_tokens = history_tokens
+        self.recent_turns = recent_turns
+        self.older_turn_tokens = older_turn_tokens
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        pieces = self.counter.split(text, max_tokens)
+        return pieces[0] if pieces else ""
+
+    def _shorten(self, turn: Dict[str, str]) -> str:
+        return format_turn({"question": turn["question"],
+                            "answer": self._truncate(turn["answer"], self.older_turn_tokens)})
+
+    def pack_history(self, history: List[Dict[str, str]]) -> Tuple[str, int]:
+        budget = min(self.history_tokens, self.max_tokens)
+        kept: List[str] = []
+        used = 0
+        for age, turn in enumerate(reversed(history or [])):
+            text = format_turn(turn) if age < self.recent_turns else self._shorten(turn)
+            tokens = self.counter.count(text)
+            if used + tokens > budget and age < self.recent_turns:
+                # A recent turn too long to keep whole is shortened like an older one
+                text = self._shorten(turn)
+                tokens = self.counter.count(text)
+            if used + tokens > budget:
+                break
+            kept.append(text)
+            used += tokens
+        return "\n".join(reversed(kept)), used
+
+    def pack_chunks(self, chunks: List[str], budget: int) -> Tuple[List[str], int]:
+        selected = []
+        used = 0
+        for rank, (chunk, tokens) in enumerate(zip(chunks, self.counter.count_many(chunks))):
+            if used + tokens <= budget:
+                selected.append(chunk)
+                used += tokens
+            elif rank == 0 and budget > 0:
+                chunk = self._truncate(chunk, budget)
+                selected.append(chunk)
+                used += self.counter.count(chunk)
+        return selected, used
+
+    def pack(self, chunks: List[str], history: List[Dict[str, str]] = None) -> Tuple[str, int]:
+        """Returns the packed context, history first as in the original notebook, and its token count."""
+        context, tokens, _ = self.pack_with_history(chunks, history)
+        return context, tokens
+
+    def pack_with_history(self, chunks: List[str], history: List[Dict[str, str]] = None) -> Tuple[str, int, str]:
+        """Like pack, also returning the packed history text that went into the context."""
+        history_text, history_used = self.pack_history(history or [])
+        separator = 2 if history_text else 0
+        selected, chunk_used = self.pack_chunks(chunks, self.max_tokens - history_used - separator)
+        docs = "\n".join(selected)
+        context = history_text + "\n\n" + docs if history_text else docs
+        return context, history_used + chunk_used + separator, history_text
+
+
+def stream_answer(llm, messages, on_token: Callable[[str], None] = None,
+                  counter: TokenCounter = None) -> Dict[str, Any]:
+    """
+    Streams an answer from llm.stream(messages), calling on_token with every piece.
+
+    Returns the answer with its timings: time_to_first_token (seconds), tokens and
+    tokens_per_second as the notebook reported them (from the model's usage metadata
+    when available), and output_tokens_per_second measured after the first token.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    pieces = []
+    usage: Dict[str, Any] = {}
+    metadata: Dict[str, Any] = {}
+    for chunk in llm.stream(messages):
+        content = chunk.content if hasattr(chunk, "content") else str(chunk)
+        if content:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            pieces.append(content)
+            if on_token is not None:
+                on_token(content)
+        usage.update(getattr(chunk, "usage_metadata", None) or {})
+        metadata.update(getattr(chunk, "response_metadata", None) or {})
+    end = time.perf_counter()
+
+    answer = "".join(pieces)
+    output_tokens = usage.get("output_tokens") or (counter or TokenCounter()).count(answer)
+    total_tokens = usage.get("total_tokens") or output_tokens
+    total_seconds = metadata["total_duration"] / 1e9 if metadata.get("total_duration") else end - start
+    decode_seconds = end - first_token_at if first_token_at is not None else 0.0
+    return {
+        "answer": answer,
+        "tokens": total_tokens,
+        "tokens_per_second": round(total_tokens / total_seconds, 2) if total_seconds else 0.0,
+        "time_to_first_token": round(first_token_at - start, 4) if first_token_at is not None else None,
+        "output_tokens_per_second": round((output_tokens - 1) / decode_seconds, 2) if decode_seconds > 0 else 0.0,
+    }
+
+
+def model_name(llm) -> str:
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+
+
+def template_text(prompt) -> str:
+    """The prompt's template text, for cache keys."""
+    try:
+        return prompt.pretty_repr()
+    except (AttributeError, NotImplementedError):
+        return repr(prompt)
+
+
+def build_qa_graph(data_manager, llm, prompt, packer: ContextPacker, n_results: int = 5,
+                   checkpointer=None, on_token: Callable[[str], None] = None, max_history: int = 50,
+                   answer_cache: AnswerCache = None, search_mode: str = 'vector'):
+    """
+    Builds the retrieve -> generate LangGraph of the RAG notebook on top of ContextPacker
+    and stream_answer. prompt is invoked with {"question", "context"}; at most
+    max_history turns are kept in the state. search_mode picks how chunks are retrieved
+    (see ChromaDataManager.search_many); the non-vector modes need a lexical index.
+
+    With an answer_cache, a question asked again with the same retrieved chunks and
+    conversation history is answered from the cache without calling the LLM (see
+    AnswerCache). The state then has cache_hit set and tokens_saved holds the tokens of
+    the original generation; tokens reports the same count, with no time spent generating.
+    """
+    from langgraph.graph import START, StateGraph
+
+    cache_prefix = (model_name(llm), template_text(prompt)) if answer_cache is not None else None
+
+    def retrieve(state: QAState):
+        results = data_manager.search_vector_store(state["question"], n_results=n_results, mode=search_mode)
+        chunks = results["Text"].tolist() if results is not None and len(results) else []
+        versions = [chunk_version(i, text) for i, text in zip(results["ID"], chunks)] if chunks else []
+        # The prompt carries the packed history, so the cache key has to as well
+        context, context_tokens, packed_history = packer.pack_with_history(chunks, state.get("history", []))
+        return {"context": context, "context_tokens": context_tokens, "chunk_versions": versions,
+                "packed_history": packed_history}
+
+    def generate(state: QAState):
+        key = AnswerCache.key(*cache_prefix, state["question"], state.get("chunk_versions", []),
+                              state.get("packed_history", "")) if cache_prefix else None
+        cached = answer_cache.get(key) if key else None
+        if cached is not None:
+            METRICS.inc("answer_cache_total", result="hit")
+            METRICS.inc("tokens_saved_total", cached["tokens"], stage="qa")
+            if on_token is not None:
+                on_token(cached["answer"])
+            result = {"answer": cached["answer"], "tokens": cached["tokens"], "tokens_per_second": 0.0,
+                      "time_to_first_token": 0.0, "output_tokens_per_second": 0.0,
+                      "cache_hit": True, "tokens_saved": cached["tokens"]}
+        else:
+            messages = prompt.invoke({"question": state["question"], "context": state["context"]})
+            result = stream_answer(llm, messages, on_token=on_token, counter=packer.counter)
+            METRICS.inc("llm_calls_total", stage="qa")
+            if key:
+                METRICS.inc("answer_cache_total", result="miss")
+                answer_cache.put(key, result["answer"], result["tokens"])
+            result.update(cache_hit=False, tokens_saved=0)
+        history = state.get("history", []) + [{"question": state["question"], "answer": result["answer"]}]
+        return {**result, "history": history[-max_history:]}
+
+    graph_builder = StateGraph(QAState).add_sequence([retrieve, generate])
+    graph_builder.add_edge(START, "retrieve")
+    return graph_builder.compile(checkpointer=checkpointer)
+
+
+def create_state(question: str) -> QAState:
+    return {
+        "question": question,
+        "context": "",
+        "answer": "",
+        "tokens": 0,
+        "tokens_per_second": 0.0,
+        "time_to_first_token": None,
+        "output_tokens_per_second": 0.0,
+        "cache_hit": False,
+        "tokens_saved": 0,
+    }
@@ -0,0 +1,121 @@
+import itertools
+import json
+import logging
+import socket
+import threading
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class SearchDaemonError(RuntimeError):
+    pass
+
+
+class SearchClient:
+    """
+    Client for scripts/search_daemon.py with the ChromaDataManager read/write methods.
+
+    Only the standard library is imported up front, so a query script starts in
+    milliseconds; pandas is imported the first time a DataFrame is asked for.
+    address is "host:port" or "unix:/path/to.sock" and defaults to
+    config.SEARCH_DAEMON_ADDRESS. One connection is kept open and shared by threads.
+    """
+
+    def __init__(self, address: str = None, timeout: float = 300.0):
+        if address is None:
+            from scripts.config import SEARCH_DAEMON_ADDRESS
+            address = SEARCH_DAEMON_ADDRESS
+        self.address = address
+        self.timeout = timeout
+        self._socket = None
+        self._file = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.address.startswith("unix:"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.address[len("unix:"):])
+        else:
+            host, _, port = self.address.rpartition(":")
+            sock = socket.create_connection((host or "127.0.0.1", int(port)), timeout=self.timeout)
+        self._socket = sock
+        self._file = sock.makefile("rb")
+
+    def call(self, method: str, **params) -> Any:
+        """Sends one request and waits for its response; raises SearchDaemonError on a server error."""
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            request_id = next(self._ids)
+            message = json.dumps({"id": request_id, "method": method, "params": params}).encode("utf-8") + b"\n"
+            try:
+                self._socket.sendall(message)
+                line = self._file.readline()
+            except OSError:
+                self.close()
+                raise
+            if not line:
+                self.close()
+                raise SearchDaemonError("Connection closed by the search daemon")
+        response = json.loads(line)
+        if "error" in response:
+            raise SearchDaemonError(response["error"])
+        return response["result"]
+
+    def ping(self) -> bool:
+        try:
+            return self.call("ping") == "pong"
+        except (OSError, SearchDaemonError):
+            return False
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self.call("embed", texts=list(texts))
+
+    def add_documents(self, documents: List[str], metadatas: List[dict], ids: List[str]) -> bool:
+        return self.call("add_documents", documents=documents, metadatas=metadatas, ids=ids)
+
+    def upsert_documents(self, documents: List[str], metadatas: List[dict], ids: List[str]) -> bool:
+        return self.call("upsert_documents", documents=documents, metadatas=metadatas, ids=ids)
+
+    def delete_documents(self, ids: List[str] = None, where: dict = None) -> bool:
+        return self.call("delete_documents", ids=ids, where=where)
+
+    def search(self, query: str, n_results: int = 10, where: dict = None, mode: str = 'vector') -> List[Dict[str, Any]]:
+        """Top matches as rows with ID, Score, Text and the metadata fields."""
+        return self.search_many([query], n_results=n_results, where=where, mode=mode)[0]
+
+    def search_many(self, queries: List[str], n_results: int = 10, where: dict = None,
+                    include_documents: bool = True, mode: str = 'vector') -> List[List[Dict[str, Any]]]:
+        """
+        The rows of every query, in order; all queries share one embedding batch on the
+        daemon. mode is one of ChromaDataManager.search_many's search modes.
+        """
+        return self.call("search", queries=list(queries), n_results=n_results, where=where,
+                         include_documents=include_documents, mode=mode)
+
+    def search_vector_store(self, query: str, n_results: int = 10, where: dict = None, mode: str = 'vector'):
+        """Retrieves the top n matches based on the query description and returns as a DataFrame."""
+        import pandas as pd
+
+        try:
+            return pd.DataFrame(self.search(query, n_results=n_results, where=where, mode=mode))
+        except (OSError, SearchDaemonError) as e:
+            logger.error(f"Error searching vector store: {e}")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        return self.call("stats")
+
+    def metrics(self, format: str = "json"):
+        """The daemon's pipeline metrics: a snapshot dict, or Prometheus text with format='prometheus'."""
+        return self.call("metrics", format=format)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._socket is not None:
+            self._socket.close()
+        self._socket = self._file = None
@@ -0,0 +1,241 @@
+"""
+Long-lived embedding and search server around a ChromaDataManager.
+
+The model and collection are loaded once and kept warm; clients talk to it with
+newline-delimited JSON over localhost TCP or a Unix socket (see search_client.py).
+Concurrent embedding and search requests are micro-batched: requests that arrive
+within max_wait seconds of each other share one embedding pass and one collection
+query. Lexical searches (with --lexical) need neither and skip the batching.
+
+    python -m scripts.search_daemon --collection textCollection
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "nomic-ai/nomic-embed-text-v1"
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """'unix:/path/to.sock' -> ('unix', path); 'host:port' -> ('tcp', (host, port))."""
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class MicroBatcher:
+    """
+    Groups concurrent submissions that share a key into a single call.
+
+    run_batch(key, items) receives the items of every submission in the group,
+    concatenated, and returns one result per item; each submitter gets back the
+    results for its own items. A group is flushed after max_wait seconds or as soon
+    as it holds max_items items. Batches run on the given executor, off the event loop.
+    """
+
+    def __init__(self, run_batch: Callable[[Hashable, list], list], executor: ThreadPoolExecutor,
+                 max_items: int = 64, max_wait: float = 0.005):
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._pending: Dict[Hashable, List[Tuple[list, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+
+    async def submit(self, key: Hashable, items: list) -> list:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = self._pending.setdefault(key, [])
+        group.append((items, future))
+        if sum(len(entry[0]) for entry in group) >= self.max_items:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await future
+
+    def _flush(self, key: Hashable):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        group = self._pending.pop(key, None)
+        if group:
+            asyncio.ensure_future(self._run(key, group))
+
+    async def _run(self, key: Hashable, group: List[Tuple[list, asyncio.Future]]):
+        items = [item for entry in group for item in entry[0]]
+        self.batches += 1
+        self.items += len(items)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.run_batch, key, items)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        start = 0
+        for entry_items, future in group:
+            if not future.done():
+                future.set_result(results[start:start + len(entry_items)])
+            start += len(entry_items)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
+
+
+def _search_rows(results) -> List[Dict[str, Any]]:
+    """JSON-ready rows of a single-query SearchResults, in search_vector_store's column layout."""
+    rows = []
+    for i, _id in enumerate(results.ids):
+        row = {"ID": _id, "Score": float(results.scores[i])}
+        if results.documents is not None:
+            row["Text"] = results.documents[i]
+        if results.metadatas is not None:
+            row.update(results.metadatas[i] or {})
+        rows.append(row)
+    return rows
+
+
+class SearchDaemon:
+    """
+    Serves one ChromaDataManager; every model and collection call runs on a single worker
+    thread. Lexical searches run on a thread of their own, so they neither block the event
+    loop on the index lock or disk nor queue behind embedding passes.
+    """
+
+    def __init__(self, data_manager, max_batch: int = 64, max_wait: float = 0.005):
+        self.data_manager = data_manager
+        # One thread: torch and the collection are not shared between concurrent calls
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.lexical_executor = ThreadPoolExecutor(max_workers=1)
+        self.embedder = MicroBatcher(self._embed_batch, self.executor, max_batch, max_wait)
+        self.searcher = MicroBatcher(self._search_batch, self.executor, max_batch, max_wait)
+
+    def _embed_batch(self, key, texts: List[str]) -> list:
+        return self.data_manager.embedding_function.embed(texts).tolist()
+
+    def _search_batch(self, key, queries: List[str]) -> list:
+        n_results, where, include_documents, mode = key
+        results = self.data_manager.search_many(
+            queries, n_results=n_results, where=json.loads(where) if where else None,
+            include_documents=include_documents, mode=mode,
+        )
+        return [_search_rows(results[i]) for i in range(len(results))]
+
+    async def _call(self, fn: Callable, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, lambda: fn(**kwargs))
+
+    async def dispatch(self, method: str, params: Dict[str, Any]):
+        if method == "ping":
+            return "pong"
+        if method == "embed":
+            return await self.embedder.submit("embed", list(params["texts"]))
+        if method == "search":
+            where = params.get("where")
+            key = (int(params.get("n_results", 10)), json.dumps(where, sort_keys=True) if where else None,
+                   bool(params.get("include_documents", True)), params.get("mode", "vector"))
+            if key[3] == "lexical":
+                # Touches neither the model nor the collection: no need to wait for a batch
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.lexical_executor, self._search_batch, key, list(params["queries"]))
+            return await self.searcher.submit(key, list(params["queries"]))
+        if method in ("add_documents", "upsert_documents", "delete_documents"):
+            return await self._call(getattr(self.data_manager, method), **params)
+        if method == "count":
+            return await self._call(self.data_manager.collection.count)
+        if method == "stats":
+            return {
+                "count": await self._call(self.data_manager.collection.count),
+                "caches": self.data_manager.cache_stats(),
+                "embed_batching": self.embedder.stats(),
+                "search_batching": self.searcher.stats(),
+            }
+        if method == "metrics":
+            from scripts.metrics import METRICS
+
+            return METRICS.to_prometheus() if params.get("format") == "prometheus" else METRICS.snapshot()
+        raise ValueError(f"Unknown method: {method}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    result = await self.dispatch(request["method"], request.get("params") or {})
+                    response = {"id": request_id, "result": result}
+                except Exception as e:
+                    response = {"id": request_id, "error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response, default=str).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str):
+        kind, target = parse_address(address)
+        limit = 1 << 26  # a batch of documents can be far longer than asyncio's 64 KiB default
+        if kind == "unix":
+            if os.path.exists(target):
+                os.remove(target)
+            server = await asyncio.start_unix_server(self.handle, path=target, limit=limit)
+        else:
+            server = await asyncio.start_server(self.handle, host=target[0], port=target[1], limit=limit)
+        logger.info(f"Search daemon listening on {address}")
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv: List[str] = None):
+    from scripts.config import DATA_PATH, SEARCH_DAEMON_ADDRESS
+
+    parser = argparse.ArgumentParser(description="Keep an embedding model and collection warm for fast queries.")
+    parser.add_argument("--collection", default="textCollection")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--data-path", default=DATA_PATH)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--backend", default="chroma", choices=["chroma", "mmap"])
+    parser.add_argument("--shard-by", choices=["file_source", "hash"], help="open a sharded collection")
+    parser.add_argument("--num-shards", type=int, default=8)
+    parser.add_argument("--lexical", action="store_true",
+                        help="keep a BM25 index for the lexical, prefilter and hybrid search modes")
+    parser.add_argument("--address", default=SEARCH_DAEMON_ADDRESS,
+                        help="host:port, or unix:/path/to.sock")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    from scripts.chromaDB_handler import ChromaDataManager
+
+    data_manager = ChromaDataManager(
+        model_path=args.model, collection_name=args.collection, data_path=args.data_path,
+        device=args.device, backend=args.backend, shard_by=args.shard_by, num_shards=args.num_shards,
+        lexical_index=args.lexical,
+    )
+    daemon = SearchDaemon(data_manager, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    try:
+        asyncio.run(daemon.serve(args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from scripts.metrics import METRICS
+from scripts.utils import iter_records, write_jsonl
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE_NAMES = {
+    "en": "English", "fr": "French", "de": "German", "es": "Spanish", "it": "Italian",
+    "pt": "Portuguese", "nl": "Dutch", "sv": "Swedish", "da": "Danish", "no": "Norwegian",
+    "fi": "Finnish", "pl": "Polish", "cs": "Czech", "ro": "Romanian", "hu": "Hungarian",
+    "tr": "Turkish", "el": "Greek", "ru": "Russian", "uk": "Ukrainian", "ar": "Arabic",
+    "fa": "Persian", "he": "Hebrew", "hi": "Hindi", "bn": "Bengali", "ta": "Tamil",
+    "ml": "Malayalam", "th": "Thai", "vi": "Vietnamese", "id": "Indonesian",
+    "ja": "Japanese", "ko": "Korean", "zh-cn": "Chinese", "zh-tw": "Chinese",
+}
+
+_ENGLISH_STOPWORDS = frozenset(
+    "the of and to in is that for it as was with be by on not he this are or his from at which "
+    "but have an they you were their one all we can has there been if more when will would who "
+    "so no its into than these our".split()
+)
+
+TRANSLATE_PROMPT = (
+    "You are a helpful assistant that translates {source} to {target}. "
+    "Translate the user sentence. Only the sentence, do not add anything else."
+)
+
+
+def non_latin_ratio(text: str) -> float:
+    """Share of the letters in text that are not Latin script; 0.0 when there are no letters."""
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return 0.0
+    return sum(1 for c in letters if "LATIN" not in unicodedata.name(c, "")) / len(letters)
+
+
+def quick_language(text: str) -> Optional[str]:
+    """
+    Cheap pre-check before statistical detection.
+
+    Returns "unknown" for text without letters, "en" for ASCII text dense in English
+    function words, and None when the text has to go to langdetect.
+    """
+    words = text.lower().split()
+    if not any(c.isalpha() for c in text):
+        return "unknown"
+    if text.isascii() and words:
+        stopwords = sum(1 for w in words if w.strip(".,;:!?()\"'") in _ENGLISH_STOPWORDS)
+        if stopwords / len(words) >= 0.15:
+            return "en"
+    return None
+
+
+def detect_language(text: str, sample_chars: int = 5000) -> str:
+    """Detects the language code of text: the pre-check first, langdetect on a sample otherwise."""
+    quick = quick_language(text[:sample_chars])
+    if quick is not None:
+        return quick
+    from langdetect import DetectorFactory, LangDetectException, detect
+
+    DetectorFactory.seed = 0  # langdetect is randomized; make results repeatable
+    try:
+        return detect(text[:sample_chars])
+    except LangDetectException:
+        return "unknown"
+
+
+def language_name(code: str) -> str:
+    if code == "unknown":
+        return "Unknown"
+    return LANGUAGE_NAMES.get(code.lower(), code.capitalize())
+
+
+class TranslationCache:
+    """
+    Persistent cache of LLM translations in SQLite.
+
+    Entries are keyed by a hash of (model, target language, source text), so repeated
+    boilerplate and re-runs over the same chunks never reach the LLM again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def key(text: str, target_lang: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{target_lang}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO translations VALUES (?, ?)", (key, text))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Translator:
+    """
+    Translates chunk records into target_lang with any LLM that has .invoke(messages).
+
+    - detect_per='document' detects the language once per file from a sample of its
+      text; items that are mostly non-Latin script are still detected on their own.
+      detect_per='item' detects every item.
+    - Texts that need translating are deduplicated, looked up in the cache and the
+      rest sent to the LLM on a pool of max_workers threads.
+    """
+
+    def __init__(self, llm, target_lang: str = "English", model_name: str = None, cache_path: str = None,
+                 max_workers: int = 4, detect_per: str = 'document'):
+        if detect_per not in ('document', 'item'):
+            raise ValueError(f"detect_per must be 'document' or 'item', got {detect_per!r}")
+        self.llm = llm
+        self.target_lang = target_lang
+        self.model_name = model_name or getattr(llm, "model", None) or type(llm).__name__
+        self.cache = TranslationCache(cache_path) if cache_path else None
+        self.max_workers = max_workers
+        self.detect_per = detect_per
+        self.llm_calls = 0
+        self._calls_lock = threading.Lock()
+
+    def _invoke(self, text: str, source_lang: str) -> str:
+        prompt = TRANSLATE_PROMPT.format(source=source_lang, target=self.target_lang)
+        response = self.llm.invoke([("system", prompt), ("human", text)])
+        with self._calls_lock:
+            self.llm_calls += 1
+        METRICS.inc("llm_calls_total", stage="translate")
+        return response.content if hasattr(response, "content") else str(response)
+
+    def translate_texts(self, texts: List[str], source_langs: List[str]) -> List[str]:
+        """Translates each text from its source language; identical texts are translated once."""
+        unique = {}
+        for text, source in zip(texts, source_langs):
+            unique.setdefault(text, source)
+
+        translations: Dict[str, str] = {}
+        pending = []
+        for text in unique:
+            cached = self.cache.get(TranslationCache.key(text, self.target_lang, self.model_name)) \
+                if self.cache else None
+            if cached is not None:
+                translations[text] = cached
+            else:
+                pending.append(text)
+
+        def work(text):
+            translated = self._invoke(text, unique[text])
+            if self.cache:
+                self.cache.put(TranslationCache.key(text, self.target_lang, self.model_name), translated)
+            return translated
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for text, translated in zip(pending, pool.map(work, pending)):
+                    translations[text] = translated
+        return [translations[text] for text in texts]
+
+    def translate_records(self, records: Iterable[Dict[str, Any]], text_key: str = 'text') -> List[Dict[str, Any]]:
+        """Adds translated_text and detected_language to every record, as the translation notebook did."""
+        records = list(records)
+        texts = [record.get(text_key, "") or "" for record in records]
+
+        document_lang = None
+        if self.detect_per == 'document':
+            document_lang = detect_language("\n".join(t for t in texts if t.strip()))
+
+        languages = []
+        for text in texts:
+            if not any(c.isalpha() for c in text):
+                languages.append("unknown")  # numbers, symbols: nothing to translate
+            elif document_lang is None or non_latin_ratio(text) > 0.5:
+                languages.append(detect_language(text))
+            else:
+                languages.append(document_lang)
+
+        todo = [i for i, lang in enumerate(languages)
+                if lang != "unknown" and language_name(lang) != self.target_lang]
+        translated = self.translate_texts([texts[i] for i in todo], [language_name(languages[i]) for i in todo])
+        translated_by_index = dict(zip(todo, translated))
+
+        for i, record in enumerate(records):
+            if not texts[i].strip():
+                record["translated_text"] = ""
+                record["detected_language"] = "Unknown"
+            else:
+                record["translated_text"] = translated_by_index.get(i, texts[i])
+                record["detected_language"] = language_name(languages[i])
+        return records
+
+
+def translate_directory(input_dir: str, output_dir: str, translator: Translator) -> Dict[str, List[str]]:
+    """
+    Translates every chunk file (.json or .jsonl) in input_dir into output_dir under the same name.
+
+    Returns a summary of processed and failed file names.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    summary = {"processed": [], "failed": []}
+    for path in sorted(p for p in Path(input_dir).iterdir() if p.suffix in ('.json', '.jsonl')):
+        try:
+            records = translator.translate_records(iter_records(path))
+            output_path = os.path.join(output_dir, path.name)
+            if path.suffix == '.jsonl':
+                write_jsonl(output_path, records)
+            else:
+                with open(output_path, 'w', encoding='utf-8') as f:
+                    json.dump(records, f, indent=2, ensure_ascii=False)
+            summary["processed"].append(path.name)
+        except Exception as e:
+            summary["failed"].append(path.name)
+            logger.error(f"Error translating file {path.name}: {e}")
+
+    logger.info(f"Translation completed. Files saved to: {output_dir}")
+    return summary
@@ -1,3 +1,5 @@
+import json
+import os
 import re
 
 def remove_structure_tags(text):
@@ -10,4 +12,65 @@ def remove_structure_tags(text):
     Returns:
         str: Cleaned string without tags.
     """
-    return re.sub(r'\[/?\w+\]', '', text).strip()
\ No newline at end of file
+    return re.sub(r'\[/?\w+\]', '', text).strip()
+
+def write_jsonl(path, records) -> int:
+    """
+    Streams records to a JSON Lines file, one compact JSON object per line.
+
+    The file is written to a temporary path and moved into place at the end, so readers
+    never see a partially written file.
+
+    Args:
+        path (str): Output file path.
+        records (Iterable[dict]): Records to write; consumed lazily.
+
+    Returns:
+        int: Number of records written.
+    """
+    count = 0
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                f.write('\n')
+                count += 1
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+
+def iter_jsonl(path):
+    """
+    Lazily reads a JSON Lines file.
+
+    Args:
+        path (str): Input file path.
+
+    Yields:
+        dict: One record per non-empty line.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_records(path):
+    """
+    Reads records from either a JSON Lines file (.jsonl, streamed) or a JSON array file (.json).
+
+    Args:
+        path (str): Input file path.
+
+    Yields:
+        dict: One record at a time.
+    """
+    if str(path).endswith('.jsonl'):
+        yield from iter_jsonl(path)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
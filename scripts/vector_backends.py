@@ -0,0 +1,608 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+VECTOR_DTYPES = ('float32', 'float16', 'int8')
+
+
+class VectorBackend:
+    """
+    The part of the chroma Collection API that ChromaDataManager relies on.
+
+    A chroma collection satisfies it as is; other backends implement the same methods
+    and return results in the same shape, one list per query for query().
+    """
+
+    def add(self, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None, embeddings=None):
+        raise NotImplementedError
+
+    def upsert(self, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None, embeddings=None):
+        raise NotImplementedError
+
+    def delete(self, ids: List[str] = None, where: dict = None):
+        raise NotImplementedError
+
+    def get(self, ids: List[str] = None, where: dict = None, include: List[str] = None) -> Dict[str, list]:
+        raise NotImplementedError
+
+    def query(self, query_embeddings=None, query_texts: List[str] = None, n_results: int = 10,
+              where: dict = None, include: List[str] = None) -> Dict[str, list]:
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+_OPERATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_where(metadata: dict, where: dict) -> bool:
+    """Evaluates a chroma-style metadata filter ($and, $or and the comparison operators)."""
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_where(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op not in _OPERATORS:
+                    raise ValueError(f"Unsupported where operator: {op}")
+                if not _OPERATORS[op](value, operand):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class MmapCollection(VectorBackend):
+    """
+    Exact-search vector collection stored in a memory-mapped NumPy matrix.
+
+    - vectors.npy holds one L2-normalized embedding per row, as float32, float16 or
+      int8 with a per-row scale. int8 also keeps float32 copies in originals.npy; the
+      top rescore_factor * n_results candidates are rescored against them.
+    - meta.sqlite is the sidecar with each row's ID, document and metadata. IDs and
+      metadata are held in memory for filtering; documents are only read for results.
+    - Search is a brute-force dot product over the live rows, which is the exact
+      cosine top-k.
+
+    Opening only maps the files, so small collections open at once, and processes
+    that open the same collection share its pages through the OS page cache. Use a
+    single writer process; readers pick up its commits on their next call.
+    """
+
+    def __init__(self, path: str, embedding_function: Callable = None, dtype: str = 'float32',
+                 rescore_factor: int = 4, block_rows: int = 65536, initial_capacity: int = 1024):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"dtype must be one of {VECTOR_DTYPES}, got {dtype!r}")
+        self.path = path
+        self.embedding_function = embedding_function
+        self.rescore_factor = rescore_factor
+        self.block_rows = block_rows
+        self.initial_capacity = initial_capacity
+        self._lock = threading.RLock()
+
+        os.makedirs(path, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, document TEXT, metadata TEXT)"
+        )
+        self._conn.commit()
+
+        stored = self._setting("dtype")
+        if stored is not None and stored != dtype:
+            raise ValueError(f"Collection at {path} was created with dtype {stored}, not {dtype}")
+        self.dtype = dtype
+        self._data_version = None
+        self._reload()
+
+    # ----------------------------------------------------------------- storage
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _setting(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _open_matrix(self, name: str) -> Optional[np.memmap]:
+        path = self._file(name)
+        return np.load(path, mmap_mode='r+') if os.path.exists(path) else None
+
+    def _reload(self):
+        """Re-reads the sidecar and re-maps the matrices if another connection wrote to them."""
+        # data_version only changes on commits made by other connections
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        self._data_version = data_version
+        dimension = self._setting("dimension")
+        self.dimension = int(dimension) if dimension else None
+        self._vectors = self._open_matrix("vectors.npy")
+        self._scales = self._open_matrix("scales.npy")
+        self._originals = self._open_matrix("originals.npy")
+
+        capacity = len(self._vectors) if self._vectors is not None else 0
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._metadatas: List[Optional[dict]] = [None] * capacity
+        self._live = np.zeros(capacity, dtype=bool)
+        self._row_of: Dict[str, int] = {}
+        for row, _id, metadata in self._conn.execute("SELECT row, id, metadata FROM rows"):
+            self._ids[row] = _id
+            self._metadatas[row] = json.loads(metadata) if metadata else None
+            self._live[row] = True
+            self._row_of[_id] = row
+
+    def _create_matrix(self, name: str, shape: tuple, dtype, previous: Optional[np.memmap]) -> np.memmap:
+        """Writes a new, larger matrix next to the old one and swaps it in."""
+        tmp_path = self._file(name + ".tmp")
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+        if previous is not None:
+            matrix[:len(previous)] = previous
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, self._file(name))
+        return self._open_matrix(name)
+
+    def _ensure_capacity(self, rows_needed: int, dimension: int):
+        if self.dimension is None:
+            self.dimension = dimension
+            self._conn.execute("INSERT OR REPLACE INTO settings VALUES ('dimension', ?)", (str(dimension),))
+            self._conn.execute("INSERT OR REPLACE INTO settings VALUES ('dtype', ?)", (self.dtype,))
+        elif dimension != self.dimension:
+            raise ValueError(f"Embedding dimension {dimension} does not match the collection's {self.dimension}")
+
+        capacity = len(self._live)
+        if rows_needed <= capacity:
+            return
+        new_capacity = max(rows_needed, 2 * capacity, self.initial_capacity)
+        self._vectors = self._create_matrix("vectors.npy", (new_capacity, dimension), self.dtype, self._vectors)
+        if self.dtype == 'int8':
+            self._scales = self._create_matrix("scales.npy", (new_capacity,), np.float32, self._scales)
+            self._originals = self._create_matrix(
+                "originals.npy", (new_capacity, dimension), np.float32, self._originals
+            )
+        grow = new_capacity - capacity
+        self._ids.extend([None] * grow)
+        self._metadatas.extend([None] * grow)
+        self._live = np.concatenate([self._live, np.zeros(grow, dtype=bool)])
+
+    def _write_vectors(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.dtype == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self._vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+            self._originals[rows] = vectors
+            self._scales.flush()
+            self._originals.flush()
+        else:
+            self._vectors[rows] = vectors.astype(self.dtype)
+        self._vectors.flush()
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError("No embeddings given and the collection has no embedding function")
+        embed = getattr(self.embedding_function, "embed", None)
+        return embed(texts) if embed is not None else np.asarray(self.embedding_function(texts))
+
+    # ------------------------------------------------------------------ writes
+
+    def _write(self, ids: List[str], documents: List[str], metadatas: List[dict], embeddings, overwrite: bool):
+        with self._lock:
+            self._reload()
+            if not overwrite:
+                keep = [i for i, _id in enumerate(ids) if _id not in self._row_of]
+                ids = [ids[i] for i in keep]
+                documents = [documents[i] for i in keep] if documents is not None else None
+                metadatas = [metadatas[i] for i in keep] if metadatas is not None else None
+                embeddings = [embeddings[i] for i in keep] if embeddings is not None else None
+            if not ids:
+                return
+            if embeddings is None:
+                embeddings = self._embed(list(documents))
+            vectors = self._normalize(embeddings)
+
+            free = iter(np.flatnonzero(~self._live))
+            assigned: Dict[str, int] = {}
+            rows, new_rows = [], 0
+            for _id in ids:
+                row = self._row_of.get(_id, assigned.get(_id))
+                if row is None:
+                    row = next(free, None)
+                    if row is None:
+                        row = len(self._live) + new_rows
+                        new_rows += 1
+                    assigned[_id] = int(row)
+                rows.append(int(row))
+
+            documents = documents if documents is not None else [None] * len(ids)
+            metadatas = metadatas if metadatas is not None else [None] * len(ids)
+            try:
+                self._ensure_capacity(max(rows) + 1, vectors.shape[1])
+                self._write_vectors(np.array(rows), vectors)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rows VALUES (?, ?, ?, ?)",
+                    [(row, _id, doc, json.dumps(meta) if meta is not None else None)
+                     for row, _id, doc, meta in zip(rows, ids, documents, metadatas)]
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                self._data_version = None  # re-read everything on the next call
+                raise
+            self._row_of.update(assigned)
+            for row, _id, meta in zip(rows, ids, metadatas):
+                self._ids[row] = _id
+                self._metadatas[row] = meta
+                self._live[row] = True
+
+    def add(self, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None, embeddings=None):
+        """Adds new entries; IDs that already exist are left unchanged, as chroma does."""
+        self._write(ids, documents, metadatas, embeddings, overwrite=False)
+
+    def upsert(self, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None, embeddings=None):
+        self._write(ids, documents, metadatas, embeddings, overwrite=True)
+
+    def delete(self, ids: List[str] = None, where: dict = None):
+        with self._lock:
+            self._reload()
+            rows = self._select_rows(ids, where)
+            self._conn.executemany("DELETE FROM rows WHERE row = ?", [(int(row),) for row in rows])
+            self._conn.commit()
+            for row in rows:
+                del self._row_of[self._ids[row]]
+                self._ids[row] = None
+                self._metadatas[row] = None
+                self._live[row] = False
+
+    # ------------------------------------------------------------------- reads
+
+    def _select_rows(self, ids: List[str] = None, where: dict = None) -> np.ndarray:
+        if ids is not None:
+            rows = [self._row_of[_id] for _id in ids if _id in self._row_of]
+        else:
+            rows = np.flatnonzero(self._live).tolist()
+        if where:
+            rows = [row for row in rows if matches_where(self._metadatas[row] or {}, where)]
+        return np.array(rows, dtype=np.int64)
+
+    def _documents(self, rows: List[int]) -> List[Optional[str]]:
+        documents = {}
+        for i in range(0, len(rows), 500):
+            batch = [int(row) for row in rows[i:i + 500]]
+            documents.update(self._conn.execute(
+                f"SELECT row, document FROM rows WHERE row IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return [documents.get(int(row)) for row in rows]
+
+    def _exact_vectors(self, rows: np.ndarray) -> np.ndarray:
+        source = self._originals if self.dtype == 'int8' else self._vectors
+        return np.asarray(source[rows], dtype=np.float32)
+
+    def _scores(self, rows: np.ndarray, queries: np.ndarray) -> np.ndarray:
+        """(len(rows), len(queries)) similarity matrix, computed a block of rows at a time."""
+        scores = np.empty((len(rows), len(queries)), dtype=np.float32)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start:start + self.block_rows]
+            scores[start:start + len(block)] = np.asarray(self._vectors[block], dtype=np.float32) @ queries.T
+            if self.dtype == 'int8':
+                scores[start:start + len(block)] *= self._scales[block][:, None]
+        return scores
+
+    def count(self) -> int:
+        with self._lock:
+            self._reload()
+            return int(self._live.sum())
+
+    def get(self, ids: List[str] = None, where: dict = None, include: List[str] = None) -> Dict[str, list]:
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            self._reload()
+            rows = self._select_rows(ids, where)
+            result = {"ids": [self._ids[row] for row in rows]}
+            if "documents" in include:
+                result["documents"] = self._documents(rows.tolist())
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[row] for row in rows]
+            if "embeddings" in include:
+                result["embeddings"] = list(self._exact_vectors(rows)) if len(rows) else []
+            return result
+
+    def query(self, query_embeddings=None, query_texts: List[str] = None, n_results: int = 10,
+              where: dict = None, include: List[str] = None) -> Dict[str, list]:
+        include = include if include is not None else ["documents", "metadatas", "distances"]
+        if query_embeddings is None:
+            query_embeddings = self._embed(list(query_texts))
+        queries = self._normalize(query_embeddings)
+        result = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+
+        with self._lock:
+            self._reload()
+            rows = self._select_rows(where=where) if self.dimension else np.array([], dtype=np.int64)
+            scores = self._scores(rows, queries)
+            k = min(n_results, len(rows))
+            # int8 scores are approximate: take more candidates and rescore them exactly
+            candidates = min(len(rows), k * self.rescore_factor) if self.dtype == 'int8' else k
+
+            for q in range(len(queries)):
+                column = scores[:, q]
+                top = np.argpartition(-column, candidates - 1)[:candidates] if candidates else np.array([], dtype=int)
+                top_scores = column[top]
+                if self.dtype == 'int8' and len(top):
+                    top_scores = self._exact_vectors(rows[top]) @ queries[q]
+                order = np.argsort(-top_scores, kind='stable')[:k]
+                hit_rows = rows[top[order]].tolist()
+                result["ids"].append([self._ids[row] for row in hit_rows])
+                result["distances"].append((1 - top_scores[order]).tolist())
+                result["metadatas"].append([self._metadatas[row] for row in hit_rows])
+                result["documents"].append(self._documents(hit_rows) if "documents" in include else None)
+
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+            self._vectors = self._scales = self._originals = None
+
+
+SHARD_STRATEGIES = ('file_source', 'hash')
+
+
+def where_values(where: Optional[dict], field: str) -> Optional[set]:
+    """
+    The values of field a chroma-style filter can match, or None when it does not
+    restrict field. {"file_source": "a.jsonl"} gives {"a.jsonl"}, $in gives its list,
+    $and intersects its clauses and $or unites them.
+    """
+    if not where:
+        return None
+    allowed = None
+    for key, condition in where.items():
+        if key == "$and":
+            values = [where_values(clause, field) for clause in condition]
+        elif key == "$or":
+            values = [where_values(clause, field) for clause in condition]
+            values = [None if any(v is None for v in values) else set().union(*values)]
+        elif key == field and isinstance(condition, dict):
+            values = [{condition["$eq"]} if "$eq" in condition else set(condition["$in"]) if "$in" in condition else None]
+        elif key == field:
+            values = [{condition}]
+        else:
+            continue
+        for value in values:
+            if value is not None:
+                allowed = value if allowed is None else allowed & value
+    return allowed
+
+
+class ShardedCollection(VectorBackend):
+    """
+    A collection split over independent shard collections.
+
+    Every entry is routed to one shard by shard_by:
+    - 'file_source': one shard per source file (the entry's file_source metadata)
+    - 'hash': num_shards shards by a stable hash of the entry ID
+    - a callable (id, metadata) -> shard key, for any other partitioning
+
+    open_shard(key) opens or creates the collection of a shard (a chroma collection or
+    any other VectorBackend), so each shard has its own index: re-indexing one source
+    only writes to its shard, and drop_shard() removes one without touching the rest.
+    The shard keys are kept in registry_path.
+
+    query() embeds the queries once, searches the shards on a thread pool and merges
+    the hits into a global top n_results by distance. A where filter on file_source
+    (or, for a callable shard_by, whatever route(where) returns) skips the shards it
+    rules out; other reads and deletes fan out to every shard.
+    """
+
+    def __init__(self, open_shard: Callable[[str], VectorBackend], registry_path: str,
+                 shard_by='file_source', num_shards: int = 8, route: Callable[[dict], Optional[set]] = None,
+                 drop_shard: Callable[[str], None] = None, embedding_function: Callable = None,
+                 max_workers: int = None):
+        if not callable(shard_by) and shard_by not in SHARD_STRATEGIES:
+            raise ValueError(f"shard_by must be a callable or one of {SHARD_STRATEGIES}, got {shard_by!r}")
+        self.shard_by = shard_by
+        self.num_shards = num_shards
+        self.route = route
+        self.registry_path = registry_path
+        self.embedding_function = embedding_function
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._open_shard = open_shard
+        self._drop_shard = drop_shard
+        self._lock = threading.RLock()
+        self._executor = None
+        self._shards: Dict[str, VectorBackend] = {}
+
+        strategy = shard_by if isinstance(shard_by, str) else "custom"
+        registry = {"shard_by": strategy, "num_shards": num_shards, "shards": []}
+        if os.path.exists(registry_path):
+            with open(registry_path, "r", encoding="utf-8") as f:
+                registry = json.load(f)
+            if registry["shard_by"] != strategy or (strategy == "hash" and registry["num_shards"] != num_shards):
+                stored = registry["shard_by"] + (f" into {registry['num_shards']}" if registry["shard_by"] == "hash" else "")
+                raise ValueError(f"Collection at {registry_path} is sharded by {stored}, not {strategy}")
+        self._registry = registry
+        for key in registry["shards"]:
+            self._shards[key] = open_shard(key)
+
+    # ----------------------------------------------------------------- shards
+
+    def _save_registry(self):
+        os.makedirs(os.path.dirname(self.registry_path) or ".", exist_ok=True)
+        tmp_path = self.registry_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._registry, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.registry_path)
+
+    def shard_key(self, id: str, metadata: dict = None) -> str:
+        if self.shard_by == 'file_source':
+            return str((metadata or {}).get("file_source", ""))
+        if self.shard_by == 'hash':
+            return f"{int(hashlib.sha1(id.encode('utf-8')).hexdigest(), 16) % self.num_shards:03d}"
+        return str(self.shard_by(id, metadata or {}))
+
+    def shard_keys(self) -> List[str]:
+        with self._lock:
+            return list(self._shards)
+
+    def shard(self, key: str, create: bool = False) -> Optional[VectorBackend]:
+        with self._lock:
+            if key not in self._shards and create:
+                self._shards[key] = self._open_shard(key)
+                self._registry["shards"].append(key)
+                self._save_registry()
+            return self._shards.get(key)
+
+    def drop_shard(self, key: str) -> bool:
+        """Deletes a shard and its index; the next write to that key starts it afresh."""
+        with self._lock:
+            shard = self._shards.pop(key, None)
+            if shard is None:
+                return False
+            self._registry["shards"].remove(key)
+            self._save_registry()
+        if hasattr(shard, "close"):
+            shard.close()
+        if self._drop_shard is not None:
+            self._drop_shard(key)
+        return True
+
+    def _route(self, where: dict = None) -> List[str]:
+        """The shards a filter can match, in registry order."""
+        if self.shard_by == 'file_source':
+            allowed = where_values(where, "file_source")
+            allowed = {str(value) for value in allowed} if allowed is not None else None
+        elif self.route is not None and where:
+            allowed = self.route(where)
+        else:
+            allowed = None
+        keys = self.shard_keys()
+        return keys if allowed is None else [key for key in keys if key in allowed]
+
+    def _map(self, fn: Callable, keys: List[str]) -> list:
+        """Calls fn(shard) on the given shards in parallel; results are in the order of keys."""
+        shards = [self._shards[key] for key in keys if key in self._shards]
+        if len(shards) <= 1:
+            return [fn(shard) for shard in shards]
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="shard")
+        return list(self._executor.map(fn, shards))
+
+    # ----------------------------------------------------------------- writes
+
+    def _write(self, method: str, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None,
+               embeddings=None):
+        groups: Dict[str, List[int]] = {}
+        for i, _id in enumerate(ids):
+            groups.setdefault(self.shard_key(_id, metadatas[i] if metadatas else None), []).append(i)
+        for key, positions in groups.items():
+            pick = lambda values: [values[i] for i in positions] if values is not None else None
+            getattr(self.shard(key, create=True), method)(
+                ids=pick(ids), documents=pick(documents), metadatas=pick(metadatas), embeddings=pick(embeddings)
+            )
+
+    def add(self, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None, embeddings=None):
+        self._write("add", ids, documents, metadatas, embeddings)
+
+    def upsert(self, ids: List[str], documents: List[str] = None, metadatas: List[dict] = None, embeddings=None):
+        self._write("upsert", ids, documents, metadatas, embeddings)
+
+    def delete(self, ids: List[str] = None, where: dict = None):
+        keys = self._route(where)
+        if ids is not None and self.shard_by == 'hash':
+            keys = [key for key in keys if key in {self.shard_key(_id) for _id in ids}]
+        self._map(lambda shard: shard.delete(ids=ids, where=where), keys)
+
+    # ------------------------------------------------------------------ reads
+
+    def count(self) -> int:
+        return sum(self._map(lambda shard: shard.count(), self.shard_keys()))
+
+    def get(self, ids: List[str] = None, where: dict = None, include: List[str] = None) -> Dict[str, list]:
+        include = include if include is not None else ["documents", "metadatas"]
+        parts = self._map(lambda shard: shard.get(ids=ids, where=where, include=include), self._route(where))
+        result = {"ids": [_id for part in parts for _id in part["ids"]]}
+        for key in ("documents", "metadatas", "embeddings"):
+            if key in include:
+                result[key] = []
+                for part in parts:
+                    # chroma returns embeddings as an ndarray, which has no truth value
+                    values = part.get(key)
+                    if values is not None:
+                        result[key].extend(values)
+        return result
+
+    def query(self, query_embeddings=None, query_texts: List[str] = None, n_results: int = 10,
+              where: dict = None, include: List[str] = None) -> Dict[str, list]:
+        include = include if include is not None else ["documents", "metadatas", "distances"]
+        if query_embeddings is None:
+            query_embeddings = list(self.embedding_function(list(query_texts)))
+        query_embeddings = list(query_embeddings)
+        shard_include = list(dict.fromkeys([*include, "distances"]))
+
+        parts = self._map(lambda shard: shard.query(query_embeddings=query_embeddings, n_results=n_results,
+                                                    where=where, include=shard_include), self._route(where))
+        result = {"ids": [], "distances": [], "documents": [], "metadatas": []}
+        for q in range(len(query_embeddings)):
+            hits = []
+            for part in parts:
+                documents = part.get("documents")
+                metadatas = part.get("metadatas")
+                for j, (_id, distance) in enumerate(zip(part["ids"][q], part["distances"][q])):
+                    hits.append((distance, _id, documents[q][j] if documents and documents[q] else None,
+                                 metadatas[q][j] if metadatas and metadatas[q] else None))
+            hits.sort(key=lambda hit: hit[0])
+            hits = hits[:n_results]
+            result["distances"].append([hit[0] for hit in hits])
+            result["ids"].append([hit[1] for hit in hits])
+            result["documents"].append([hit[2] for hit in hits])
+            result["metadatas"].append([hit[3] for hit in hits])
+
+        for key in ("documents", "metadatas", "distances"):
+            if key not in include:
+                result[key] = None
+        return result
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+            for shard in self._shards.values():
+                if hasattr(shard, "close"):
+                    shard.close()
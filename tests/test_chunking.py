@@ -0,0 +1,62 @@
+import re
+
+from scripts.chunkingAlgorithm import HierarchicalChunker, item_text
+from scripts.document import Cell, Item, TableItem
+
+
+class _NewlineTokenizer:
+    """Counts words and line breaks, like BPE tokenizers that encode "\n" as a token of its own."""
+
+    def encode(self, text):
+        return re.findall(r"\S+|\n", text)
+
+
+def _table(rows, cols=3):
+    return TableItem([[Cell(f"r{r}c{c}", r, c) for c in range(cols)] for r in range(rows)], 0, 1)
+
+
+def _assert_within_budget(chunker, chunks):
+    assert chunks
+    for chunk in chunks:
+        assert chunk["tokens"] <= chunker.max_tokens
+        for item in chunk["content"]:
+            assert chunker.counter.count(item_text(item)) <= chunker.max_tokens
+
+
+def test_oversized_table_chunks_stay_within_budget():
+    chunker = HierarchicalChunker(max_tokens=20, model=_NewlineTokenizer())
+    table = _table(12)
+    chunks = chunker.chunk([table])
+
+    _assert_within_budget(chunker, chunks)
+    rows = [row for chunk in chunks for part in chunk["content"] for row in part.content]
+    assert rows == table.content
+
+
+def test_long_sentences_stay_within_budget():
+    chunker = HierarchicalChunker(max_tokens=20, model=_NewlineTokenizer())
+    text = ". ".join(" ".join(f"w{s}_{n}" for n in range(s * 7 % 45 + 3)) for s in range(10))
+    chunks = chunker.chunk([Item("Paragraph", text, 0, 1)])
+
+    _assert_within_budget(chunker, chunks)
+    words = [word for chunk in chunks for item in chunk["content"] for word in re.findall(r"w\d+_\d+", item.text)]
+    assert words == re.findall(r"w\d+_\d+", text)
+
+
+def test_mixed_document_stays_within_budget_and_in_order():
+    chunker = HierarchicalChunker(max_tokens=20, model=_NewlineTokenizer())
+    items = [
+        Item("Heading", "Results", 0, 1),
+        Item("Paragraph", "short intro.", 0, 1),
+        Item("Paragraph", " ".join(f"long{n}" for n in range(50)), 0, 1),
+        _table(3, cols=2),
+        _table(9),
+        Item("Paragraph", "closing words.", 1, 2),
+    ]
+    chunks = chunker.chunk(items)
+
+    _assert_within_budget(chunker, chunks)
+    assert chunks[0]["content"][:2] == items[:2]
+    assert chunks[-1]["content"][-1] is items[-1]
+    assert [page for chunk in chunks for page in chunk["page_numbers"]] == sorted(
+        page for chunk in chunks for page in chunk["page_numbers"])
@@ -0,0 +1,34 @@
+from scripts.dedup import ChunkDeduplicator
+from scripts.ingest import dedup_directory
+from scripts.utils import iter_records, write_jsonl
+
+BASE = ("The total cost is calculated from the fixed cost of the plant and the variable cost of each unit "
+        "produced, which depends on the price of raw materials, energy and labour in the region during the year")
+NEAR = BASE.replace("during the year", "during that year")
+OTHER = ("Participants completed the questionnaire twice, once before the training sessions and once after "
+         "them, and their answers were compared with those of a control group recruited at the same time")
+
+
+def test_near_duplicate_pair_is_detected():
+    deduplicator = ChunkDeduplicator()
+    assert deduplicator.add("a", BASE) is None
+    assert deduplicator.add("b", NEAR) == {"canonical": "a", "kind": "near"}
+    assert deduplicator.add("c", "  " + BASE.upper() + " ") == {"canonical": "a", "kind": "exact"}
+    assert deduplicator.add("d", OTHER) is None
+
+
+def test_dedup_directory_drops_near_duplicates_across_files(tmp_path):
+    chunks = tmp_path / "chunks"
+    chunks.mkdir()
+    write_jsonl(str(chunks / "a.jsonl"), [{"text": BASE, "chunk_number": 0, "file_source": "a.pdf"},
+                                          {"text": OTHER, "chunk_number": 1, "file_source": "a.pdf"}])
+    write_jsonl(str(chunks / "b.jsonl"), [{"text": NEAR, "chunk_number": 0, "file_source": "b.pdf"}])
+
+    summary = dedup_directory(str(chunks), str(tmp_path / "deduped"))
+    assert summary["processed"] == ["a.jsonl", "b.jsonl"]
+
+    kept = list(iter_records(tmp_path / "deduped" / "a.jsonl"))
+    assert [r["text"] for r in kept] == [BASE, OTHER]
+    assert kept[0]["duplicate_sources"] == "b.pdf#0" and kept[0]["duplicate_count"] == 1
+    assert kept[1]["duplicate_count"] == 0
+    assert list(iter_records(tmp_path / "deduped" / "b.jsonl")) == []
@@ -0,0 +1,41 @@
+import numpy as np
+
+from scripts.benchmark import HashingEngine
+from scripts.chromaDB_handler import ChromaDataManager
+from scripts.embedding_cache import EmbeddingCache
+
+TEXTS = ["The feed pump delivers 40 litres per minute.", "Check valve CV-77 stops backflow."]
+
+
+def test_cache_is_keyed_by_output_options(tmp_path):
+    path = str(tmp_path / "embedding_cache.sqlite")
+    vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+    EmbeddingCache(path, "model").put_many(TEXTS, vectors)
+
+    # A new process finds the vectors on disk, whitespace differences aside
+    reopened = EmbeddingCache(path, "model")
+    found = reopened.get_many(["  " + TEXTS[0], TEXTS[1]])
+    assert all(np.array_equal(vector, expected) for vector, expected in zip(found, vectors))
+    assert reopened.stats()["hits_disk"] == 2
+
+    normalized = EmbeddingCache(path, "model", options={"normalize_embeddings": True})
+    assert normalized.get_many(TEXTS) == [None, None]
+    assert EmbeddingCache(path, "other-model").get_many(TEXTS) == [None, None]
+
+
+def _manager(data_path, **engine_options):
+    return ChromaDataManager(model_path="hashing", collection_name="test", data_path=data_path, backend="chroma",
+                             engine_options={"engine": HashingEngine(), **engine_options})
+
+
+def test_changing_normalize_embeddings_misses_the_cache(tmp_path):
+    _manager(str(tmp_path)).embedding_function.embed(TEXTS)
+
+    default = _manager(str(tmp_path), normalize_embeddings=False)
+    default.embedding_function.embed(TEXTS)
+    assert default.cache_stats()["embedding"]["hits_disk"] == 2
+
+    normalized = _manager(str(tmp_path), normalize_embeddings=True)
+    normalized.embedding_function.embed(TEXTS)
+    stats = normalized.cache_stats()["embedding"]
+    assert (stats["hits_memory"], stats["hits_disk"], stats["misses"]) == (0, 0, 2)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from scripts.ingest import process_and_upload_all_jsons
+from scripts.manifest import IngestManifest
+from scripts.utils import write_jsonl
+
+
+class _Embedder:
+    def embed(self, texts):
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class _FlakyManager:
+    """In-memory stand-in for ChromaDataManager whose upsert fails once on a chosen call."""
+
+    collection_name = "test"
+    model_path = "test"
+
+    def __init__(self, fail_on_call=None):
+        self.embedding_function = _Embedder()
+        self.store = {}
+        self.fail_on_call = fail_on_call
+        self.calls = 0
+
+    def upsert_documents(self, documents, metadatas, ids, embeddings=None):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            return False
+        self.store.update(zip(ids, metadatas))
+        return True
+
+    def delete_documents(self, ids=None, where=None):
+        if where:
+            ids = [i for i, meta in self.store.items() if meta.get("file_source") == where["file_source"]]
+        for i in ids or []:
+            self.store.pop(i, None)
+        return True
+
+
+def test_first_upload_resumes_after_crash(tmp_path):
+    chunks = tmp_path / "chunks"
+    chunks.mkdir()
+    write_jsonl(str(chunks / "doc.jsonl"),
+                [{"text": f"chunk {n}", "chunk_number": n, "file_source": "doc.pdf"} for n in range(10)])
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    journal = str(tmp_path / "journal.jsonl")
+
+    manager = _FlakyManager(fail_on_call=3)
+    summary = process_and_upload_all_jsons(manager, str(chunks), manifest, batch_size=3, journal_path=journal)
+    assert summary["failed"] == ["doc.jsonl"]
+    assert len(manager.store) == 6
+
+    # Re-run in a fresh process: same store, same journal, no manifest entry yet
+    manager.fail_on_call = None
+    summary = process_and_upload_all_jsons(manager, str(chunks), manifest, batch_size=3, journal_path=journal)
+    assert summary["processed"] == ["doc.jsonl"]
+    assert len(manager.store) == 10
+    assert set(manifest.get("embed", "doc.jsonl")["ids"]) == set(manager.store)
@@ -0,0 +1,67 @@
+from scripts.benchmark import HashingEngine
+from scripts.chromaDB_handler import RRF_K, ChromaDataManager
+from scripts.lexical_index import BM25Index
+
+DOCS = {
+    "pump": "The feed pump AB-1234 delivers 40 litres per minute at full load.",
+    "valve": "Check valve CV-77 stops backflow into the feed pump.",
+    "motor": "The motor drives the pump through a flexible coupling.",
+    "filter": "Replace the inlet filter every six months.",
+    "tank": "The storage tank holds 500 litres of treated water.",
+    "gauge": "A pressure gauge is fitted after the pump outlet.",
+    "manual": "See the maintenance manual for the pump warranty terms.",
+    "seal": "Worn shaft seals cause the pump to leak.",
+}
+
+
+def test_top_hit_is_correct_after_segment_merges(tmp_path):
+    index = BM25Index(str(tmp_path / "merged"), merge_factor=2)
+    for _id, text in DOCS.items():
+        index.add([_id], [text], [{"file_source": f"{_id}.pdf"}])
+    index.upsert(["filter"], ["Replace the AB-1234 pump filter every six months."], [{"file_source": "filter.pdf"}])
+    index.delete(ids=["seal"])
+    # Log-tier merging keeps far fewer segments than writes
+    assert index.stats()["segments"] < len(DOCS)
+
+    single = BM25Index(str(tmp_path / "single"))
+    live = {**DOCS, "filter": "Replace the AB-1234 pump filter every six months."}
+    live.pop("seal")
+    single.add(list(live), list(live.values()), [{"file_source": f"{_id}.pdf"} for _id in live])
+
+    for query in ("AB-1234", "1234 pump", "backflow", "pump leak"):
+        merged = index.query([query], n_results=3)
+        assert merged["ids"] == single.query([query], n_results=3)["ids"]
+        assert merged["scores"] == single.query([query], n_results=3)["scores"]
+    # The upserted text is searchable and the deleted one is gone
+    assert sorted(index.query(["AB-1234"], n_results=3)["ids"][0]) == ["filter", "pump"]
+    assert index.query(["leak"], n_results=3)["ids"] == [[]]
+
+    index.compact()
+    assert index.stats()["segments"] == 1
+    reopened = BM25Index(str(tmp_path / "merged"))
+    assert reopened.query(["AB-1234 delivers"], n_results=2)["ids"] == [["pump", "filter"]]
+
+
+def test_hybrid_search_fuses_lexical_and_vector_ranks(tmp_path):
+    manager = ChromaDataManager(
+        model_path="hashing", collection_name="test", data_path=str(tmp_path), cache_embeddings=False,
+        backend="chroma", engine_options={"engine": HashingEngine()}, lexical_index=True,
+        lexical_candidates=len(DOCS), query_cache_size=0,
+    )
+    assert manager.add_documents(list(DOCS.values()), [{"file_source": f"{_id}.pdf"} for _id in DOCS], list(DOCS))
+
+    query = "feed pump AB-1234 delivers litres"
+    lexical = manager.search_many([query], n_results=len(DOCS), mode="lexical")
+    vector = manager.search_many([query], n_results=len(DOCS), mode="vector")
+    expected = {}
+    for ranking in (lexical.ids, vector.ids):
+        for rank, _id in enumerate(ranking):
+            expected[_id] = expected.get(_id, 0.0) + 1 / (RRF_K + rank + 1)
+
+    hybrid = manager.search_many([query], n_results=3, mode="hybrid")
+    assert list(hybrid.ids) == sorted(expected, key=lambda _id: -expected[_id])[:3]
+    for _id, score in zip(hybrid.ids, hybrid.scores):
+        assert abs(expected[_id] - score) < 1e-6
+    # Ranked first by both, so it gets the maximum fused score
+    assert lexical.ids[0] == vector.ids[0] == hybrid.ids[0] == "pump"
+    assert abs(hybrid.scores[0] - 2 / (RRF_K + 1)) < 1e-6
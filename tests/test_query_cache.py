@@ -0,0 +1,36 @@
+from scripts.benchmark import HashingEngine
+from scripts.chromaDB_handler import ChromaDataManager
+
+DOCS = {
+    "pump": "The feed pump AB-1234 delivers 40 litres per minute.",
+    "valve": "Check valve CV-77 stops backflow into the feed pump.",
+    "tank": "The storage tank holds 500 litres of treated water.",
+}
+
+
+def test_upsert_invalidates_cached_queries(tmp_path):
+    manager = ChromaDataManager(
+        model_path="hashing", collection_name="test", data_path=str(tmp_path), cache_embeddings=False,
+        backend="chroma", engine_options={"engine": HashingEngine()}, lexical_index=True,
+    )
+    assert manager.add_documents(list(DOCS.values()), [{"file_source": f"{_id}.pdf"} for _id in DOCS], list(DOCS))
+
+    for mode in ("vector", "lexical"):
+        first = manager.search_many(["AB-1234 feed pump"], n_results=2, mode=mode)
+        again = manager.search_many(["  AB-1234  feed pump "], n_results=2, mode=mode)
+        assert list(again.ids) == list(first.ids) and again.documents == first.documents
+    stats = manager.cache_stats()["query"]
+    assert (stats["hits"], stats["misses"], stats["items"]) == (2, 2, 2)
+
+    updated = "The feed pump AB-1234 was replaced by model AB-2000 in 2021."
+    manager.upsert_documents([updated], [{"file_source": "pump.pdf"}], ["pump"])
+    for mode in ("vector", "lexical"):
+        fresh = manager.search_many(["AB-1234 feed pump"], n_results=2, mode=mode)
+        assert updated in fresh.documents
+        assert DOCS["pump"] not in fresh.documents
+    stats = manager.cache_stats()["query"]
+    assert (stats["hits"], stats["misses"], stats["stale"]) == (2, 4, 2)
+
+    # The refreshed results are cached again until the next write
+    manager.search_many(["AB-1234 feed pump"], n_results=2, mode="lexical")
+    assert manager.cache_stats()["query"]["hits"] == 3
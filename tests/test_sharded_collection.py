@@ -0,0 +1,73 @@
+import numpy as np
+
+from scripts.benchmark import HashingEngine
+from scripts.chromaDB_handler import ChromaDataManager
+
+
+def _sharded_manager(tmp_path, **options):
+    return ChromaDataManager(
+        model_path="hashing", collection_name="test", data_path=str(tmp_path), cache_embeddings=False,
+        backend="chroma", engine_options={"engine": HashingEngine()}, shard_by="file_source", **options,
+    )
+
+
+def _add(manager):
+    ids = [f"{source}_{n}" for source in ("a.pdf", "b.pdf") for n in range(3)]
+    documents = [f"pump valve {n} in {source}" for source in ("a.pdf", "b.pdf") for n in range(3)]
+    metadatas = [{"file_source": source, "chunk_number": n} for source in ("a.pdf", "b.pdf") for n in range(3)]
+    assert manager.add_documents(documents, metadatas, ids)
+    return ids
+
+
+def test_sharded_chroma_get_with_embeddings(tmp_path):
+    manager = _sharded_manager(tmp_path)
+    ids = _add(manager)
+
+    result = manager.collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+    assert sorted(result["ids"]) == sorted(ids)
+    assert np.asarray(result["embeddings"]).shape == (len(ids), HashingEngine().dimension)
+    assert len(result["documents"]) == len(result["metadatas"]) == len(ids)
+
+
+def test_prefilter_search_on_sharded_collection(tmp_path):
+    manager = _sharded_manager(tmp_path, lexical_index=True, query_cache_size=0)
+    _add(manager)
+
+    prefilter = manager.search_many(["pump valve 1"], n_results=3, mode="prefilter")
+    vector = manager.search_many(["pump valve 1"], n_results=6, mode="vector")
+    assert len(prefilter.ids) == 3
+    # Re-ranked by the same cosine similarity a vector search reports
+    vector_scores = dict(zip(vector.ids, vector.scores))
+    for _id, score in zip(prefilter.ids, prefilter.scores):
+        assert abs(vector_scores[_id] - score) < 1e-5
+
+    filtered = manager.search_many(["pump valve"], n_results=6, mode="prefilter", where={"file_source": "b.pdf"})
+    assert sorted(filtered.ids) == ["b.pdf_0", "b.pdf_1", "b.pdf_2"]
+
+
+def test_fan_out_search_matches_unsharded_collection(tmp_path):
+    sharded = _sharded_manager(tmp_path / "sharded", query_cache_size=0)
+    plain = ChromaDataManager(
+        model_path="hashing", collection_name="test", data_path=str(tmp_path / "plain"), cache_embeddings=False,
+        backend="chroma", engine_options={"engine": HashingEngine()}, query_cache_size=0,
+    )
+    _add(sharded)
+    _add(plain)
+    assert sorted(sharded.shard_keys()) == ["a.pdf", "b.pdf"]
+
+    # The per-shard hits merge into the same global ranking as a single collection
+    merged = sharded.search_many(["pump valve 1 in b.pdf"], n_results=6)
+    single = plain.search_many(["pump valve 1 in b.pdf"], n_results=6)
+    assert merged.ids[0] == single.ids[0] == "b.pdf_1"
+    assert list(merged.scores) == sorted(merged.scores, reverse=True)
+    single_scores = dict(zip(single.ids, single.scores))
+    for _id, score in zip(merged.ids, merged.scores):
+        assert abs(single_scores[_id] - score) < 1e-5
+
+    filtered = sharded.search_many(["pump valve 1"], n_results=6, where={"file_source": "a.pdf"})
+    assert sorted(filtered.ids) == ["a.pdf_0", "a.pdf_1", "a.pdf_2"]
+
+    assert sharded.drop_shard("a.pdf")
+    assert sharded.shard_keys() == ["b.pdf"]
+    assert sharded.collection.count() == 3
+    assert sorted(sharded.search_many(["pump valve 1"], n_results=6).ids) == ["b.pdf_0", "b.pdf_1", "b.pdf_2"]
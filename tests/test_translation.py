@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import langdetect
+import pytest
+
+from scripts import config
+from scripts.translation import Translator, translate_directory
+from scripts.utils import iter_records, write_jsonl
+
+FRENCH = [
+    "Le rapport annuel présente les résultats financiers de la société pour cette année.",
+    "Les chercheurs ont étudié les effets du climat sur les forêts de montagne.",
+    "La réunion du conseil aura lieu mardi prochain dans la grande salle.",
+    "Nous avons besoin de plus de données avant de prendre une décision finale.",
+    "Le musée est fermé pendant les vacances pour des travaux de rénovation.",
+    "Les étudiants doivent rendre leurs devoirs avant la fin de la semaine.",
+]
+ENGLISH = [
+    "The results of the study are presented in the next section of this report.",
+    "It was not possible to compare the two groups because of the small sample.",
+]
+
+
+class _StubOllama(ThreadingHTTPServer):
+    """Local stand-in for Ollama's /api/chat endpoint that records requests and their concurrency."""
+
+    def __init__(self, delay: float = 0.05):
+        super().__init__(("127.0.0.1", 0), _ChatHandler)
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.requests.append(body)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+        text = body["messages"][-1]["content"]
+        payload = json.dumps({"model": body["model"], "message": {"role": "assistant", "content": f"EN: {text}"},
+                              "done": True}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ChatClient:
+    """Minimal blocking chat client for the stub, with the .invoke(messages) interface of ChatOllama."""
+
+    model = "stub-model"
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def invoke(self, messages):
+        roles = {"human": "user"}
+        body = json.dumps({"model": self.model, "stream": False,
+                           "messages": [{"role": roles.get(role, role), "content": text} for role, text in messages]})
+        request = urllib.request.Request(self.url, body.encode("utf-8"), {"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return SimpleNamespace(content=json.loads(response.read())["message"]["content"])
+
+
+@pytest.fixture
+def stub_llm():
+    server = _StubOllama()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, _ChatClient(f"http://127.0.0.1:{server.server_address[1]}/api/chat")
+    server.shutdown()
+    server.server_close()
+
+
+def test_translate_directory_against_stub_server(tmp_path, monkeypatch, stub_llm):
+    server, llm = stub_llm
+    chunks = tmp_path / "chunks"
+    chunks.mkdir()
+    write_jsonl(str(chunks / "rapport.jsonl"),
+                [{"text": text, "chunk_number": n} for n, text in enumerate(FRENCH + [FRENCH[0], "2023 | 42"])])
+    write_jsonl(str(chunks / "report.jsonl"), [{"text": text, "chunk_number": n} for n, text in enumerate(ENGLISH)])
+    monkeypatch.setattr(config, "TRANSLATED_PATH", str(tmp_path / "output" / "translated"))
+
+    detected = []
+    detect = langdetect.detect
+    monkeypatch.setattr(langdetect, "detect", lambda text: detected.append(text) or detect(text))
+
+    cache_path = str(tmp_path / "translation_cache.sqlite")
+    translator = Translator(llm, cache_path=cache_path, max_workers=2)
+    summary = translate_directory(str(chunks), config.TRANSLATED_PATH, translator)
+    assert summary == {"processed": ["rapport.jsonl", "report.jsonl"], "failed": []}
+
+    # English is caught by the stopword pre-check: no statistical detection, no LLM call
+    sent = [request["messages"][-1]["content"] for request in server.requests]
+    assert not any(text in sample for text in ENGLISH for sample in detected)
+    assert not set(sent) & set(ENGLISH)
+    # Each distinct French text is sent once, never more than max_workers at a time
+    assert sorted(sent) == sorted(FRENCH)
+    assert 1 < server.max_active <= 2
+
+    records = list(iter_records(tmp_path / "output" / "translated" / "rapport.jsonl"))
+    assert [r["translated_text"] for r in records[:len(FRENCH)]] == [f"EN: {text}" for text in FRENCH]
+    assert records[0]["detected_language"] == "French"
+    assert records[-1]["translated_text"] == "2023 | 42"
+    english = list(iter_records(tmp_path / "output" / "translated" / "report.jsonl"))
+    assert [r["translated_text"] for r in english] == ENGLISH
+
+    # A second run is served from the SQLite cache
+    rerun = Translator(llm, cache_path=cache_path, max_workers=2)
+    translate_directory(str(chunks), config.TRANSLATED_PATH, rerun)
+    assert rerun.llm_calls == 0
+    assert len(server.requests) == len(FRENCH)
+    assert rerun.cache.hits == len(FRENCH)